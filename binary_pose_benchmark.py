@@ -0,0 +1,76 @@
+import time
+import numpy as np
+from src.modules import binarypose
+from src.modules.binarypose import PoseNormalizer
+
+# Throughput of the batch binary pose rasterizer (binarypose.rasterize_poses) against the PIL drawing
+# of createBinaryPose (binarypose.draw_pose + conversion to an array, one frame at a time).
+# Person sequences are synthetic: a standing skeleton walking with jitter and missing keypoints,
+# normalized by PoseNormalizer like in data_creator.
+#   pil       - draw_pose per frame, converted to a uint8 array
+#   batch     - rasterize_poses on the whole sequence, (frames, 512, 512) uint8
+#   packed    - rasterize_poses on the whole sequence, (frames, 512, 64) bit-packed
+# Every output is checked to be pixel identical to the PIL images.
+
+num_persons = 8
+num_frames = 300
+missing_rate = 0.15 # probability a keypoint is missing
+noise = 3 # pixels
+
+# joint offsets of a standing person (x, y) relative to the neck, in pixels
+skeleton = np.array([[0, -25], [0, 0], [-20, 0], [-28, 30], [-32, 58], [20, 0], [28, 30], [32, 58],
+                     [-12, 60], [-14, 100], [-15, 140], [12, 60], [14, 100], [15, 140],
+                     [-5, -30], [5, -30], [-10, -27], [10, -27]])
+
+# (frames, 18, 2) normalized keypoints of one walking person
+def create_sequence(rng):
+    position = rng.uniform([100, 100], [400, 300])
+    velocity = rng.uniform(-2, 2, 2)
+    size = rng.uniform(0.5, 2)
+    person = np.full((num_frames, 18, 3), np.nan, dtype=np.float32)
+    for frame in range(num_frames):
+        position += velocity
+        joints = position + skeleton * size + rng.normal(0, noise, skeleton.shape)
+        detected = rng.random(18) >= missing_rate
+        person[frame, detected, 0:2] = np.trunc(joints[detected])
+        person[frame, detected, 2] = 0.8
+
+    normalizer = PoseNormalizer()
+    normalized = np.full((num_frames, 18, 2), np.nan)
+    for frame in range(num_frames):
+        kp = normalizer.normalize(person[frame])
+        if kp is not None:
+            normalized[frame] = kp
+    return normalized
+
+def pil_images(normalized):
+    return np.array([np.array(binarypose.draw_pose(kp), dtype=np.uint8) for kp in normalized])
+
+rng = np.random.default_rng(12)
+sequences = [create_sequence(rng) for _ in range(num_persons)]
+binarypose.rasterize_poses(sequences[0][:1]) # warm up (ellipse stamps)
+
+elapsed = {'pil': 0, 'batch': 0, 'packed': 0}
+identical = True
+for normalized in sequences:
+    start = time.perf_counter()
+    reference = pil_images(normalized)
+    elapsed['pil'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    images = binarypose.rasterize_poses(normalized)
+    elapsed['batch'] += time.perf_counter() - start
+
+    start = time.perf_counter()
+    packed = binarypose.rasterize_poses(normalized, packed=True)
+    elapsed['packed'] += time.perf_counter() - start
+
+    identical &= np.array_equal(images, reference) and np.array_equal(np.unpackbits(packed, axis=-1), reference)
+
+total_frames = num_persons * num_frames
+print(f"{num_persons} persons x {num_frames} frames, {missing_rate:.0%} missing keypoints")
+print(f"{'path':>7} {'ms/frame':>9} {'frames/s':>9} {'speedup':>8} {'KB/frame':>9}")
+for name, size in [('pil', binarypose.image_width ** 2), ('batch', binarypose.image_width ** 2), ('packed', binarypose.image_width ** 2 // 8)]:
+    ms = elapsed[name] * 1000 / total_frames
+    print(f"{name:>7} {ms:>9.3f} {total_frames / elapsed[name]:>9.0f} {elapsed['pil'] / elapsed[name]:>7.2f}x {size / 1024:>9.0f}")
+print("pixel identical to PIL:", identical)
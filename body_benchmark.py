@@ -0,0 +1,238 @@
+import time
+import math
+import cv2
+import numpy as np
+import glob
+from src.body import score_limb, assemble_subset
+
+# Micro-benchmark of the Body post-processing on crowded synthetic heatmaps.
+# Compares the vectorized limb scorer and the lookup-table person assembly against
+# the original nested-loop versions and checks that both produce identical output.
+# No recorded candidate sets are shipped, so by default only the synthetic crowds and random connection sets are checked.
+# Candidate sets recorded from real frames (the connection_all, special_k and candidate of Body._connect)
+# can be checked too: save them with
+#   np.savez(path, candidate=candidate, connection_all=np.array(connection_all, dtype=object), special_k=special_k)
+# under bench_candidates/.
+
+image_size = 512
+num_persons = 6
+num_runs = 20
+thre2 = 0.05
+mid_num = 10
+recorded_sets = glob.glob('bench_candidates/*.npz')
+
+limbSeq = [[2, 3], [2, 6], [3, 4], [4, 5], [6, 7], [7, 8], [2, 9], [9, 10], \
+           [10, 11], [2, 12], [12, 13], [13, 14], [2, 1], [1, 15], [15, 17], \
+           [1, 16], [16, 18], [3, 17], [6, 18]]
+mapIdx = [[31, 32], [39, 40], [33, 34], [35, 36], [41, 42], [43, 44], [19, 20], [21, 22], \
+          [23, 24], [25, 26], [27, 28], [29, 30], [47, 48], [49, 50], [53, 54], [51, 52], \
+          [55, 56], [37, 38], [45, 46]]
+
+# joint offsets of a standing person (x, y) relative to the neck, in pixels
+skeleton = np.array([[0, -25], [0, 0], [-20, 0], [-28, 30], [-32, 58], [20, 0], [28, 30], [32, 58],
+                     [-12, 60], [-14, 100], [-15, 140], [12, 60], [14, 100], [15, 140],
+                     [-5, -30], [5, -30], [-10, -27], [10, -27]])
+
+# original nested-loop connection scoring of Body.__call__
+def score_limb_loop(candA, candB, score_mid, image_height, thre2, mid_num=10):
+    nA = len(candA)
+    nB = len(candB)
+    connection_candidate = []
+    for i in range(nA):
+        for j in range(nB):
+            vec = np.subtract(candB[j][:2], candA[i][:2])
+            norm = math.sqrt(vec[0] * vec[0] + vec[1] * vec[1])
+            norm = max(0.001, norm)
+            vec = np.divide(vec, norm)
+
+            startend = list(zip(np.linspace(candA[i][0], candB[j][0], num=mid_num), \
+                                np.linspace(candA[i][1], candB[j][1], num=mid_num)))
+
+            vec_x = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 0] \
+                              for I in range(len(startend))])
+            vec_y = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 1] \
+                              for I in range(len(startend))])
+
+            score_midpts = np.multiply(vec_x, vec[0]) + np.multiply(vec_y, vec[1])
+            score_with_dist_prior = sum(score_midpts) / len(score_midpts) + min(
+                0.5 * image_height / norm - 1, 0)
+            criterion1 = len(np.nonzero(score_midpts > thre2)[0]) > 0.8 * len(score_midpts)
+            criterion2 = score_with_dist_prior > 0
+            if criterion1 and criterion2:
+                connection_candidate.append(
+                    [i, j, score_with_dist_prior, score_with_dist_prior + candA[i][2] + candB[j][2]])
+
+    connection_candidate = sorted(connection_candidate, key=lambda x: x[2], reverse=True)
+    connection = np.zeros((0, 5))
+    for c in range(len(connection_candidate)):
+        i, j, s = connection_candidate[c][0:3]
+        if (i not in connection[:, 3] and j not in connection[:, 4]):
+            connection = np.vstack([connection, [candA[i][3], candB[j][3], s, i, j]])
+            if (len(connection) >= min(nA, nB)):
+                break
+    return connection
+
+# original person assembly of Body.__call__
+def assemble_subset_loop(connection_all, special_k, candidate):
+    subset = -1 * np.ones((0, 20))
+    for k in range(len(mapIdx)):
+        if k not in special_k:
+            partAs = connection_all[k][:, 0]
+            partBs = connection_all[k][:, 1]
+            indexA, indexB = np.array(limbSeq[k]) - 1
+
+            for i in range(len(connection_all[k])):  # = 1:size(temp,1)
+                found = 0
+                subset_idx = [-1, -1]
+                for j in range(len(subset)):  # 1:size(subset,1):
+                    if subset[j][indexA] == partAs[i] or subset[j][indexB] == partBs[i]:
+                        subset_idx[found] = j
+                        found += 1
+
+                if found == 1:
+                    j = subset_idx[0]
+                    if subset[j][indexB] != partBs[i]:
+                        subset[j][indexB] = partBs[i]
+                        subset[j][-1] += 1
+                        subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+                elif found == 2:  # if found 2 and disjoint, merge them
+                    j1, j2 = subset_idx
+                    membership = ((subset[j1] >= 0).astype(int) + (subset[j2] >= 0).astype(int))[:-2]
+                    if len(np.nonzero(membership == 2)[0]) == 0:  # merge
+                        subset[j1][:-2] += (subset[j2][:-2] + 1)
+                        subset[j1][-2:] += subset[j2][-2:]
+                        subset[j1][-2] += connection_all[k][i][2]
+                        subset = np.delete(subset, j2, 0)
+                    else:  # as like found == 1
+                        subset[j1][indexB] = partBs[i]
+                        subset[j1][-1] += 1
+                        subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
+
+                # if find no partA in the subset, create a new subset
+                elif not found and k < 17:
+                    row = -1 * np.ones(20)
+                    row[indexA] = partAs[i]
+                    row[indexB] = partBs[i]
+                    row[-1] = 2
+                    row[-2] = sum(candidate[connection_all[k][i, :2].astype(int), 2]) + connection_all[k][i][2]
+                    subset = np.vstack([subset, row])
+    # delete some rows of subset which has few parts occur
+    deleteIdx = []
+    for i in range(len(subset)):
+        if subset[i][-1] < 4 or subset[i][-2] / subset[i][-1] < 0.4:
+            deleteIdx.append(i)
+    subset = np.delete(subset, deleteIdx, axis=0)
+    return subset
+
+# random crowd: peaks per part (x, y, score, id) and a PAF with every true limb painted in
+def create_crowd(rng, num_persons):
+    joints = []
+    for person in range(num_persons):
+        neck = rng.integers(60, image_size - 160, size=2) + [0, 30]
+        joints.append(neck + skeleton * rng.uniform(0.8, 1.2) + rng.integers(-3, 4, size=skeleton.shape))
+    joints = np.clip(np.array(joints), 0, image_size - 1).astype(int)
+
+    all_peaks = []
+    peak_counter = 0
+    for part in range(18):
+        peaks = [(np.int64(x), np.int64(y), rng.uniform(0.3, 1.0), peak_counter + n) for n, (x, y) in enumerate(joints[:, part])]
+        all_peaks.append(peaks)
+        peak_counter += len(peaks)
+
+    paf = np.zeros((image_size, image_size, 38))
+    for k in range(len(limbSeq)):
+        channels = [x - 19 for x in mapIdx[k]]
+        for person in range(num_persons):
+            a = joints[person, limbSeq[k][0] - 1]
+            b = joints[person, limbSeq[k][1] - 1]
+            vec = (b - a) / max(np.linalg.norm(b - a), 0.001)
+            for c in range(2):
+                layer = np.ascontiguousarray(paf[:, :, channels[c]])
+                cv2.line(layer, (int(a[0]), int(a[1])), (int(b[0]), int(b[1])), float(vec[c]), thickness=5)
+                paf[:, :, channels[c]] = layer
+    paf += rng.normal(0, 0.02, size=paf.shape)
+    return all_peaks, paf
+
+def run_all_limbs(scorer, all_peaks, paf):
+    connection_all = []
+    special_k = []
+    for k in range(len(mapIdx)):
+        score_mid = paf[:, :, mapIdx[k][0] - 19:mapIdx[k][1] - 18]
+        candA = all_peaks[limbSeq[k][0] - 1]
+        candB = all_peaks[limbSeq[k][1] - 1]
+        if len(candA) != 0 and len(candB) != 0:
+            connection_all.append(scorer(candA, candB, score_mid, image_size, thre2, mid_num))
+        else:
+            special_k.append(k)
+            connection_all.append([])
+    return connection_all, special_k
+
+# random one-to-one connections between the peaks of every limb, with whole limbs missing,
+# to reach the merge and overlap branches of the assembly that clean crowds rarely hit
+def random_connections(rng, all_peaks):
+    connection_all = []
+    special_k = []
+    for k in range(len(mapIdx)):
+        candA = all_peaks[limbSeq[k][0] - 1]
+        candB = all_peaks[limbSeq[k][1] - 1]
+        if rng.random() < 0.1:
+            special_k.append(k)
+            connection_all.append([])
+            continue
+        n = min(len(candA), len(candB))
+        pickA = rng.permutation(len(candA))[:n]
+        pickB = rng.permutation(len(candB))[:n]
+        connection = np.zeros((n, 5))
+        for c in range(n):
+            connection[c] = [candA[pickA[c]][3], candB[pickB[c]][3], rng.uniform(0, 1), pickA[c], pickB[c]]
+        connection_all.append(connection)
+    return connection_all, special_k
+
+rng = np.random.default_rng(12)
+crowds = [create_crowd(rng, num_persons) for _ in range(num_runs)]
+
+# correctness of the limb scorer
+assembly_sets = []
+for all_peaks, paf in crowds:
+    expected, special_k = run_all_limbs(score_limb_loop, all_peaks, paf)
+    actual, _ = run_all_limbs(score_limb, all_peaks, paf)
+    for k in range(len(mapIdx)):
+        assert np.array_equal(expected[k], actual[k]), f"connection mismatch on limb {k}"
+    candidate = np.array([item for sublist in all_peaks for item in sublist])
+    assembly_sets.append((actual, special_k, candidate))
+    assembly_sets.append(random_connections(rng, all_peaks) + (candidate,))
+print(f"Connections identical on {num_runs} crowds of {num_persons} persons")
+
+# correctness of the person assembly
+for path in recorded_sets:
+    recorded = np.load(path, allow_pickle=True)
+    assembly_sets.append((list(recorded['connection_all']), list(recorded['special_k']), recorded['candidate']))
+checked = 0
+for connection_all, special_k, candidate in assembly_sets:
+    try:
+        expected = assemble_subset_loop(connection_all, special_k, candidate)
+    except IndexError:
+        # the original assembly cannot handle a connection touching three persons
+        continue
+    actual = assemble_subset(connection_all, special_k, candidate)
+    assert np.array_equal(expected, actual), "subset mismatch"
+    checked += 1
+if recorded_sets:
+    print(f"Subsets identical on {checked} candidate sets ({len(recorded_sets)} recorded)")
+else:
+    print(f"Subsets identical on {checked} synthetic candidate sets (no recorded sets in bench_candidates/, real frames not checked)")
+
+# timing
+for name, scorer in [("nested loop", score_limb_loop), ("vectorized", score_limb)]:
+    start = time.perf_counter()
+    for all_peaks, paf in crowds:
+        run_all_limbs(scorer, all_peaks, paf)
+    elapsed = (time.perf_counter() - start) / num_runs
+    print(f"{'connections, ' + name:>27}: {elapsed * 1000:.2f} ms per frame")
+
+for name, assembler in [("nested loop", assemble_subset_loop), ("lookup table", assemble_subset)]:
+    start = time.perf_counter()
+    for connection_all, special_k, candidate in assembly_sets[::2]:
+        assembler(connection_all, special_k, candidate)
+    elapsed = (time.perf_counter() - start) / num_runs
+    print(f"{'assembly, ' + name:>27}: {elapsed * 1000:.2f} ms per frame")
@@ -0,0 +1,95 @@
+import time
+import os
+import re
+import cv2
+import numpy as np
+from src.body import Body
+from src.modules import bodykeypoints
+
+# Speed / accuracy of the body pose model when stopping after fewer CPM stages.
+# Every stage count is run on the same frames and compared with the full 6-stage output:
+#   joint recall    - full-output joints (peaks assigned to a person) with an early-exit joint of the same part within match_radius pixels
+#   joint precision - early-exit joints with a full-output joint of the same part within match_radius pixels
+#   person PCK      - joints of each full-output person found at the same place on its best matching early-exit person
+#   persons         - mean absolute difference of the number of detected persons per frame
+# Frames are resized to 512x512 like in data_creator.
+
+model_path = 'model/body_pose_model.pth'
+dataset_folder = 'raw_dataset/dataset/'
+num_videos = 5
+frames_per_video = 20
+match_radius = 8
+low_res_peaks = False
+
+def natural_sort_key(s):
+    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
+
+# load the first frames_per_video frames of the first num_videos videos
+def load_frames():
+    frames = []
+    video_folders = sorted(os.listdir(dataset_folder), key=natural_sort_key)[:num_videos]
+    for video in video_folders:
+        video_folder = os.path.join(dataset_folder, video)
+        image_files = sorted([f for f in os.listdir(video_folder) if f.endswith('.jpg')], key=natural_sort_key)
+        for image_file in image_files[:frames_per_video]:
+            frames.append(cv2.resize(cv2.imread(os.path.join(video_folder, image_file)), (512, 512)))
+    return frames
+
+# persons of a Body output as a (persons, 18, 2) array, NaN for missing joints
+def person_keypoints(candidate, subset):
+    keypoints = np.full((len(subset), 18, 2), np.nan)
+    for n, person in enumerate(subset):
+        for part in range(18):
+            index = int(person[part])
+            if index != -1:
+                keypoints[n, part] = candidate[index, 0:2]
+    return keypoints
+
+# (joints found, joints) of the full-output persons on their best matching early-exit person
+def person_agreement(full_persons, persons):
+    found = 0
+    total = int(np.sum(~np.isnan(full_persons[:, :, 0])))
+    for full_person in full_persons:
+        if len(persons) == 0:
+            break
+        distance = np.linalg.norm(persons - full_person[None], axis=2)
+        close = np.nan_to_num(distance, nan=np.inf) <= match_radius
+        found += int(np.max(np.sum(close, axis=1)))
+    return found, total
+
+frames = load_frames()
+print(f"{len(frames)} frames from {dataset_folder}")
+
+body_estimation = Body(model_path, low_res_peaks=low_res_peaks)
+
+results = {}
+for num_stages in range(1, 7):
+    body_estimation.num_stages = num_stages
+    body_estimation(frames[0]) # warm up
+    outputs = []
+    start = time.perf_counter()
+    for frame in frames:
+        outputs.append(body_estimation(frame))
+    results[num_stages] = (outputs, (time.perf_counter() - start) / len(frames))
+
+full_outputs, full_latency = results[6]
+print(f"{'stages':>6} {'ms/frame':>9} {'speedup':>8} {'recall':>7} {'precision':>9} {'PCK':>6} {'persons':>8}")
+for num_stages, (outputs, latency) in results.items():
+    recall = [0, 0]
+    precision = [0, 0]
+    pck = [0, 0]
+    person_difference = 0
+    for (full_candidate, full_subset), (candidate, subset) in zip(full_outputs, outputs):
+        matched, total = bodykeypoints.matched_joints((full_candidate, full_subset), (candidate, subset), match_radius)
+        recall[0] += matched
+        recall[1] += total
+        matched, total = bodykeypoints.matched_joints((candidate, subset), (full_candidate, full_subset), match_radius)
+        precision[0] += matched
+        precision[1] += total
+        found, total = person_agreement(person_keypoints(full_candidate, full_subset), person_keypoints(candidate, subset))
+        pck[0] += found
+        pck[1] += total
+        person_difference += abs(len(full_subset) - len(subset))
+    print(f"{num_stages:>6} {latency * 1000:>9.1f} {full_latency / latency:>7.2f}x "
+          f"{recall[0] / max(recall[1], 1):>7.3f} {precision[0] / max(precision[1], 1):>9.3f} "
+          f"{pck[0] / max(pck[1], 1):>6.3f} {person_difference / len(frames):>8.2f}")
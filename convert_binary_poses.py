@@ -0,0 +1,30 @@
+import os
+import glob
+import numpy as np
+import cv2
+from src.modules import pose_store
+
+# Creates the bit-packed binary pose store (binary_pose/poses_packed.npy + poses_present.npy, see pose_store)
+# of the persons of created data from their pose_N.png images.
+# Every converted store is read back and checked against the images before the next one.
+
+data_folder = './data/'
+
+pose_folders = sorted(glob.glob(os.path.join(data_folder, '*', 'person_*', 'binary_pose')))
+print(f"{len(pose_folders)} binary pose folders found in {data_folder}")
+
+png_bytes = 0
+store_bytes = 0
+for index, pose_folder in enumerate(pose_folders):
+    pose_store.convert_pose_images(pose_folder)
+    packed, present = pose_store.load_poses(pose_folder)
+    for frame_num in np.nonzero(present)[0]:
+        pose_path = os.path.join(pose_folder, f'pose_{frame_num}.png')
+        if not np.array_equal(np.unpackbits(packed[frame_num], axis=-1), cv2.imread(pose_path, cv2.IMREAD_GRAYSCALE) > 0):
+            raise Exception(f"{pose_folder} store does not match {pose_path}")
+        png_bytes += os.path.getsize(pose_path)
+    store_bytes += os.path.getsize(os.path.join(pose_folder, pose_store.packed_file))
+    print(f'Converting...[{index + 1}/{len(pose_folders)}] {pose_folder}')
+
+if pose_folders:
+    print(f"png: {png_bytes / 1024:.0f} KB, store: {store_bytes / 1024:.0f} KB")
@@ -0,0 +1,31 @@
+import os
+import numpy as np
+import torch
+from src.modules import feature_store
+
+# Creates the hand feature store (data/<video>/hand_features.npy + hand_features_present.npy and
+# data/darknet_black_feature.npy, see feature_store) of created data from the hands_N.pt files of its persons.
+# Every converted store is read back and checked against the feature tensors (float16 rounding) before the next one.
+
+data_folder = './data/'
+
+video_names = sorted(name for name in os.listdir(data_folder) if os.path.isdir(os.path.join(data_folder, name)))
+print(f"{len(video_names)} videos found in {data_folder}")
+
+pt_bytes = 0
+store_bytes = 0
+for index, video_name in enumerate(video_names):
+    num_persons, num_frames = feature_store.convert_feature_tensors(data_folder, video_name)
+    video_folder = os.path.join(data_folder, video_name)
+    features, present = feature_store.load_store(video_folder)
+    for person_id, frame_num in zip(*np.nonzero(present)):
+        feature_path = os.path.join(video_folder, f'person_{person_id}', 'hand_image', f'hands_{frame_num}.pt')
+        feature = torch.load(feature_path, map_location='cpu').detach().reshape(-1).numpy()
+        if not np.allclose(features[person_id, frame_num].astype(np.float32), feature, rtol=1e-3, atol=1e-3):
+            raise Exception(f"{video_folder} store does not match {feature_path}")
+        pt_bytes += os.path.getsize(feature_path)
+    store_bytes += os.path.getsize(os.path.join(video_folder, feature_store.features_file))
+    print(f'Converting...[{index + 1}/{len(video_names)}] {video_folder}: {num_persons} persons, {num_frames} frames')
+
+if video_names:
+    print(f"pt: {pt_bytes / 1024:.0f} KB, store: {store_bytes / 1024:.0f} KB")
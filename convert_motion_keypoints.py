@@ -0,0 +1,29 @@
+import os
+import glob
+import numpy as np
+from src.modules import motion_analysis
+
+# Converts the motion keypoint sequences of created data from the previous text format
+# (motion_keypoints/keypoints_seq.txt) to the binary format read by the datasets (keypoints_seq.npy).
+# Every converted sequence is read back and checked against the text file before the next one.
+
+data_folder = './data/'
+remove_text_files = False # delete keypoints_seq.txt after a successful conversion
+
+text_paths = sorted(glob.glob(os.path.join(data_folder, '*', 'person_*', 'motion_keypoints', motion_analysis.text_sequence_file)))
+print(f"{len(text_paths)} text sequences found in {data_folder}")
+
+text_bytes = 0
+npy_bytes = 0
+for index, text_path in enumerate(text_paths):
+    npy_path = motion_analysis.convert_text_sequence(text_path)
+    if not np.array_equal(motion_analysis.load_sequence(npy_path), motion_analysis.load_sequence(text_path)):
+        raise Exception(f"{npy_path} does not match {text_path}")
+    text_bytes += os.path.getsize(text_path)
+    npy_bytes += os.path.getsize(npy_path)
+    if remove_text_files:
+        os.remove(text_path)
+    print(f'Converting...[{index + 1}/{len(text_paths)}] {npy_path}')
+
+if text_paths:
+    print(f"text: {text_bytes / 1024:.0f} KB, npy: {npy_bytes / 1024:.0f} KB")
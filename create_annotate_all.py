@@ -1,9 +1,11 @@
 import os
+import time
 import torch
 import shutil
 import re
+from concurrent.futures import ProcessPoolExecutor
 import src.modules.data_creator as data_creator
-from src.modules import annotator
+from src.modules import annotator, model_registry
 import numpy as np
 import random
 import os
@@ -20,15 +22,39 @@ torch.backends.cudnn.enabled = False
 
 torch.backends.cudnn.deterministic=True
 
-def create_annotate_all_videos(dataset_folder, data_folder):
+# num_workers: number of videos generated at the same time, each worker process loads its own Body model
+# torch_threads: torch threads of each worker (default: cpu cores / num_workers)
+def create_annotate_all_videos(dataset_folder, data_folder, num_workers=1, torch_threads=None):
     video_names_list = _list_subfolders(dataset_folder)
 
     print("All videos : ", video_names_list)
 
-    for video_name in video_names_list:
-        print("Generating and Annotating data of Video: ", video_name)
-        _create_annotate_video(dataset_folder, data_folder, video_name)
-        print("Data generated and annotated fro video: ", video_name)
+    start = time.perf_counter()
+    if num_workers == 1:
+        video_stats = [_create_annotate_video(dataset_folder, data_folder, video_name) for video_name in video_names_list]
+        model_registry.print_load_stats()
+    else:
+        if torch_threads is None:
+            torch_threads = max(os.cpu_count() // num_workers, 1)
+        with ProcessPoolExecutor(max_workers=num_workers, initializer=_init_worker, initargs=(torch_threads,)) as executor:
+            video_stats = list(executor.map(_create_annotate_video, [dataset_folder] * len(video_names_list), [data_folder] * len(video_names_list), video_names_list))
+
+    _print_throughput(video_stats, time.perf_counter() - start)
+
+def _init_worker(torch_threads):
+    torch.set_num_threads(torch_threads)
+
+# frames/sec of every worker and of the whole run
+# video_stats: list of (worker pid, video name, number of frames, seconds)
+def _print_throughput(video_stats, wall_time):
+    print("Throughput:")
+    for pid in sorted(set(stats[0] for stats in video_stats)):
+        worker_stats = [stats for stats in video_stats if stats[0] == pid]
+        num_frames = sum(stats[2] for stats in worker_stats)
+        seconds = sum(stats[3] for stats in worker_stats)
+        print(f"\tworker {pid}: {len(worker_stats)} videos, {num_frames} frames in {seconds:.1f}s, {num_frames / max(seconds, 1e-9):.2f} frames/sec")
+    num_frames = sum(stats[2] for stats in video_stats)
+    print(f"\ttotal: {len(video_stats)} videos, {num_frames} frames in {wall_time:.1f}s, {num_frames / max(wall_time, 1e-9):.2f} frames/sec")
 
 # Get all video names
 def _list_subfolders(main_folder_path):
@@ -56,17 +82,30 @@ def _list_subfolders(main_folder_path):
 
 
 
+# returns (worker pid, video name, number of frames, seconds)
 def _create_annotate_video(dataset_folder, data_folder, video_name):
+    print("Generating and Annotating data of Video: ", video_name)
+    start = time.perf_counter()
+
     # File names of data:
-    #   -gun: hands_[frame_num].png
-    #   -pose: pose_[frame_num].png
-    #   -motion: keypoints_seq.txt
+    #   -gun: hands_[frame_num].png, or with fused_hand_features the feature store hand_features.npy + hand_features_present.npy
+    #   -pose: pose_[frame_num].png, poses_packed.npy + poses_present.npy (bit-packed store)
+    #   -motion: keypoints_seq.npy
 
     # create:
     #   -hand region images (gun), 
     #   -binary pose image (pose), 
-    #   -preprocessed keypoints text file (motion)
+    #   -preprocessed keypoints sequence file (motion)
     display_animation = False
+    # frames per body estimation forward
+    pose_batch_size = 8
+    # full-frame body estimation every keyframe_interval frames, crops around tracked persons in between
+    keyframe_interval = 1
+    # on-disk pose cache, re-generating the data only runs the body estimation on new or changed frames
+    pose_cache_folder = 'pose_cache/'
+    # hand features computed while creating the data (feature store), hand images only written if save_hand_images
+    fused_hand_features = False
+    save_hand_images = False
     # Path of output video folder
     output_folder = data_folder + video_name + "/"
 
@@ -76,7 +115,8 @@ def _create_annotate_video(dataset_folder, data_folder, video_name):
             if os.path.exists(os.path.join(output_folder, filename)):
                 shutil.rmtree(output_folder, filename)
 
-    data_creator.create_data(dataset_folder, video_name, data_folder, display_animation)
+    num_frames, _ = data_creator.create_data(dataset_folder, video_name, data_folder, display_animation, pose_batch_size, keyframe_interval, pose_cache_folder,
+                                             fused_hand_features=fused_hand_features, save_hand_images=save_hand_images)
 
     # folder where the annotations are stored
     annotation_folder = "raw_dataset/annotations/"
@@ -88,6 +128,9 @@ def _create_annotate_video(dataset_folder, data_folder, video_name):
         # Save video annotation
         annotator.save_video_labels_csv(video_labels, output_folder)
 
+    print("Data generated and annotated fro video: ", video_name)
+    return os.getpid(), video_name, num_frames, time.perf_counter() - start
+
 
 
 
@@ -100,7 +143,12 @@ dataset_folder = 'raw_dataset/dataset/'
 #   -motion: data/[video_label]/[person_id]/motion_keypoints/
 data_folder = f'./data/'
 
-create_annotate_all_videos(dataset_folder, data_folder)
+# videos generated in parallel (worker processes)
+num_workers = 1
+
+# guard so worker processes importing this script do not start generating themselves
+if __name__ == '__main__':
+    create_annotate_all_videos(dataset_folder, data_folder, num_workers)
 
 
 
@@ -8,12 +8,12 @@ from matplotlib.animation import FuncAnimation
 from src.body import Body
 from src import util
 from src.modules import handregion, bodykeypoints, handimage, motion_preprocess
-from src.modules.binarypose import BinaryPose
+from src.modules.binarypose import BinaryPose, PoseNormalizer
 from src.modules.gun_yolo import CustomDarknet53_NoDense
 from src.modules.posecnn import poseCNN
 from src.modules.gun_yolo import CustomDarknet53, GunLSTM, GunLSTM_Optimized, Gun_Optimized
 from src.modules.combined_model import GPM2
-from holocron.models import darknet53
+from src.modules import model_registry, tracker
 import time
 import torch
 from torchvision import transforms
@@ -23,10 +23,7 @@ import random
 
 device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
 
-darknet_model = darknet53(pretrained=True)
-darknet_model = CustomDarknet53_NoDense(darknet_model)
-darknet_model.to(device)
-darknet_model.eval()
+darknet_model = model_registry.get_gun_feature_model()
 
 
 
@@ -43,7 +40,20 @@ video_folder = dataset_folder + video_label
 
 
 # Initialize body estimation model
-body_estimation = Body('model/body_pose_model.pth')
+body_estimation = model_registry.get_body('model/body_pose_model.pth')
+
+# run the body estimation on the full frame every keyframe_interval frames only,
+# the frames in between are estimated on crops around the persons of the previous frame
+keyframe_interval = 1
+
+# keypoints of the persons in the previous frame
+prev_keypoints = None
+
+# keeps the person ids (and their predictions) stable across frames
+person_tracker = tracker.PersonTracker()
+
+# binary pose normalization state of every tracked person
+normalizers = {}
 
 # Specify the folder containing the images/frames
 image_folder = video_folder
@@ -90,18 +100,17 @@ def process_frame(frame_number):
     resized_image_shape = resized_image.shape[:2]
 
     # Body pose estimation
-    candidate, subset = body_estimation(resized_image)
+    global prev_keypoints
+    if frame_number % keyframe_interval != 0 and prev_keypoints is not None:
+        person_boxes = [bodykeypoints.get_person_box(keypoints, resized_image_shape) for keypoints in prev_keypoints[bodykeypoints.is_present(prev_keypoints)]]
+        candidate, subset = body_estimation.roi(resized_image, [box for box in person_boxes if box is not None])
+    else:
+        candidate, subset = body_estimation(resized_image)
 
     # Visualize body pose on the image
     canvas = copy.deepcopy(resized_image)
     canvas = util.draw_bodypose(canvas, candidate, subset)
 
-    # Extract keypoints data (coordinates and confidence scores)
-    keypoints_per_frame = {
-        'frame_number': frame_number,
-        'keypoints': []
-    }
-
     # new_dict = {}
     # # remove from predictions list extra persons
     # for person_id in range(len(subset)):
@@ -110,19 +119,19 @@ def process_frame(frame_number):
 
     # predictions = new_dict # extra persons now removed
 
-    for person_id in range(len(subset)):
+    # extract the keypoints array of every person and arrange them by tracked person id
+    confidence_min = 0.1
+    persons = bodykeypoints.extract_persons(candidate, subset, confidence_min)
+    arranged_persons = person_tracker.update(persons)
+
+    for person_id in sorted(person_tracker.track_ids.tolist()):
         # print("Person ID: ", person_id)
 
-        confidence_min = 0.1
-        # extract keypoints dictionary (person_id,keypoints)
-        keypoints = bodykeypoints.extract_keypoints(person_id, candidate, subset, confidence_min)
+        keypoints = arranged_persons[person_id]
 
         # plot keypoints
         bodykeypoints.plot_keypoints(canvas,keypoints)
 
-        # add keypoints to keypoints_per_frame list
-        keypoints_per_frame['keypoints'].append(keypoints)
-
         # get box coordinates of hand regions
         hand_intersect_threshold = 0.9
         hand_regions = handregion.extract_hand_regions(keypoints, hand_intersect_threshold)
@@ -143,13 +152,10 @@ def process_frame(frame_number):
 
         # generate binary pose image
         binary_folder = ""
-        binary_pose_image, neck_kp = BinaryPose.createBinaryPose(keypoints, frame_number, binary_folder, save=False, return_neck=True)
+        binary_pose_image, neck_kp = BinaryPose.createBinaryPose(keypoints, normalizers.setdefault(person_id, PoseNormalizer()), frame_number, binary_folder, save=False, return_neck=True)
         
         if hand_region_image is not None and binary_pose_image is not None:
             # gen list of hand tensors
-            global darknet_model
-            darknet_model.to(device)
-            darknet_model.eval()
             if hand_region_image is not None:
                 # cv2.imshow("hand region image", hand_region_image)
 
@@ -234,23 +240,8 @@ def process_frame(frame_number):
             checkpoint_path = '/model/GPM2.pt'
             checkpoint_path = current_directory + checkpoint_path
 
-            checkpoint = torch.load(checkpoint_path) 
-            # value_to_change = checkpoint.pop('last.weight')
-            # checkpoint['dense.weight'] = value_to_change
-            # value_to_change = checkpoint.pop('last.bias')
-            # checkpoint['dense.bias'] = value_to_change
-
-            hidden_size = checkpoint['model_info']['hidden_size']
-            lstm_layers = checkpoint['model_info']['lstm_layers']
-
-            # Load Model
-            pose_model = poseCNN()
-            gun_model = GunLSTM_Optimized(hidden_size, lstm_layers)
-            combined_feature_size = 20 + hidden_size #total num of features of 3 model outputs
-            trained_model = GPM2(gun_model, pose_model, combined_feature_size)
-            trained_model.load_state_dict(checkpoint['model_state_dict'])
-            trained_model.to(device)
-            trained_model.eval()
+            # Load Model (only on the first person of the first frame)
+            trained_model, _ = model_registry.get_trained_model(checkpoint_path, model_type='GPM2-opt')
             with torch.no_grad():
                 gun_data = gun_data.to(device)
                 pose_data = pose_data.to(device)
@@ -263,6 +254,8 @@ def process_frame(frame_number):
             predictions[f'{person_id}'] = (neck_kp['x'], neck_kp['y'] - (neck_kp['neck_dist'] / 1.6), "GUN FOUND" if predicted_label == 1 else "NO GUN") # <person_id>: (<x>, <y>, <neck_dist>, <prediction>)
             # input('press enter to continue...')
 
+    prev_keypoints = arranged_persons
+
     return canvas
 
 num_frames = len(image_files)
@@ -323,4 +316,6 @@ ani = FuncAnimation(fig, update, frames=num_frames, repeat=False)
 
 # Display the animation
 plt.show()
+
+model_registry.print_load_stats()
     
@@ -1,7 +1,7 @@
 import pandas as pd
 import torch
 import os
-from src.modules import motion_analysis
+from src.modules import motion_analysis, pose_store
 from yolo.pytorchyolo import models
 import torchvision.transforms as transforms
 from src.modules.posecnn import poseCNN
@@ -11,8 +11,10 @@ from src.modules.custom_dataset import CustomGunDataset
 from src.modules.custom_dataset_gunLSTM import CustomGunLSTMDataset
 from src.modules.custom_dataset_gunLSTM_opt import CustomGunLSTMDataset_opt
 from src.modules.custom_dataset_opt import CustomGunDataset_opt
+from src.modules.custom_dataset_lazy import CustomGunDataset_lazy
+from src.modules.custom_dataset_gunLSTM_lazy import CustomGunLSTMDataset_lazy
 from src.modules.train import train_model
-from torch.utils.data import DataLoader
+from torch.utils.data import DataLoader, Subset
 import torch.optim as optim
 from sklearn.model_selection import train_test_split
 import matplotlib.pyplot as plt
@@ -48,6 +50,9 @@ lstm_layers = 2
 batch_size = 16
 learning_rate = 1e-5
 num_epochs = 60
+# opt models: load samples on demand through an LRU cache of cache_mb instead of holding the dataset in memory
+lazy_loading = False
+cache_mb = 4096
 
 user_input =  0
 model_name = ''
@@ -101,15 +106,19 @@ root_dir = 'data2'
 
 if user_input == '3': 
     # DATASET FOR NEW MODEL
-    custom_dataset = CustomGunLSTMDataset(root_dir=root_dir, window_size = window_size)
+    custom_dataset = CustomGunLSTMDataset(root_dir=root_dir, window_size = window_size, packed_poses = True)
+elif user_input == '4' and lazy_loading: 
+    custom_dataset = CustomGunLSTMDataset_lazy(root_dir=root_dir, window_size = window_size, cache_mb = cache_mb, packed_poses = True)
 elif user_input == '4': 
     # DATASET FOR NEW MODEL optimized
-    custom_dataset = CustomGunLSTMDataset_opt(root_dir=root_dir, window_size = window_size)
+    custom_dataset = CustomGunLSTMDataset_opt(root_dir=root_dir, window_size = window_size, packed_poses = True)
+elif (user_input == '5' or user_input == '6') and lazy_loading: 
+    custom_dataset = CustomGunDataset_lazy(root_dir=root_dir, window_size = window_size, cache_mb = cache_mb, packed_poses = True)
 elif user_input == '5' or user_input == '6': 
     # DATASET FOR old model optimized
-    custom_dataset = CustomGunDataset_opt(root_dir=root_dir, window_size = window_size)
+    custom_dataset = CustomGunDataset_opt(root_dir=root_dir, window_size = window_size, packed_poses = True)
 else:    
-    custom_dataset = CustomGunDataset(root_dir=root_dir, window_size = window_size)
+    custom_dataset = CustomGunDataset(root_dir=root_dir, window_size = window_size, packed_poses = True)
 
 print ("Number of samples in dataset: ", len(custom_dataset))
 
@@ -135,36 +144,58 @@ print ("Number of label 1: ", label_1)
 
 
 # Split the dataset into training and validation sets
-train_dataset, val_dataset = train_test_split(custom_dataset, test_size=0.2, random_state=42)
+if lazy_loading:
+    # split the sample indices, splitting the dataset itself would load every sample
+    train_indices, val_indices = train_test_split(list(range(len(custom_dataset))), test_size=0.2, random_state=42)
+    train_dataset, val_dataset = Subset(custom_dataset, train_indices), Subset(custom_dataset, val_indices)
+else:
+    train_dataset, val_dataset = train_test_split(custom_dataset, test_size=0.2, random_state=42)
 
 
 # Count labels in train and validation datasets
 train_label_0, train_label_1 = 0, 0
 val_label_0, val_label_1 = 0, 0
 
-# Iterate over the training dataset
-for data_entry in train_dataset:
-    label = data_entry[-1].item()
-    if label == 0:
-        train_label_0 += 1
-    elif label == 1:
-        train_label_1 += 1
-
-# Iterate over the validation dataset
-for data_entry in val_dataset:
-    label = data_entry[-1].item()
-    if label == 0:
-        val_label_0 += 1
-    elif label == 1:
-        val_label_1 += 1
+if lazy_loading:
+    # labels of the data entries, iterating the subsets would load every sample
+    for index in train_indices:
+        label = custom_dataset.data[index]["label"]
+        if label == '0':
+            train_label_0 += 1
+        elif label == '1':
+            train_label_1 += 1
+
+    for index in val_indices:
+        label = custom_dataset.data[index]["label"]
+        if label == '0':
+            val_label_0 += 1
+        elif label == '1':
+            val_label_1 += 1
+else:
+    # Iterate over the training dataset
+    for data_entry in train_dataset:
+        label = data_entry[-1].item()
+        if label == 0:
+            train_label_0 += 1
+        elif label == 1:
+            train_label_1 += 1
+
+    # Iterate over the validation dataset
+    for data_entry in val_dataset:
+        label = data_entry[-1].item()
+        if label == 0:
+            val_label_0 += 1
+        elif label == 1:
+            val_label_1 += 1
 
 # Print the count of data points and labels in train and validation sets
 print("Training Set: Total Data Points =", len(train_dataset), "Label 0 =", train_label_0, "Label 1 =", train_label_1)
 print("Validation Set: Total Data Points =", len(val_dataset), "Label 0 =", val_label_0, "Label 1 =", val_label_1)
 
 
-train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
-val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False)
+# the binary poses are kept bit-packed by the datasets and expanded per batch
+train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, collate_fn=pose_store.collate_packed_poses)
+val_loader = DataLoader(val_dataset, batch_size=batch_size, shuffle=False, collate_fn=pose_store.collate_packed_poses)
 
 criterion = torch.nn.CrossEntropyLoss()
 optimizer = optim.Adam(combined_model.parameters(), lr=learning_rate)
@@ -210,7 +241,7 @@ run_number, trained_model, train_losses, val_losses = train_model(
 
 # Look into incorrect predictions
 incorrect_predictions = []
-video_loader = DataLoader(val_dataset)
+video_loader = DataLoader(val_dataset, collate_fn=pose_store.collate_packed_poses)
 trained_model.eval()
 with torch.no_grad():
     for video in video_loader:
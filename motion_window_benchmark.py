@@ -0,0 +1,90 @@
+import os
+import time
+import tempfile
+import numpy as np
+import torch
+from src.modules import motion_analysis
+
+# Memory and latency of building the motion keypoint windows of one person sequence.
+# The sequence is synthetic (normalized keypoints with missing keypoints / frames like motion_preprocess writes)
+# and stored both in the previous text format and as .npy.
+#   load_data   - all (num_windows, window, 36) windows of a sequence
+#                 loops: previous nested loops re-parsing every line window_size times, one tensor copy
+#                 views: motion_analysis.load_data, unfold view of one parsed copy of the sequence
+#   per frame   - the window ending at every frame, like the datasets
+#                 copies: one tensor per frame (get_one_sequence on the .npy sequence)
+#                 views: motion_analysis.sequence_windows(pad=True), one padded copy of the sequence
+#   MotionLSTM  - output of every frame: one forward per window vs MotionLSTM.sequence_features
+# Every result is checked to be equal to the previous implementation.
+
+num_frames = 2000
+window_sizes = [3, 4, 8, 16, 32]
+batch_size = 256
+
+# previous motion_analysis.load_data
+def load_data_loops(file_path, window_size):
+    data = []
+    with open(file_path, 'r') as file:
+        lines = file.readlines()
+        if window_size > len(lines):
+            raise Exception("Timestep should not be greater than num of samples")
+        for i in range(window_size, len(lines) + 1):
+            sequence = []
+            for j in range(i - window_size, i):
+                line = lines[j].strip().split(',')
+                sequence.append([float(val) for val in line])
+            data.append(sequence)
+    data = np.array(data)
+    data = torch.tensor(data, dtype=torch.float32)
+    return data
+
+def create_sequence(rng):
+    sequence = rng.normal(0, 1, (num_frames, 36)).astype(np.float32)
+    sequence[rng.random((num_frames, 36)) < 0.1] = 999
+    sequence[rng.random(num_frames) < 0.05] = 0
+    return sequence
+
+# bytes of the storages behind the tensors (shared storages counted once)
+def storage_bytes(tensors):
+    storages = {tensor.untyped_storage().data_ptr(): tensor.untyped_storage().nbytes() for tensor in tensors}
+    return sum(storages.values())
+
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return result, (time.perf_counter() - start) * 1000
+
+folder = tempfile.mkdtemp()
+text_path = os.path.join(folder, motion_analysis.text_sequence_file)
+sequence = create_sequence(np.random.default_rng(12))
+with open(text_path, 'w') as text_file:
+    for keypoint_set in sequence:
+        text_file.write(','.join('{}'.format(value) for value in keypoint_set.tolist()) + '\n')
+npy_path = motion_analysis.convert_text_sequence(text_path)
+model = motion_analysis.MotionLSTM().eval()
+
+equal = True
+print(f"{num_frames} frames, sequence: {sequence.nbytes / 1024:.0f} KB")
+print(f"{'window':>6} | {'load_data loops':>16} {'views (txt)':>12} {'views (npy)':>12} {'MB loops':>9} {'MB views':>9}"
+      f" | {'per frame copies':>17} {'views':>7} {'MB copies':>10} {'MB views':>9} | {'LSTM ms/frame':>13} {'batched':>8}")
+for window_size in window_sizes:
+    reference, loops_ms = timed(load_data_loops, text_path, window_size)
+    text_windows, text_ms = timed(motion_analysis.load_data, text_path, window_size)
+    windows, npy_ms = timed(motion_analysis.load_data, npy_path, window_size)
+    equal &= torch.equal(reference, text_windows) and torch.equal(reference, windows)
+
+    mapped = motion_analysis.load_sequence(npy_path)
+    copies, copies_ms = timed(lambda: [motion_analysis.get_one_sequence(npy_path, frame_num, window_size) for frame_num in range(num_frames)])
+    frame_windows, views_ms = timed(motion_analysis.sequence_windows, mapped, window_size, True)
+    equal &= all(torch.equal(copy, window) for copy, window in zip(copies, frame_windows))
+
+    with torch.no_grad():
+        outputs, forward_ms = timed(lambda: torch.cat([model(window[None]) for window in copies]))
+    features, batched_ms = timed(model.sequence_features, mapped, window_size, batch_size)
+    equal &= torch.allclose(outputs, features, atol=1e-6)
+
+    print(f"{window_size:>6} | {loops_ms:>14.1f}ms {text_ms:>10.1f}ms {npy_ms:>10.1f}ms"
+          f" {reference.nbytes / 2**20:>9.2f} {storage_bytes([windows]) / 2**20:>9.2f}"
+          f" | {copies_ms:>15.1f}ms {views_ms:>5.1f}ms {storage_bytes(copies) / 2**20:>10.2f} {storage_bytes(list(frame_windows)) / 2**20:>9.2f}"
+          f" | {forward_ms / num_frames:>13.3f} {batched_ms / num_frames:>8.3f}")
+print("equal to the previous implementation:", equal)
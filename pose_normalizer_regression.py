@@ -0,0 +1,160 @@
+import sys
+import math
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from src.modules.binarypose import PoseNormalizer
+
+# Regression checks of the per-person binary pose normalization (binarypose.PoseNormalizer) on
+# multi-person sequences. The reference is the previous BinaryPose.normalize, whose fallback neck & hip
+# keypoints were class attributes shared by every person:
+#   fallback semantics - a hand-made sequence exercising every fallback gives the expected results
+#   isolated persons   - normalizing the persons of a video frame by frame (one normalizer per person)
+#                        equals the previous normalization run on each person alone
+#   cross-talk         - frames where the previous shared state normalized a person with the neck / hips
+#                        of another person (informative, the reason for the per-person state)
+#   threads            - normalizing the persons in parallel threads equals normalizing them in order
+
+num_persons = 6
+num_frames = 400
+absent_rate = 0.1 # probability a person is not in a frame
+missing_rate = 0.3 # probability the neck / a hip of a detected person is missing
+
+# previous BinaryPose.normalize with the fallback keypoints shared by all persons
+class SharedNormalizer(object):
+    prev_x0, prev_y0 = None, None
+    prev_x1, prev_y1 = None, None
+    neck_dist = None
+
+    @classmethod
+    def reset(cls):
+        cls.prev_x0, cls.prev_y0 = None, None
+        cls.prev_x1, cls.prev_y1 = None, None
+        cls.neck_dist = None
+
+    @classmethod
+    def normalize(cls, person):
+        xy = person[:, 0:2].astype(np.float64)
+        neck_kp, left_hip_kp, right_hip_kp = xy[1], xy[8], xy[11]
+        if np.isnan(neck_kp[0]):
+            if cls.prev_x0 is None: return None
+            x0, y0 = cls.prev_x0, cls.prev_y0
+        else:
+            x0, y0 = int(neck_kp[0]), int(neck_kp[1])
+        if np.isnan(left_hip_kp[0]):
+            if not np.isnan(right_hip_kp[0]):
+                x1, y1 = int(right_hip_kp[0]), int(right_hip_kp[1])
+            else:
+                if cls.prev_x1 is None: return None
+                x1, y1 = cls.prev_x1, cls.prev_y1
+        else:
+            x1, y1 = int(left_hip_kp[0]), int(left_hip_kp[1])
+        cls.prev_x0, cls.prev_y0, cls.prev_x1, cls.prev_y1 = x0, y0, x1, y1
+        cls.neck_dist = math.sqrt(pow(x1 - x0, 2) + pow(y1 - y0, 2))
+        return (xy - [x0, y0]) / cls.neck_dist
+
+# joint offsets of a standing person (x, y) relative to the neck, in pixels
+skeleton = np.array([[0, -25], [0, 0], [-20, 0], [-28, 30], [-32, 58], [20, 0], [28, 30], [32, 58],
+                     [-12, 60], [-14, 100], [-15, 140], [12, 60], [14, 100], [15, 140],
+                     [-5, -30], [5, -30], [-10, -27], [10, -27]])
+
+# (frames, persons, 18, 3) keypoints of walking persons, all NaN where a person is not in the frame
+def create_video(rng):
+    positions = rng.uniform([60, 60], [450, 330], (num_persons, 2))
+    velocities = rng.uniform(-2, 2, (num_persons, 2))
+    sizes = rng.uniform(0.5, 2, num_persons)
+    video = np.full((num_frames, num_persons, 18, 3), np.nan, dtype=np.float32)
+    for frame in range(num_frames):
+        positions += velocities
+        for person in range(num_persons):
+            if rng.random() < absent_rate:
+                continue
+            joints = positions[person] + skeleton * sizes[person] + rng.normal(0, 2, skeleton.shape)
+            video[frame, person, :, 0:2] = np.trunc(joints)
+            video[frame, person, :, 2] = 0.8
+            for kp_id in (1, 8, 11):
+                if rng.random() < missing_rate:
+                    video[frame, person, kp_id] = np.nan
+    return video
+
+def present(person):
+    return np.any(~np.isnan(person[:, 0]))
+
+def same(a, b):
+    if a is None or b is None:
+        return a is None and b is None
+    return np.array_equal(a, b, equal_nan=True)
+
+# normalized keypoints (or None) of every frame of one person with its own normalizer
+def normalize_person(sequence):
+    normalizer = PoseNormalizer()
+    return [normalizer.normalize(person) if present(person) else None for person in sequence]
+
+def check_fallbacks():
+    def person(neck=None, left_hip=None, right_hip=None):
+        keypoints = np.full((18, 3), np.nan, dtype=np.float32)
+        keypoints[0] = (100, 50, 0.8)
+        for kp_id, xy in ((1, neck), (8, left_hip), (11, right_hip)):
+            if xy is not None:
+                keypoints[kp_id] = xy + (0.8,)
+        return keypoints
+
+    normalizer = PoseNormalizer()
+    results = [
+        normalizer.normalize(person(left_hip=(90, 160))), # no neck yet
+        normalizer.normalize(person(neck=(100, 60), left_hip=(100, 160))), # neck & left hip
+        normalizer.normalize(person(right_hip=(130, 120))), # previous neck, right hip
+        normalizer.normalize(person(neck=(70, 40))), # previous hip
+    ]
+    # (neck, hip) each frame is normalized with
+    expected = [None, ((100, 60), (100, 160)), ((100, 60), (130, 120)), ((70, 40), (130, 120))]
+    ok = results[0] is None
+    for result, ((x0, y0), (x1, y1)) in zip(results[1:], expected[1:]):
+        neck_dist = math.hypot(x1 - x0, y1 - y0)
+        ok &= result is not None and np.allclose(result[0], [(100 - x0) / neck_dist, (50 - y0) / neck_dist])
+    return ok
+
+rng = np.random.default_rng(12)
+video = create_video(rng)
+failures = 0
+
+ok = check_fallbacks()
+failures += not ok
+print(f"fallback semantics: {'ok' if ok else 'FAILED'}")
+
+# frame by frame over all persons, like data_creator
+normalizers = {}
+interleaved = [[None] * num_persons for _ in range(num_frames)]
+SharedNormalizer.reset()
+shared = [[None] * num_persons for _ in range(num_frames)]
+for frame in range(num_frames):
+    for person_id in range(num_persons):
+        if present(video[frame, person_id]):
+            interleaved[frame][person_id] = normalizers.setdefault(person_id, PoseNormalizer()).normalize(video[frame, person_id])
+            shared[frame][person_id] = SharedNormalizer.normalize(video[frame, person_id])
+
+# each person alone with the previous normalization
+isolated = [[None] * num_persons for _ in range(num_frames)]
+for person_id in range(num_persons):
+    SharedNormalizer.reset()
+    for frame in range(num_frames):
+        if present(video[frame, person_id]):
+            isolated[frame][person_id] = SharedNormalizer.normalize(video[frame, person_id])
+
+num_normalized = sum(result is not None for results in isolated for result in results)
+mismatches = sum(not same(a, b) for x, y in zip(interleaved, isolated) for a, b in zip(x, y))
+failures += mismatches > 0
+print(f"isolated persons: {mismatches} mismatches in {num_normalized} normalized poses {'(ok)' if mismatches == 0 else '(FAILED)'}")
+
+cross_talk = sum(not same(a, b) for x, y in zip(shared, isolated) for a, b in zip(x, y))
+print(f"cross-talk of the shared state: {cross_talk} of {num_normalized} poses normalized with another person's keypoints")
+
+# persons normalized in parallel threads
+with ThreadPoolExecutor(max_workers=num_persons) as executor:
+    parallel = list(executor.map(normalize_person, [video[:, person_id] for person_id in range(num_persons)]))
+mismatches = sum(not same(parallel[person_id][frame], interleaved[frame][person_id])
+                 for person_id in range(num_persons) for frame in range(num_frames))
+failures += mismatches > 0
+print(f"threads: {mismatches} mismatches {'(ok)' if mismatches == 0 else '(FAILED)'}")
+
+print("PASSED" if failures == 0 else f"{failures} checks FAILED")
+sys.exit(1 if failures else 0)
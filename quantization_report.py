@@ -0,0 +1,102 @@
+import time
+import os
+import numpy as np
+import torch
+from torch.utils.data import DataLoader, Subset
+from src.modules import model_registry, quantization, bodykeypoints
+from src.modules.custom_dataset import CustomGunDataset
+from src.modules.custom_dataset_gunLSTM import CustomGunLSTMDataset
+from src.modules.custom_dataset_gunLSTM_opt import CustomGunLSTMDataset_opt
+from src.modules.custom_dataset_opt import CustomGunDataset_opt
+
+# Accuracy delta and latency of the INT8 models against the float models on the CPU.
+# Evaluation frames are taken between the calibration frames of raw_dataset.
+#   Body          - joint recall / precision of the INT8 joints against the float joints (same part within match_radius), persons per frame
+#   Hand          - mean distance of the INT8 hand peaks to the float peaks
+#   darknet53     - cosine similarity of the 1024 hand features
+#   trained model - agreement of the predicted labels and max logit difference on dataset samples
+
+body_model_path = 'model/body_pose_model.pth'
+hand_model_path = 'model/hand_pose_model.pth'
+checkpoint_path = 'model/GPM2.pt'
+model_type = 'GPM2-opt'
+root_dir = 'data'
+num_frames = 32
+num_samples = 200
+match_radius = 8
+
+# milliseconds per call of function over inputs and the outputs
+def timed(function, inputs):
+    function(inputs[0]) # warm up
+    outputs = []
+    start = time.perf_counter()
+    with torch.no_grad():
+        for model_input in inputs:
+            outputs.append(function(model_input))
+    return (time.perf_counter() - start) * 1000 / len(inputs), outputs
+
+def print_latency(name, float_ms, int8_ms):
+    print(f"{name}: float {float_ms:.1f} ms, INT8 {int8_ms:.1f} ms ({float_ms / int8_ms:.2f}x)")
+
+frames = quantization.calibration_frames(num_frames=2 * num_frames)[1::2]
+print(f"{len(frames)} evaluation frames, quantization backend {quantization.backend}")
+
+# Body
+float_ms, float_outputs = timed(model_registry.get_body(body_model_path), frames)
+int8_ms, int8_outputs = timed(model_registry.get_body(body_model_path, quantized=True), frames)
+recall = np.sum([bodykeypoints.matched_joints(f, q, match_radius) for f, q in zip(float_outputs, int8_outputs)], axis=0)
+precision = np.sum([bodykeypoints.matched_joints(q, f, match_radius) for f, q in zip(float_outputs, int8_outputs)], axis=0)
+recall = recall[0] / max(recall[1], 1)
+precision = precision[0] / max(precision[1], 1)
+person_difference = np.mean([abs(len(f[1]) - len(q[1])) for f, q in zip(float_outputs, int8_outputs)])
+print_latency("Body", float_ms, int8_ms)
+print(f"\tjoint recall {recall:.3f}, joint precision {precision:.3f}, person count difference {person_difference:.2f} per frame")
+
+# Hand
+if os.path.isfile(hand_model_path):
+    float_ms, float_outputs = timed(model_registry.get_hand(hand_model_path), frames)
+    int8_ms, int8_outputs = timed(model_registry.get_hand(hand_model_path, quantized=True), frames)
+    distance = np.mean([np.linalg.norm(f - q, axis=1).mean() for f, q in zip(float_outputs, int8_outputs)])
+    print_latency("Hand", float_ms, int8_ms)
+    print(f"\tmean peak distance {distance:.2f} px")
+
+# darknet53 hand features
+hand_images = quantization.calibration_hand_images(frames)
+float_ms, float_outputs = timed(model_registry.get_gun_feature_model(), hand_images)
+int8_ms, int8_outputs = timed(model_registry.get_gun_feature_model(quantized=True), hand_images)
+similarity = torch.nn.functional.cosine_similarity(torch.cat(float_outputs), torch.cat(int8_outputs)).mean().item()
+print_latency("darknet53 features", float_ms, int8_ms)
+print(f"\tmean cosine similarity {similarity:.4f}")
+
+# trained model
+if os.path.isfile(checkpoint_path):
+    window_size = torch.load(checkpoint_path, map_location='cpu')['model_info']['window_size']
+    if model_type == 'GPM2':
+        custom_dataset = CustomGunLSTMDataset(root_dir=root_dir, window_size=window_size)
+    elif model_type == 'GPM2-opt':
+        custom_dataset = CustomGunLSTMDataset_opt(root_dir=root_dir, window_size=window_size)
+    elif model_type in ('GPM', 'GP'):
+        custom_dataset = CustomGunDataset(root_dir=root_dir, window_size=window_size)
+    else:
+        custom_dataset = CustomGunDataset_opt(root_dir=root_dir, window_size=window_size)
+    samples = list(DataLoader(Subset(custom_dataset, range(min(num_samples, len(custom_dataset))))))
+
+    def run(trained_model):
+        def predict(sample):
+            data_name, gun_data, pose_data, motion_data, target_label = sample
+            if model_type == 'GPM' or model_type == 'GPM-opt':
+                return trained_model(gun_data, pose_data, motion_data)
+            return trained_model(gun_data, pose_data)
+        return predict
+
+    float_model, _ = model_registry.get_trained_model(checkpoint_path, model_type)
+    int8_model, _ = model_registry.get_trained_model(checkpoint_path, model_type, quantized=True)
+    float_ms, float_outputs = timed(run(float_model), samples)
+    int8_ms, int8_outputs = timed(run(int8_model), samples)
+    float_outputs = torch.cat(float_outputs)
+    int8_outputs = torch.cat(int8_outputs)
+    agreement = (float_outputs.argmax(dim=1) == int8_outputs.argmax(dim=1)).float().mean().item()
+    print_latency(f"{model_type}", float_ms, int8_ms)
+    print(f"\tlabel agreement {agreement:.3f}, max logit difference {(float_outputs - int8_outputs).abs().max().item():.4f} on {len(samples)} samples")
+
+model_registry.print_load_stats()
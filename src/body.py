@@ -2,14 +2,17 @@ import cv2
 import numpy as np
 import math
 import time
+import threading
 from scipy.ndimage.filters import gaussian_filter
 import matplotlib.pyplot as plt
 import matplotlib
 import torch
+import torch.nn.functional as F
 from torchvision import transforms
 import os
 from src import util
 from src.model import bodypose_model
+from src.modules import pose_cache
 import random
 
 # Set a random seed for reproducibility
@@ -24,8 +27,219 @@ torch.backends.cudnn.enabled = False
 
 torch.backends.cudnn.deterministic=True
 
+# find connection in the specified sequence, center 29 is in the position 15
+limbSeq = [[2, 3], [2, 6], [3, 4], [4, 5], [6, 7], [7, 8], [2, 9], [9, 10], \
+           [10, 11], [2, 12], [12, 13], [13, 14], [2, 1], [1, 15], [15, 17], \
+           [1, 16], [16, 18], [3, 17], [6, 18]]
+# the middle joints heatmap correpondence
+mapIdx = [[31, 32], [39, 40], [33, 34], [35, 36], [41, 42], [43, 44], [19, 20], [21, 22], \
+          [23, 24], [25, 26], [27, 28], [29, 30], [47, 48], [49, 50], [53, 54], [51, 52], \
+          [55, 56], [37, 38], [45, 46]]
+
+# score every (candA, candB) pair of one limb against its PAF and greedily pick connections
+# score_mid is either the (h, w, 2) PAF of the limb or a function sampling it at (xs, ys)
+# returns connection: n*5 array of [id of A, id of B, score, index in candA, index in candB]
+def score_limb(candA, candB, score_mid, image_height, thre2, mid_num=10):
+    candA = np.array(candA)
+    candB = np.array(candB)
+    nA = len(candA)
+    nB = len(candB)
+
+    # all pairs at once, i-major like the nested loop: pair p = i * nB + j
+    pairA = np.repeat(np.arange(nA), nB)
+    pairB = np.tile(np.arange(nB), nA)
+    start = candA[pairA, :2]
+    end = candB[pairB, :2]
+
+    vec = end - start
+    norm = np.sqrt(vec[:, 0] * vec[:, 0] + vec[:, 1] * vec[:, 1])
+    norm = np.maximum(0.001, norm)
+    vec = vec / norm[:, np.newaxis]
+
+    # gather the midpoint samples of every pair with one fancy-indexing call
+    xs = np.linspace(start[:, 0], end[:, 0], num=mid_num, axis=1)
+    ys = np.linspace(start[:, 1], end[:, 1], num=mid_num, axis=1)
+    if callable(score_mid):
+        samples = score_mid(np.rint(xs), np.rint(ys))
+    else:
+        samples = score_mid[np.rint(ys).astype(int), np.rint(xs).astype(int)]  # (pairs, mid_num, 2)
+
+    score_midpts = samples[:, :, 0] * vec[:, 0:1] + samples[:, :, 1] * vec[:, 1:2]
+    # accumulate left to right so the sum matches the per-pair python sum() bit for bit
+    score_sum = np.zeros(len(score_midpts))
+    for I in range(mid_num):
+        score_sum += score_midpts[:, I]
+    score_with_dist_prior = score_sum / mid_num + np.minimum(0.5 * image_height / norm - 1, 0)
+    criterion1 = np.count_nonzero(score_midpts > thre2, axis=1) > 0.8 * mid_num
+    criterion2 = score_with_dist_prior > 0
+    valid = np.nonzero(criterion1 & criterion2)[0]
+
+    # greedy matching from the highest scoring pair, stable for equal scores
+    order = valid[np.argsort(-score_with_dist_prior[valid], kind='stable')]
+    usedA = np.zeros(nA, dtype=bool)
+    usedB = np.zeros(nB, dtype=bool)
+    picked = []
+    for p in order:
+        i, j = pairA[p], pairB[p]
+        if not usedA[i] and not usedB[j]:
+            usedA[i] = True
+            usedB[j] = True
+            picked.append(p)
+            if len(picked) >= min(nA, nB):
+                break
+
+    picked = np.array(picked, dtype=int)
+    connection = np.zeros((len(picked), 5))
+    connection[:, 0] = candA[pairA[picked], 3]
+    connection[:, 1] = candB[pairB[picked], 3]
+    connection[:, 2] = score_with_dist_prior[picked]
+    connection[:, 3] = pairA[picked]
+    connection[:, 4] = pairB[picked]
+    return connection
+
+# sample a stride-8 map at image pixel coordinates (cubic, like the full-resolution upsampling)
+# fx, fy map an image pixel to a low-resolution pixel: x_low = (x + 0.5) * fx - 0.5
+def sample_low_res(map_low, xs, ys, fx, fy):
+    map_x = ((xs + 0.5) * fx - 0.5).astype(np.float32)
+    map_y = ((ys + 0.5) * fy - 0.5).astype(np.float32)
+    return cv2.remap(map_low, map_x, map_y, interpolation=cv2.INTER_CUBIC, borderMode=cv2.BORDER_REPLICATE)
+
+# find the peaks of all parts on the stride-8 heatmaps with one 3x3 max-pool NMS,
+# then refine every peak in a small window at image resolution
+# heatmap_low: (19, h, w) tensor, returns all_peaks in the same layout as the full-resolution search
+def find_low_res_peaks(heatmap_low, image_shape, fx, fy, thre1):
+    pooled = F.max_pool2d(heatmap_low[None, :18], kernel_size=3, stride=1, padding=1)[0]
+    peaks_binary = (heatmap_low[:18] == pooled) & (heatmap_low[:18] > thre1)
+    peaks_binary = peaks_binary.cpu().numpy()
+    heatmap_low = heatmap_low.cpu().numpy()
+
+    # one low resolution cell in image pixels
+    radius_x = int(math.ceil(1 / fx))
+    radius_y = int(math.ceil(1 / fy))
+    offset_x = np.arange(-radius_x, radius_x + 1)
+    offset_y = np.arange(-radius_y, radius_y + 1)
+
+    all_peaks = []
+    peak_counter = 0
+    for part in range(18):
+        v, u = np.nonzero(peaks_binary[part])
+        # window centers in image pixels
+        cx = np.rint((u + 0.5) / fx - 0.5)
+        cy = np.rint((v + 0.5) / fy - 0.5)
+        xs = np.clip(cx[:, None, None] + offset_x[None, None, :], 0, image_shape[1] - 1)
+        ys = np.clip(cy[:, None, None] + offset_y[None, :, None], 0, image_shape[0] - 1)
+        xs, ys = np.broadcast_arrays(xs, ys)
+        peaks = []
+        if len(u) > 0:
+            window = sample_low_res(heatmap_low[part], xs.reshape(len(u), -1), ys.reshape(len(u), -1), fx, fy)
+            best = np.argmax(window, axis=1)
+            rows = np.arange(len(u))
+            px = xs.reshape(len(u), -1)[rows, best].astype(int)
+            py = ys.reshape(len(u), -1)[rows, best].astype(int)
+            score = window[rows, best].astype(np.float64)
+            # same order as np.nonzero on a full-resolution map: by y, then x
+            order = np.lexsort((px, py))
+            peaks = [(px[i], py[i], score[i]) for i in order]
+        peak_id = range(peak_counter, peak_counter + len(peaks))
+        all_peaks.append([peaks[i] + (peak_id[i],) for i in range(len(peak_id))])
+        peak_counter += len(peaks)
+    return all_peaks
+
+# assemble the limb connections into persons
+# rows are preallocated and never moved: a merged row is only marked dead, so the surviving rows keep
+# the order np.delete would give them, and owner[candidate id] lists the rows holding that candidate
+# returns subset: n*20 array, 0-17 is the index in candidate, 18 is the total score, 19 is the total parts
+def assemble_subset(connection_all, special_k, candidate):
+    # last number in each row is the total parts number of that person
+    # the second last number in each row is the score of the overall configuration
+    num_connections = sum(len(connection_all[k]) for k in range(len(mapIdx)) if k not in special_k)
+    subset = -1 * np.ones((num_connections, 20))
+    alive = np.zeros(num_connections, dtype=bool)
+    num_rows = 0
+    owner = [[] for _ in range(len(candidate))]
+
+    # put candidate id into slot index of row j, releasing the id it replaces
+    def set_part(j, index, part_id):
+        old_id = int(subset[j][index])
+        if old_id != -1 and old_id != part_id:
+            owner[old_id].remove(j)
+        if j not in owner[part_id]:
+            owner[part_id].append(j)
+        subset[j][index] = part_id
+
+    for k in range(len(mapIdx)):
+        if k not in special_k:
+            indexA, indexB = np.array(limbSeq[k]) - 1
+
+            for i in range(len(connection_all[k])):
+                partA, partB, score = connection_all[k][i][:3]
+                partA = int(partA)
+                partB = int(partB)
+                subset_idx = sorted(set(owner[partA]) | set(owner[partB]))
+                found = len(subset_idx)
+
+                if found == 1:
+                    j = subset_idx[0]
+                    if subset[j][indexB] != partB:
+                        set_part(j, indexB, partB)
+                        subset[j][-1] += 1
+                        subset[j][-2] += candidate[partB, 2] + score
+                elif found >= 2:  # if found 2 and disjoint, merge them
+                    j1, j2 = subset_idx[:2]
+                    membership = ((subset[j1] >= 0).astype(int) + (subset[j2] >= 0).astype(int))[:-2]
+                    if len(np.nonzero(membership == 2)[0]) == 0:  # merge
+                        for part_id in subset[j2][:-2][subset[j2][:-2] >= 0].astype(int):
+                            owner[part_id].remove(j2)
+                            owner[part_id].append(j1)
+                        subset[j1][:-2] += (subset[j2][:-2] + 1)
+                        subset[j1][-2:] += subset[j2][-2:]
+                        subset[j1][-2] += score
+                        alive[j2] = False
+                    else:  # as like found == 1
+                        set_part(j1, indexB, partB)
+                        subset[j1][-1] += 1
+                        subset[j1][-2] += candidate[partB, 2] + score
+
+                # if find no partA in the subset, create a new subset
+                elif not found and k < 17:
+                    j = num_rows
+                    num_rows += 1
+                    alive[j] = True
+                    set_part(j, indexA, partA)
+                    set_part(j, indexB, partB)
+                    subset[j][-1] = 2
+                    subset[j][-2] = candidate[partA, 2] + candidate[partB, 2] + score
+    subset = subset[alive]
+
+    # delete some rows of subset which has few parts occur
+    keep = (subset[:, -1] >= 4) & ~(subset[:, -2] / np.maximum(subset[:, -1], 1) < 0.4)
+    return subset[keep]
+
 class Body(object):
-    def __init__(self, model_path):
+    # low_res_peaks: find peaks and sample PAFs on the stride-8 network output instead of
+    # upsampling every map to image resolution (a few MB per frame instead of hundreds)
+    # num_stages: number of CPM stages to run (1 - 6), fewer stages are faster but less accurate
+    # cache_folder: keep the results of every frame in an on-disk pose cache (see pose_cache.py)
+    def __init__(self, model_path, low_res_peaks=False, num_stages=6, cache_folder=None):
+        if num_stages not in range(1, 7):
+            raise ValueError(f"num_stages must be between 1 and 6, got {num_stages}")
+        self.low_res_peaks = low_res_peaks
+        self.num_stages = num_stages
+        # set by quantization.quantize_body
+        self.quantized = False
+
+        # scale_search = [0.5, 1.0, 1.5, 2.0]
+        self.scale_search = [0.5]
+        self.boxsize = 368
+        self.stride = 8
+        self.padValue = 128
+        self.thre1 = 0.1
+        self.thre2 = 0.05
+
+        self.cache = pose_cache.PoseCache(cache_folder, model_path) if cache_folder is not None else None
+        # the model and the pose cache (counters, files) are used by one thread at a time, e.g. the pose stage
+        # of data_creator and its roi passes around tracked persons
+        self.lock = threading.RLock()
         self.model = bodypose_model()
         if torch.cuda.is_available():
             self.model = self.model.cuda()
@@ -34,30 +248,168 @@ class Body(object):
         self.model.eval()
 
     def __call__(self, oriImg):
-        # scale_search = [0.5, 1.0, 1.5, 2.0]
-        scale_search = [0.5]
-        boxsize = 368
-        stride = 8
-        padValue = 128
-        thre1 = 0.1
-        thre2 = 0.05
-        multiplier = [x * boxsize / oriImg.shape[0] for x in scale_search]
-        heatmap_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 19))
-        paf_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 38))
+        return self.batch([oriImg])[0]
+
+    # estimate the poses of equally-sized frames with one forward pass per scale
+    # image_height: height of the full frame when the frames are crops of it, so crops are processed
+    # at the resolution of the full frame and limbs are scored like on the full frame
+    # keys: content keys of the frames for the pose cache (e.g. image file hashes), the pixels are hashed by default
+    # returns a list of (candidate, subset), one per frame
+    def batch(self, frames, image_height=None, keys=None):
+        with self.lock:
+            return self._cached_estimate(frames, image_height, keys)
+
+    def _cached_estimate(self, frames, image_height, keys):
+        if self.cache is None:
+            return self._estimate(frames, image_height)
 
-        for m in range(len(multiplier)):
-            scale = multiplier[m]
+        if keys is None:
+            keys = [pose_cache.array_hash(frame) for frame in frames]
+        settings = self._settings(image_height)
+        keys = [self.cache.key(key, settings) for key in keys]
+        results = [self.cache.get(key) for key in keys]
+
+        missing = [n for n in range(len(frames)) if results[n] is None]
+        if len(missing) > 0:
+            estimated = self._estimate([frames[n] for n in missing], image_height)
+            for n, (candidate, subset) in zip(missing, estimated):
+                self.cache.put(keys[n], candidate, subset)
+                results[n] = (candidate, subset)
+        return results
+
+    # everything besides the frame and the weights that changes the estimated poses
+    def _settings(self, image_height):
+        return {'scale_search': self.scale_search, 'boxsize': self.boxsize, 'stride': self.stride, 'padValue': self.padValue,
+                'thre1': self.thre1, 'thre2': self.thre2, 'low_res_peaks': self.low_res_peaks, 'num_stages': self.num_stages,
+                'quantized': self.quantized, 'image_height': image_height}
+
+    def _estimate(self, frames, image_height=None):
+        scale_search = self.scale_search
+        boxsize = self.boxsize
+        stride = self.stride
+        padValue = self.padValue
+        thre1 = self.thre1
+        thre2 = self.thre2
+
+        oriImg = frames[0]
+        for frame in frames:
+            if frame.shape != oriImg.shape:
+                raise ValueError(f"Body.batch needs frames of equal size, got {frame.shape} and {oriImg.shape}")
+        if image_height is None:
+            image_height = oriImg.shape[0]
+        multiplier = [x * boxsize / image_height for x in scale_search]
+
+        outputs = [self._forward(frames, multiplier[m], stride, padValue) for m in range(len(multiplier))]
+
+        results = []
+        for n in range(len(frames)):
+            # outputs of frame n for every scale, kept 4D like a batch of one
+            frame_outputs = [(L1[n:n + 1], L2[n:n + 1], padded_shape, pad) for L1, L2, padded_shape, pad in outputs]
+            if self.low_res_peaks:
+                all_peaks, score_mids = self._low_res_search(frames[n], frame_outputs, stride, thre1)
+            else:
+                all_peaks, score_mids = self._full_res_search(frames[n], frame_outputs, stride, thre1)
+            results.append(self._connect(image_height, all_peaks, score_mids, thre2))
+        return results
+
+    # estimate the poses inside boxes (x_min, y_min, x_max, y_max) of a frame, e.g. around tracked persons
+    # only the person centered in a box is kept, a person already found in another box is skipped
+    # returns (candidate, subset) in frame coordinates like __call__
+    def roi(self, oriImg, boxes):
+        candidate = []
+        subset = []
+        for x_min, y_min, x_max, y_max in boxes:
+            crop_candidate, crop_subset = self.batch([oriImg[y_min:y_max, x_min:x_max]], image_height=oriImg.shape[0])[0]
+            if len(crop_subset) == 0:
+                continue
+
+            # person whose parts are centered in the crop
+            center_distance = []
+            for crop_person in crop_subset:
+                parts = crop_candidate[crop_person[:18][crop_person[:18] >= 0].astype(int), 0:2]
+                parts_center = (parts.min(axis=0) + parts.max(axis=0)) / 2
+                center_distance.append(np.linalg.norm(parts_center - [(x_max - x_min) / 2, (y_max - y_min) / 2]))
+            person = crop_subset[np.argmin(center_distance)].copy()
+            found = person[:18] >= 0
+            person_candidate = crop_candidate[person[:18][found].astype(int)].copy()
+            person_candidate[:, 0] += x_min
+            person_candidate[:, 1] += y_min
+            if self._is_duplicate(candidate, subset, person_candidate, found):
+                continue
+
+            person_candidate[:, 3] = np.arange(len(candidate), len(candidate) + len(person_candidate))
+            person[:18][found] = person_candidate[:, 3]
+            candidate.extend(person_candidate)
+            subset.append(person)
+
+        return np.array(candidate), np.array(subset).reshape(-1, 20)
+
+    # whether the parts of a person lie on the same parts of a person in subset (overlapping boxes)
+    def _is_duplicate(self, candidate, subset, person_candidate, found, max_distance=4):
+        person_parts = np.full((18, 2), np.nan)
+        person_parts[found] = person_candidate[:, 0:2]
+        for other in subset:
+            other_parts = np.full((18, 2), np.nan)
+            other_found = other[:18] >= 0
+            other_parts[other_found] = np.array([candidate[int(index)][0:2] for index in other[:18][other_found]])
+            distance = np.linalg.norm(person_parts - other_parts, axis=1)
+            if np.any(~np.isnan(distance)) and np.nanmean(distance) <= max_distance:
+                return True
+        return False
+
+    # run the network on all frames for one scale
+    # returns the L1 (PAF) and L2 (heatmap) outputs, the shape of the scaled, padded image and the padding
+    def _forward(self, frames, scale, stride, padValue):
+        ims = []
+        for oriImg in frames:
             imageToTest = cv2.resize(oriImg, (0, 0), fx=scale, fy=scale, interpolation=cv2.INTER_CUBIC)
             imageToTest_padded, pad = util.padRightDownCorner(imageToTest, stride, padValue)
             im = np.transpose(np.float32(imageToTest_padded[:, :, :, np.newaxis]), (3, 2, 0, 1)) / 256 - 0.5
-            im = np.ascontiguousarray(im)
-
-            data = torch.from_numpy(im).float()
-            if torch.cuda.is_available():
-                data = data.cuda()
-            # data = data.permute([2, 0, 1]).unsqueeze(0).float()
-            with torch.no_grad():
-                Mconv7_stage6_L1, Mconv7_stage6_L2 = self.model(data)
+            ims.append(im)
+        im = np.ascontiguousarray(np.concatenate(ims, axis=0))
+
+        data = torch.from_numpy(im).float()
+        if torch.cuda.is_available():
+            data = data.cuda()
+        # data = data.permute([2, 0, 1]).unsqueeze(0).float()
+        with torch.no_grad():
+            Mconv7_stage6_L1, Mconv7_stage6_L2 = self.model(data, self.num_stages)
+        return Mconv7_stage6_L1, Mconv7_stage6_L2, imageToTest_padded.shape, pad
+
+    # peaks and PAFs from the stride-8 output, only small windows are evaluated at image resolution
+    def _low_res_search(self, oriImg, outputs, stride, thre1):
+        heatmap_low = None
+        paf_low = None
+        for m in range(len(outputs)):
+            Mconv7_stage6_L1, Mconv7_stage6_L2, padded_shape, pad = outputs[m]
+            if m == 0:
+                # coordinates of every scale are expressed on the grid of the first one
+                scaled_shape = (padded_shape[0] - pad[2], padded_shape[1] - pad[3])
+                grid = Mconv7_stage6_L2.shape[2:]
+                heatmap_low = Mconv7_stage6_L2[0] / len(outputs)
+                paf_low = Mconv7_stage6_L1[0] / len(outputs)
+            else:
+                heatmap_low += F.interpolate(Mconv7_stage6_L2, size=grid, mode='bicubic', align_corners=False)[0] / len(outputs)
+                paf_low += F.interpolate(Mconv7_stage6_L1, size=grid, mode='bicubic', align_corners=False)[0] / len(outputs)
+
+        fx = scaled_shape[1] / (oriImg.shape[1] * stride)
+        fy = scaled_shape[0] / (oriImg.shape[0] * stride)
+        all_peaks = find_low_res_peaks(heatmap_low, oriImg.shape[:2], fx, fy, thre1)
+
+        paf_low = np.ascontiguousarray(np.transpose(paf_low.cpu().numpy(), (1, 2, 0)))
+        def limb_sampler(channels):
+            score_mid = np.ascontiguousarray(paf_low[:, :, channels])
+            return lambda xs, ys: sample_low_res(score_mid, xs, ys, fx, fy).astype(np.float64)
+        score_mids = [limb_sampler([x - 19 for x in mapIdx[k]]) for k in range(len(mapIdx))]
+        return all_peaks, score_mids
+
+    # original search: every map upsampled to image resolution
+    def _full_res_search(self, oriImg, outputs, stride, thre1):
+        heatmap_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 19))
+        paf_avg = np.zeros((oriImg.shape[0], oriImg.shape[1], 38))
+
+        for m in range(len(outputs)):
+            Mconv7_stage6_L1, Mconv7_stage6_L2, padded_shape, pad = outputs[m]
             Mconv7_stage6_L1 = Mconv7_stage6_L1.cpu().numpy()
             Mconv7_stage6_L2 = Mconv7_stage6_L2.cpu().numpy()
 
@@ -65,17 +417,17 @@ class Body(object):
             # heatmap = np.transpose(np.squeeze(net.blobs[output_blobs.keys()[1]].data), (1, 2, 0))  # output 1 is heatmaps
             heatmap = np.transpose(np.squeeze(Mconv7_stage6_L2), (1, 2, 0))  # output 1 is heatmaps
             heatmap = cv2.resize(heatmap, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
-            heatmap = heatmap[:imageToTest_padded.shape[0] - pad[2], :imageToTest_padded.shape[1] - pad[3], :]
+            heatmap = heatmap[:padded_shape[0] - pad[2], :padded_shape[1] - pad[3], :]
             heatmap = cv2.resize(heatmap, (oriImg.shape[1], oriImg.shape[0]), interpolation=cv2.INTER_CUBIC)
 
             # paf = np.transpose(np.squeeze(net.blobs[output_blobs.keys()[0]].data), (1, 2, 0))  # output 0 is PAFs
             paf = np.transpose(np.squeeze(Mconv7_stage6_L1), (1, 2, 0))  # output 0 is PAFs
             paf = cv2.resize(paf, (0, 0), fx=stride, fy=stride, interpolation=cv2.INTER_CUBIC)
-            paf = paf[:imageToTest_padded.shape[0] - pad[2], :imageToTest_padded.shape[1] - pad[3], :]
+            paf = paf[:padded_shape[0] - pad[2], :padded_shape[1] - pad[3], :]
             paf = cv2.resize(paf, (oriImg.shape[1], oriImg.shape[0]), interpolation=cv2.INTER_CUBIC)
 
-            heatmap_avg += heatmap_avg + heatmap / len(multiplier)
-            paf_avg += + paf / len(multiplier)
+            heatmap_avg += heatmap_avg + heatmap / len(outputs)
+            paf_avg += + paf / len(outputs)
 
         all_peaks = []
         peak_counter = 0
@@ -103,118 +455,32 @@ class Body(object):
             all_peaks.append(peaks_with_score_and_id)
             peak_counter += len(peaks)
 
-        # find connection in the specified sequence, center 29 is in the position 15
-        limbSeq = [[2, 3], [2, 6], [3, 4], [4, 5], [6, 7], [7, 8], [2, 9], [9, 10], \
-                   [10, 11], [2, 12], [12, 13], [13, 14], [2, 1], [1, 15], [15, 17], \
-                   [1, 16], [16, 18], [3, 17], [6, 18]]
-        # the middle joints heatmap correpondence
-        mapIdx = [[31, 32], [39, 40], [33, 34], [35, 36], [41, 42], [43, 44], [19, 20], [21, 22], \
-                  [23, 24], [25, 26], [27, 28], [29, 30], [47, 48], [49, 50], [53, 54], [51, 52], \
-                  [55, 56], [37, 38], [45, 46]]
+        # views, the two channels of a limb are adjacent
+        score_mids = [paf_avg[:, :, mapIdx[k][0] - 19:mapIdx[k][1] - 18] for k in range(len(mapIdx))]
+        return all_peaks, score_mids
 
+    # connect the peaks into limbs and assemble persons
+    def _connect(self, image_height, all_peaks, score_mids, thre2):
         connection_all = []
         special_k = []
         mid_num = 10
 
         for k in range(len(mapIdx)):
-            score_mid = paf_avg[:, :, [x - 19 for x in mapIdx[k]]]
+            score_mid = score_mids[k]
             candA = all_peaks[limbSeq[k][0] - 1]
             candB = all_peaks[limbSeq[k][1] - 1]
             nA = len(candA)
             nB = len(candB)
             indexA, indexB = limbSeq[k]
             if (nA != 0 and nB != 0):
-                connection_candidate = []
-                for i in range(nA):
-                    for j in range(nB):
-                        vec = np.subtract(candB[j][:2], candA[i][:2])
-                        norm = math.sqrt(vec[0] * vec[0] + vec[1] * vec[1])
-                        norm = max(0.001, norm)
-                        vec = np.divide(vec, norm)
-
-                        startend = list(zip(np.linspace(candA[i][0], candB[j][0], num=mid_num), \
-                                            np.linspace(candA[i][1], candB[j][1], num=mid_num)))
-
-                        vec_x = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 0] \
-                                          for I in range(len(startend))])
-                        vec_y = np.array([score_mid[int(round(startend[I][1])), int(round(startend[I][0])), 1] \
-                                          for I in range(len(startend))])
-
-                        score_midpts = np.multiply(vec_x, vec[0]) + np.multiply(vec_y, vec[1])
-                        score_with_dist_prior = sum(score_midpts) / len(score_midpts) + min(
-                            0.5 * oriImg.shape[0] / norm - 1, 0)
-                        criterion1 = len(np.nonzero(score_midpts > thre2)[0]) > 0.8 * len(score_midpts)
-                        criterion2 = score_with_dist_prior > 0
-                        if criterion1 and criterion2:
-                            connection_candidate.append(
-                                [i, j, score_with_dist_prior, score_with_dist_prior + candA[i][2] + candB[j][2]])
-
-                connection_candidate = sorted(connection_candidate, key=lambda x: x[2], reverse=True)
-                connection = np.zeros((0, 5))
-                for c in range(len(connection_candidate)):
-                    i, j, s = connection_candidate[c][0:3]
-                    if (i not in connection[:, 3] and j not in connection[:, 4]):
-                        connection = np.vstack([connection, [candA[i][3], candB[j][3], s, i, j]])
-                        if (len(connection) >= min(nA, nB)):
-                            break
-
+                connection = score_limb(candA, candB, score_mid, image_height, thre2, mid_num)
                 connection_all.append(connection)
             else:
                 special_k.append(k)
                 connection_all.append([])
 
-        # last number in each row is the total parts number of that person
-        # the second last number in each row is the score of the overall configuration
-        subset = -1 * np.ones((0, 20))
         candidate = np.array([item for sublist in all_peaks for item in sublist])
-
-        for k in range(len(mapIdx)):
-            if k not in special_k:
-                partAs = connection_all[k][:, 0]
-                partBs = connection_all[k][:, 1]
-                indexA, indexB = np.array(limbSeq[k]) - 1
-
-                for i in range(len(connection_all[k])):  # = 1:size(temp,1)
-                    found = 0
-                    subset_idx = [-1, -1]
-                    for j in range(len(subset)):  # 1:size(subset,1):
-                        if subset[j][indexA] == partAs[i] or subset[j][indexB] == partBs[i]:
-                            subset_idx[found] = j
-                            found += 1
-
-                    if found == 1:
-                        j = subset_idx[0]
-                        if subset[j][indexB] != partBs[i]:
-                            subset[j][indexB] = partBs[i]
-                            subset[j][-1] += 1
-                            subset[j][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
-                    elif found == 2:  # if found 2 and disjoint, merge them
-                        j1, j2 = subset_idx
-                        membership = ((subset[j1] >= 0).astype(int) + (subset[j2] >= 0).astype(int))[:-2]
-                        if len(np.nonzero(membership == 2)[0]) == 0:  # merge
-                            subset[j1][:-2] += (subset[j2][:-2] + 1)
-                            subset[j1][-2:] += subset[j2][-2:]
-                            subset[j1][-2] += connection_all[k][i][2]
-                            subset = np.delete(subset, j2, 0)
-                        else:  # as like found == 1
-                            subset[j1][indexB] = partBs[i]
-                            subset[j1][-1] += 1
-                            subset[j1][-2] += candidate[partBs[i].astype(int), 2] + connection_all[k][i][2]
-
-                    # if find no partA in the subset, create a new subset
-                    elif not found and k < 17:
-                        row = -1 * np.ones(20)
-                        row[indexA] = partAs[i]
-                        row[indexB] = partBs[i]
-                        row[-1] = 2
-                        row[-2] = sum(candidate[connection_all[k][i, :2].astype(int), 2]) + connection_all[k][i][2]
-                        subset = np.vstack([subset, row])
-        # delete some rows of subset which has few parts occur
-        deleteIdx = []
-        for i in range(len(subset)):
-            if subset[i][-1] < 4 or subset[i][-2] / subset[i][-1] < 0.4:
-                deleteIdx.append(i)
-        subset = np.delete(subset, deleteIdx, axis=0)
+        subset = assemble_subset(connection_all, special_k, candidate)
 
         # subset: n*20 array, 0-17 is the index in candidate, 18 is the total score, 19 is the total parts
         # candidate: x, y, score, id
@@ -124,34 +124,21 @@ class bodypose_model(nn.Module):
         self.model6_2 = blocks['block6_2']
 
 
-    def forward(self, x):
+    # num_stages: stop after that many CPM stages (1 - 6) and return its L1 (PAF) and L2 (heatmap) outputs
+    def forward(self, x, num_stages=6):
 
         out1 = self.model0(x)
 
         out1_1 = self.model1_1(out1)
         out1_2 = self.model1_2(out1)
-        out2 = torch.cat([out1_1, out1_2, out1], 1)
-
-        out2_1 = self.model2_1(out2)
-        out2_2 = self.model2_2(out2)
-        out3 = torch.cat([out2_1, out2_2, out1], 1)
-
-        out3_1 = self.model3_1(out3)
-        out3_2 = self.model3_2(out3)
-        out4 = torch.cat([out3_1, out3_2, out1], 1)
-
-        out4_1 = self.model4_1(out4)
-        out4_2 = self.model4_2(out4)
-        out5 = torch.cat([out4_1, out4_2, out1], 1)
-
-        out5_1 = self.model5_1(out5)
-        out5_2 = self.model5_2(out5)
-        out6 = torch.cat([out5_1, out5_2, out1], 1)
 
-        out6_1 = self.model6_1(out6)
-        out6_2 = self.model6_2(out6)
+        # stages 2 - num_stages refine the outputs of the previous stage
+        for stage in range(2, num_stages + 1):
+            out = torch.cat([out1_1, out1_2, out1], 1)
+            out1_1 = getattr(self, 'model%d_1' % stage)(out)
+            out1_2 = getattr(self, 'model%d_2' % stage)(out)
 
-        return out6_1, out6_2
+        return out1_1, out1_2
 
 class handpose_model(nn.Module):
     def __init__(self):
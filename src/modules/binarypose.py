@@ -19,122 +19,295 @@ torch.backends.cudnn.enabled = False
 torch.backends.cudnn.deterministic=True
 
 
-class BinaryPose:
-    prev_x0, prev_y0 = None, None
-    prev_x1, prev_y1 = None, None
-    neck_dist = None
+# binary pose image size and stick figure drawing settings
+image_width = 512
+line_thickness = 4
+scale = image_width * 0.25 # stickman scale
+origin_x = 255
+origin_y = 255 - 0.5*scale
 
-    @classmethod # use BinaryPose.normalize(<keypoints>)
-    def normalize(cls, orig_keypoints, copy=True): # returns normalized pose keypoints (returns none if cannot be normalized) (copies dictionary by default)
-        # print("Normalize Method: ")
-        # print("\tprev x0: " , cls.prev_x0," prev y0: " , cls.prev_y0," prev x1: " , cls.prev_x1," prev y1: " , cls.prev_y1,)
+# keypoint pairs connected by a line of the stick figure
+pose_lines = [
+    (0, 1), # nose to neck
+    (5, 1), (5, 6), (7, 6), # left arm
+    (2, 1), (2, 3), (4, 3), # right arm
+    (8, 1), (8, 9), (10, 9), # left leg
+    (11, 1), (11, 12), (13, 12), # right leg
+    (0, 14), (16, 14), # left face
+    (0, 16), (17, 16), # right face
+]
+
+# draw the stick figure of normalized keypoints ((18, 2), NaN if missing) on a binary PIL image
+def draw_pose(kp):
+    # create image PIL 
+    image = Image.new('1', (image_width, image_width), 0) # binary, size, background
+    
+    # draw object from PIL
+    draw = ImageDraw.Draw(image)
+    
+    # white line
+    line_color = 1
+
+    # custom function to check if keypoint is missing
+    def draw_line(x1,y1,x2,y2):
+        if not (math.isnan(x1) or math.isnan(x2) or math.isnan(y1) or math.isnan(y2)):
+            draw.line(
+                    (origin_x + x1 * scale, origin_y + y1 * scale,
+                    origin_x + x2 * scale, origin_y + y2 * scale), 
+                    fill=line_color, width=line_thickness)
+            draw.ellipse([(origin_x + x1 * scale-3,origin_y + y1 * scale-3),(origin_x + x1 * scale+3,origin_y + y1 * scale+3)], fill=line_color, width=1)
+            draw.ellipse([(origin_x + x2 * scale-3,origin_y + y2 * scale-3),(origin_x + x2 * scale+3,origin_y + y2 * scale+3)], fill=line_color, width=1)
+
+    for kp1, kp2 in pose_lines:
+        draw_line(kp[kp1][0], kp[kp1][1], kp[kp2][0], kp[kp2][1])
+    return image
+
+# Batch version of draw_pose: renders the stick figures of (frames, 18, 2) normalized keypoints in one call.
+# Returns (frames, 512, 512) uint8 images (0 / 1), or (frames, 512, 64) when packed (np.packbits along x,
+# the byte layout of a PIL '1' image). The output is pixel identical to draw_pose: the wide lines are
+# rasterized like PIL does (4-vertex polygon filled scanline by scanline) and the dots are PIL ellipse stamps.
+# frames_per_chunk: frames rasterized at once, bounds the memory of the pixel spans
+def rasterize_poses(normalized_keypoints, packed=False, frames_per_chunk=32):
+    normalized_keypoints = np.asarray(normalized_keypoints, dtype=np.float64).reshape(-1, 18, 2)
+    num_frames = len(normalized_keypoints)
+    if packed:
+        images = np.zeros((num_frames, image_width, image_width // 8), dtype=np.uint8)
+        # unpacked images of a chunk, only the drawn pixels are cleared for the next chunk
+        chunk_images = np.zeros((min(frames_per_chunk, num_frames), image_width, image_width), dtype=np.uint8)
+    else:
+        images = np.zeros((num_frames, image_width, image_width), dtype=np.uint8)
 
-        if copy:
-            kp = copy.deepcopy(orig_keypoints['keypoints']) # copy the keypoints so that orig values won't be affected
+    for start in range(0, num_frames, frames_per_chunk):
+        chunk = normalized_keypoints[start:start + frames_per_chunk]
+        pixels = _span_pixels(*_pose_spans(chunk))
+        if packed:
+            chunk_images.reshape(-1)[pixels] = 1
+            images[start:start + len(chunk)] = np.packbits(chunk_images[:len(chunk)], axis=-1)
+            chunk_images.reshape(-1)[pixels] = 0
         else:
-            kp = orig_keypoints['keypoints']
+            images[start:start + len(chunk)].reshape(-1)[pixels] = 1
+    return images
+
+# PIL's ROUND_UP / ROUND_DOWN macros of draw.c (round half away from / towards zero), keeping the float precision
+def _round_up(f):
+    rounded = np.floor(np.abs(f) + f.dtype.type(0.5))
+    return np.where(f >= 0, rounded, -rounded).astype(np.int64)
+
+def _round_down(f):
+    rounded = np.ceil(np.abs(f) - f.dtype.type(0.5))
+    return np.where(f >= 0, rounded, -rounded).astype(np.int64)
+
+# (frame, y, x_start, x_end) pixel spans of the lines and dots of the stick figures
+def _pose_spans(kp):
+    # image coordinates of the keypoints
+    x = origin_x + kp[:, :, 0] * scale
+    y = origin_y + kp[:, :, 1] * scale
+    found = np.isfinite(x) & np.isfinite(y)
+
+    first = [kp1 for kp1, _ in pose_lines]
+    second = [kp2 for _, kp2 in pose_lines]
+    valid = found[:, first] & found[:, second]
+    frames, line = np.nonzero(valid)
+    x1, y1 = x[:, first][valid], y[:, first][valid]
+    x2, y2 = x[:, second][valid], y[:, second][valid]
+    line_spans = _line_spans(frames, np.trunc(x1).astype(np.int64), np.trunc(y1).astype(np.int64),
+                             np.trunc(x2).astype(np.int64), np.trunc(y2).astype(np.int64))
+
+    # a dot on every end point of a drawn line (drawn once per keypoint, the dots are the same)
+    dotted = np.zeros(found.shape, dtype=bool)
+    dotted[frames, np.array(first)[line]] = True
+    dotted[frames, np.array(second)[line]] = True
+    dot_spans = _dot_spans(np.nonzero(dotted)[0], x[dotted], y[dotted])
+    return [np.concatenate(values) for values in zip(line_spans, dot_spans)]
+
+# spans of PIL wide lines (ImagingDrawWideLine) between integer end points
+def _line_spans(frames, x0, y0, x1, y1):
+    dx = x1 - x0
+    dy = y1 - y0
+
+    # a line of length zero is a single pixel
+    point = (dx == 0) & (dy == 0)
+    point_spans = (frames[point], y0[point], x0[point], x0[point])
+    frames, x0, y0, x1, y1, dx, dy = (a[~point] for a in (frames, x0, y0, x1, y1, dx, dy))
+
+    # the line is a 4-vertex polygon around the segment
+    small_hypotenuse = (line_thickness - 1) / 2.0
+    big_hypotenuse = np.hypot(dx, dy)
+    ratio_max = _round_up(np.float64(small_hypotenuse)) / big_hypotenuse
+    ratio_min = _round_down(np.float64(small_hypotenuse)) / big_hypotenuse
+    dxmin = _round_down(ratio_min * dy)
+    dxmax = _round_down(ratio_max * dy)
+    dymin = _round_down(ratio_min * dx)
+    dymax = _round_down(ratio_max * dx)
+    vertices_x = np.stack([x0 - dxmin, x1 - dxmin, x1 + dxmax, x0 + dxmax], axis=1)
+    vertices_y = np.stack([y0 + dymax, y1 + dymax, y1 - dymin, y0 - dymin], axis=1)
+
+    # edges (vertex i -> vertex i + 1), horizontal edges are drawn directly
+    edge_x0, edge_y0 = vertices_x, vertices_y
+    edge_x1, edge_y1 = np.roll(vertices_x, -1, axis=1), np.roll(vertices_y, -1, axis=1)
+    horizontal = edge_y0 == edge_y1
+    horizontal_spans = (np.repeat(frames, 4)[horizontal.ravel()], edge_y0[horizontal],
+                        np.minimum(edge_x0, edge_x1)[horizontal], np.maximum(edge_x0, edge_x1)[horizontal])
+
+    # scanlines of the polygons (polygon_generic), rows outside the image are skipped
+    edge_ymin = np.where(horizontal, image_width, np.minimum(edge_y0, edge_y1))
+    edge_ymax = np.where(horizontal, -1, np.maximum(edge_y0, edge_y1))
+    edge_dx = (edge_x1 - edge_x0).astype(np.float32) / np.where(horizontal, 1, edge_y1 - edge_y0).astype(np.float32)
+    edges = (edge_ymin, edge_ymax, edge_x0, edge_y0, edge_dx, edge_ymax.max(axis=1))
+
+    # the polygon is convex: a row between two vertex levels crosses exactly two edges (one per side)
+    # and is filled between them, the rows of the vertex levels go through all the crossings
+    levels = np.sort(vertices_y, axis=1)
+    band_start = np.maximum(levels[:, :3] + 1, 0)
+    band_end = np.minimum(levels[:, 1:] - 1, image_width - 1)
+    covering = ~horizontal[:, None, :] & (edge_ymin[:, None, :] <= levels[:, :3, None]) & (edge_ymax[:, None, :] >= levels[:, 1:, None])
+    two_sides = covering.sum(axis=2) == 2
+    first_edge = np.argmax(covering, axis=2)
+    second_edge = 3 - np.argmax(covering[:, :, ::-1], axis=2)
+
+    # rows between the vertex levels
+    band_line, band = np.nonzero(two_sides & (band_end >= band_start))
+    num_rows = band_end[band_line, band] - band_start[band_line, band] + 1
+    row_band = np.repeat(np.arange(len(band_line)), num_rows)
+    y = np.repeat(band_start[band_line, band] - (np.cumsum(num_rows) - num_rows), num_rows) + np.arange(len(row_band))
+    x = []
+    for edge in (first_edge, second_edge):
+        edge = edge[band_line, band]
+        edge_y0_band = edge_y0[band_line, edge][row_band]
+        edge_x0_band = edge_x0[band_line, edge][row_band]
+        x.append((y - edge_y0_band).astype(np.float32) * edge_dx[band_line, edge][row_band] + edge_x0_band.astype(np.float32))
+    polygon_spans = [(frames[band_line][row_band], y, _round_up(np.minimum(*x)), _round_down(np.maximum(*x)))]
+
+    # rows of the vertex levels (and of degenerate polygons)
+    vertex_line, vertex = np.nonzero((levels != np.roll(levels, 1, axis=1)) | (np.arange(4) == 0))
+    vertex_y = levels[vertex_line, vertex]
+    degenerate_line, degenerate = np.nonzero(~two_sides & (band_end >= band_start))
+    num_rows = band_end[degenerate_line, degenerate] - band_start[degenerate_line, degenerate] + 1
+    row_band = np.repeat(np.arange(len(degenerate_line)), num_rows)
+    degenerate_y = np.repeat(band_start[degenerate_line, degenerate] - (np.cumsum(num_rows) - num_rows), num_rows) + np.arange(len(row_band))
+    line_of_row = np.concatenate([vertex_line, degenerate_line[row_band]])
+    y = np.concatenate([vertex_y, degenerate_y])
+    visible = (y >= 0) & (y < image_width)
+    polygon_spans += _polygon_row_spans(frames, edges, line_of_row[visible], y[visible])
+
+    return [np.concatenate(values) for values in zip(point_spans, horizontal_spans, *polygon_spans)]
+
+# spans of rows of the line polygons like polygon_generic of PIL: the x of the edges crossing the row are
+# sorted and filled pairwise, an edge ending on the row is counted twice (except on the last row of the polygon)
+def _polygon_row_spans(frames, edges, line_of_row, y):
+    edge_ymin, edge_ymax, edge_x0, edge_y0, edge_dx, ymax = (values[line_of_row] for values in edges)
+    y_row = y[:, None]
+    crossing = (edge_ymin <= y_row) & (y_row <= edge_ymax)
+    twice = crossing & (y_row == edge_ymax) & (y_row < ymax[:, None])
+    x = (y_row - edge_y0).astype(np.float32) * edge_dx + edge_x0.astype(np.float32)
+    xx = np.full((len(y), 8), np.inf, dtype=np.float32)
+    xx[:, 0:4][crossing] = x[crossing]
+    xx[:, 4:8][twice] = x[twice]
+    xx.sort(axis=1)
+    num_x = crossing.sum(axis=1) + twice.sum(axis=1)
+
+    spans = []
+    for pair in range(1, 8, 2):
+        filled = pair < num_x
+        spans.append((frames[line_of_row[filled]], y[filled], _round_up(xx[filled, pair - 1]), _round_down(xx[filled, pair])))
+    return spans
+
+# rows (dy, x_start, x_end) of a filled PIL ellipse with an integer bounding box of the given size
+_ellipse_stamps = {}
+def _ellipse_stamp(width, height):
+    if (width, height) not in _ellipse_stamps:
+        image = Image.new('1', (width + 3, height + 3), 0)
+        ImageDraw.Draw(image).ellipse([(1, 1), (1 + width, 1 + height)], fill=1, width=1)
+        stamp = np.array(image, dtype=bool)
+        rows = [(row - 1, np.nonzero(stamp[row])[0][0] - 1, np.nonzero(stamp[row])[0][-1] - 1)
+                for row in range(len(stamp)) if stamp[row].any()]
+        _ellipse_stamps[(width, height)] = np.array(rows, dtype=np.int64).reshape(-1, 3)
+    return _ellipse_stamps[(width, height)]
+
+# spans of the dots (ellipse with a 3 pixel radius) around the line end points
+def _dot_spans(frames, x, y):
+    # PIL truncates the float bounding box to integers
+    box_x0, box_y0 = np.trunc(x - 3).astype(np.int64), np.trunc(y - 3).astype(np.int64)
+    box_x1, box_y1 = np.trunc(x + 3).astype(np.int64), np.trunc(y + 3).astype(np.int64)
+    box_size = (box_x1 - box_x0) * 8 + (box_y1 - box_y0)
+    spans = []
+    for size in np.unique(box_size):
+        dots = np.nonzero(box_size == size)[0]
+        stamp = _ellipse_stamp(size // 8, size % 8)
+        dot = np.repeat(dots, len(stamp))
+        row = np.tile(np.arange(len(stamp)), len(dots))
+        spans.append((frames[dot], box_y0[dot] + stamp[row, 0], box_x0[dot] + stamp[row, 1], box_x0[dot] + stamp[row, 2]))
+    return [np.concatenate(values) for values in zip(*spans)] if spans else [np.zeros(0, dtype=np.int64)] * 4
+
+# flat indices (in (frames, 512, 512) images) of the pixels of the spans, clipped to the image
+def _span_pixels(frames, y, x_start, x_end):
+    x_start = np.maximum(x_start, 0)
+    x_end = np.minimum(x_end, image_width - 1)
+    inside = (y >= 0) & (y < image_width) & (x_start <= x_end)
+    frames, y, x_start, x_end = frames[inside], y[inside], x_start[inside], x_end[inside]
+
+    lengths = x_end - x_start + 1
+    first_pixel = (frames * image_width + y) * image_width + x_start
+    return np.repeat(first_pixel - (np.cumsum(lengths) - lengths), lengths) + np.arange(lengths.sum())
+
+
+# Normalization state of one person: the neck & hip keypoints of its previous frame are used when
+# they are missing in the current frame. Use one normalizer per tracked person and video, e.g.
+#   normalizers = {} # person id: PoseNormalizer
+#   kp = normalizers.setdefault(person_id, PoseNormalizer()).normalize(person)
+class PoseNormalizer(object):
+    def __init__(self):
+        self.prev_x0, self.prev_y0 = None, None
+        self.prev_x1, self.prev_y1 = None, None
+        self.neck_dist = None
+
+    # person: (18, 3) keypoints array of one person (see bodykeypoints)
+    # returns the (18, 2) normalized x, y (NaN if not detected), None if it cannot be normalized
+    def normalize(self, person):
+        # print("Normalize Method: ")
+        # print("\tprev x0: " , self.prev_x0," prev y0: " , self.prev_y0," prev x1: " , self.prev_x1," prev y1: " , self.prev_y1,)
+        xy = person[:, 0:2].astype(np.float64)
 
         # Normalize keypoints based on neck & hips
-        neck_kp = kp[1]
-        left_hip_kp = kp[8]
-        right_hip_kp = kp[11]
-        x0, y0 = neck_kp['x'], neck_kp['y']
-        x1, y1 = left_hip_kp['x'], left_hip_kp['y']
-
-        prev = False
-
-        # if x0 is None or x1 is None:
-        #     if cls.prev_x0 is None or cls.prev_x1 is None: return None # IF AT LEAST ONE PREV KEYPOINT IS MISSING DO NOT CREATE IMAGE
-        #     x0, y0 = cls.prev_x0, cls.prev_y0
-        #     x1, y1 = cls.prev_x1, cls.prev_y1
-        #     prev = True
-        
-        if x0 is None:
-            if cls.prev_x0 is None: return None # IF AT LEAST ONE PREV KEYPOINT IS MISSING DO NOT CREATE IMAGE
-            x0, y0 = cls.prev_x0, cls.prev_y0
-            prev = True
-        if x1 is None:
-            if right_hip_kp['x'] is not None:
-                x1, y1 = right_hip_kp['x'], right_hip_kp['y']
+        neck_kp = xy[1]
+        left_hip_kp = xy[8]
+        right_hip_kp = xy[11]
+
+        if np.isnan(neck_kp[0]):
+            if self.prev_x0 is None: return None # IF AT LEAST ONE PREV KEYPOINT IS MISSING DO NOT CREATE IMAGE
+            x0, y0 = self.prev_x0, self.prev_y0
+        else:
+            x0, y0 = int(neck_kp[0]), int(neck_kp[1])
+        if np.isnan(left_hip_kp[0]):
+            if not np.isnan(right_hip_kp[0]):
+                x1, y1 = int(right_hip_kp[0]), int(right_hip_kp[1])
             else:
-                if cls.prev_x1 is None: return None # IF AT LEAST ONE PREV KEYPOINT IS MISSING DO NOT CREATE IMAGE
-                x1, y1 = cls.prev_x1, cls.prev_y1
-                prev = True
-
-        cls.prev_x0 = x0
-        cls.prev_y0 = y0
-        cls.prev_x1 = x1
-        cls.prev_y1 = y1
-
-        cls.neck_dist = math.sqrt(pow(x1 - x0, 2) + pow(y1 - y0, 2))
-        # print("NECK NORMALIZATION", cls.neck_dist)
-
-        for i in kp:
-            if i['x'] is None or i['y'] is None: continue
-            i['x'] = (i['x'] - x0) / cls.neck_dist
-            i['y'] = (i['y'] - y0) / cls.neck_dist
-        
-        return kp
+                if self.prev_x1 is None: return None # IF AT LEAST ONE PREV KEYPOINT IS MISSING DO NOT CREATE IMAGE
+                x1, y1 = self.prev_x1, self.prev_y1
+        else:
+            x1, y1 = int(left_hip_kp[0]), int(left_hip_kp[1])
+
+        self.prev_x0 = x0
+        self.prev_y0 = y0
+        self.prev_x1 = x1
+        self.prev_y1 = y1
+
+        self.neck_dist = math.sqrt(pow(x1 - x0, 2) + pow(y1 - y0, 2))
+        # print("NECK NORMALIZATION", self.neck_dist)
+
+        return (xy - [x0, y0]) / self.neck_dist
 
-    @classmethod
-    def createBinaryPose(cls, orig_keypoints, frame_number, folder_path, save=True, return_neck=False):
-        keypoints = copy.deepcopy(orig_keypoints) 
-        kp = cls.normalize(keypoints, copy=False) # no need to copy because we already copied
+class BinaryPose:
+    # person: (18, 3) keypoints array of one person (see bodykeypoints)
+    # normalizer: PoseNormalizer of the person
+    # writer: pipeline.AsyncWriter the image is saved by, saved immediately if None
+    @staticmethod
+    def createBinaryPose(person, normalizer, frame_number, folder_path, save=True, return_neck=False, writer=None):
+        kp = normalizer.normalize(person)
         
         if kp is None: return None, None
 
-        # create image PIL 
-        image_width = 512
-        image = Image.new('1', (image_width, image_width), 0) # binary, size, background
-        
-        # draw object from PIL
-        draw = ImageDraw.Draw(image)
-        
-        # white line
-        line_color = 1
-        line_thickness = 4
-        
-        # stickman scale
-        # scale = 2 * cls.neck_dist # will experiment more on this
-        scale = image_width * 0.25
-
-        # custom function to check if keypoint is missing
-        def draw_line(x1,y1,x2,y2):
-            if not (x1 is None or x2 is None or y1 is None or y2 is None):
-                origin_x = 255
-                origin_y = 255 - 0.5*scale
-                draw.line(
-                        (origin_x + x1 * scale, origin_y + y1 * scale,
-                        origin_x + x2 * scale, origin_y + y2 * scale), 
-                        fill=line_color, width=line_thickness)
-                draw.ellipse([(origin_x + x1 * scale-3,origin_y + y1 * scale-3),(origin_x + x1 * scale+3,origin_y + y1 * scale+3)], fill=line_color, width=1)
-                draw.ellipse([(origin_x + x2 * scale-3,origin_y + y2 * scale-3),(origin_x + x2 * scale+3,origin_y + y2 * scale+3)], fill=line_color, width=1)
-                
-                
-        # nose to neck
-        draw_line(kp[0]['x'], kp[0]['y'], kp[1]['x'], kp[1]['y']) 
-        # left arm
-        draw_line(kp[5]['x'], kp[5]['y'], kp[1]['x'], kp[1]['y']) 
-        draw_line(kp[5]['x'], kp[5]['y'], kp[6]['x'], kp[6]['y'])
-        draw_line(kp[7]['x'], kp[7]['y'], kp[6]['x'], kp[6]['y'])
-        # right arm
-        draw_line(kp[2]['x'], kp[2]['y'], kp[1]['x'], kp[1]['y'])
-        draw_line(kp[2]['x'], kp[2]['y'], kp[3]['x'], kp[3]['y'])
-        draw_line(kp[4]['x'], kp[4]['y'], kp[3]['x'], kp[3]['y'])
-        # left leg
-        draw_line(kp[8]['x'], kp[8]['y'], kp[1]['x'], kp[1]['y'])
-        draw_line(kp[8]['x'], kp[8]['y'], kp[9]['x'], kp[9]['y'])
-        draw_line(kp[10]['x'], kp[10]['y'], kp[9]['x'], kp[9]['y'])
-        # right leg
-        draw_line(kp[11]['x'], kp[11]['y'], kp[1]['x'], kp[1]['y'])
-        draw_line(kp[11]['x'], kp[11]['y'], kp[12]['x'], kp[12]['y'])
-        draw_line(kp[13]['x'], kp[13]['y'], kp[12]['x'], kp[12]['y'])
-        # left face
-        draw_line(kp[0]['x'], kp[0]['y'], kp[14]['x'], kp[14]['y'])
-        draw_line(kp[16]['x'], kp[16]['y'], kp[14]['x'], kp[14]['y'])
-        # right face
-        draw_line(kp[0]['x'], kp[0]['y'], kp[16]['x'], kp[16]['y'])
-        draw_line(kp[17]['x'], kp[17]['y'], kp[16]['x'], kp[16]['y'])
+        image = draw_pose(kp)
 
         if save:
             # File Path
@@ -145,7 +318,10 @@ class BinaryPose:
                 os.makedirs(folder_path)
 
             # Save Image
-            image.save(file_name)
+            if writer is None:
+                image.save(file_name)
+            else:
+                writer.submit(image.save, file_name)
 
             # Print Log
             print(f'Binary Pose Image Save in: {file_name}')
@@ -155,10 +331,9 @@ class BinaryPose:
         else:
             keypoints = kp # save the normalized pose keypoints
             if return_neck:
-                return image, { 'person_id': keypoints['person_id'],
-                                'x': cls.prev_x0,
-                                'y': cls.prev_y0,
-                                'neck_dist': cls.neck_dist
+                return image, { 'x': normalizer.prev_x0,
+                                'y': normalizer.prev_y0,
+                                'neck_dist': normalizer.neck_dist
                               }
             else:
                 return image, ""
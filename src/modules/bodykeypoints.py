@@ -1,3 +1,4 @@
+import math
 import cv2
 from src.modules import handregion
 import torch
@@ -16,38 +17,91 @@ torch.backends.cudnn.enabled = False
 
 torch.backends.cudnn.deterministic=True
 
-# return keypoints dictionary (person_id,keypoints) for one person and plot keypoints
-def extract_keypoints(person_id, candidate, subset, confidence_min=0):
-    keypoints = {
-            'person_id': person_id,
-            'keypoints': []
-        }
-    for kp_id in range(18):  # 18 keypoints for body
-        index = int(subset[person_id][kp_id])
-        if (not(index == -1)) and candidate[index, 2] >= confidence_min: #if keypoint is detected and confidence score is good, store coordiantes and confidence score
-            x = int(candidate[index, 0])
-            y = int(candidate[index, 1])
-            confidence = candidate[index, 2]
-            keypoints['keypoints'].append({
-                'x': x,
-                'y': y,
-                'confidence': confidence
-            })
-            # Draw keypoints on the image
-            # cv2.circle(canvas, (x, y), 3, (0, 0, 255), -1)  # Red circles for keypoints
-        else: #else, put None coordinates and negative confidence score
-            keypoints['keypoints'].append({
-                'x': None,
-                'y': None,
-                'confidence': -1
-            })
-    return keypoints
+# Keypoints of the persons of a frame are a (persons, 18, 3) float32 array,
+# the last axis is x, y, confidence and all three are NaN for a keypoint that is not detected.
+# A person that is not in the frame (e.g. a tracked person without detection) is all NaN.
+
+# return the keypoints array of all persons of a frame (Body output)
+# keypoints with a confidence score below confidence_min are not detected
+def extract_persons(candidate, subset, confidence_min=0):
+    persons = np.full((len(subset), 18, 3), np.nan, dtype=np.float32)
+    if len(subset) == 0:
+        return persons
+    indices = subset[:, :18].astype(int)
+    values = candidate[indices, 0:3]
+    detected = (indices != -1) & (values[:, :, 2] >= confidence_min)
+    # integer pixel coordinates
+    values[:, :, 0:2] = np.trunc(values[:, :, 0:2])
+    persons[detected] = values[detected]
+    return persons
+
+# body part (0-17) of every peak of a Body candidate array, from the subset slot the peak fills,
+# -1 for the peaks not assigned to a person (candidate[:, 3] is the running peak id, not the part)
+def candidate_parts(candidate, subset):
+    parts = np.full(len(candidate), -1, dtype=np.int64)
+    if len(subset) > 0:
+        indices = subset[:, :18].astype(int)
+        person_ids, part_ids = np.nonzero(indices != -1)
+        parts[indices[person_ids, part_ids]] = part_ids
+    return parts
+
+# (matched, total) joints of a Body output (candidate, subset) against another output of the same frame:
+# the peaks assigned to a person, matched if the other output has a peak assigned to the same part within match_radius pixels
+def matched_joints(output, other_output, match_radius):
+    candidate, subset = output
+    other_candidate, other_subset = other_output
+    parts = candidate_parts(candidate, subset)
+    other_parts = candidate_parts(other_candidate, other_subset)
+    joints = parts != -1
+    other_joints = other_parts != -1
+    total = int(np.sum(joints))
+    if total == 0 or not np.any(other_joints):
+        return 0, total
+    same_part = parts[joints][:, None] == other_parts[other_joints][None, :]
+    distance = np.linalg.norm(candidate[joints][:, None, 0:2] - other_candidate[other_joints][None, :, 0:2], axis=2)
+    return int(np.sum(np.any(same_part & (distance <= match_radius), axis=1))), total
+
+# (..., 18, 2) x, y of keypoints arrays
+def keypoints_xy(persons):
+    return persons[..., 0:2]
+
+# (..., 18) whether each keypoint is detected
+def is_detected(persons):
+    return ~np.isnan(persons[..., 0])
+
+# (...) whether each person has at least one detected keypoint
+def is_present(persons):
+    return np.any(is_detected(persons), axis=-1)
+
+# integer (x, y) of one keypoint of a person, None if it is not detected
+def keypoint(person, kp_id):
+    if np.isnan(person[kp_id, 0]):
+        return None
+    return int(person[kp_id, 0]), int(person[kp_id, 1])
 
 # plot body keypoints of one person
-def plot_keypoints(canvas,keypoints):
-    for kp_id in range(18):
-        if keypoints['keypoints'][kp_id]['confidence'] > 0:
-            x = keypoints['keypoints'][kp_id]['x']
-            y = keypoints['keypoints'][kp_id]['y']
-            # Draw keypoints on the image
-            cv2.circle(canvas, (x, y), 3, (0, 0, 255), -1)  # Red circles for keypoints
\ No newline at end of file
+def plot_keypoints(canvas, person):
+    for kp_id in np.nonzero(is_detected(person))[0]:
+        # Draw keypoints on the image
+        cv2.circle(canvas, keypoint(person, kp_id), 3, (0, 0, 255), -1)  # Red circles for keypoints
+
+# box (x_min, y_min, x_max, y_max) around the keypoints of one person, padded by pad_ratio of its
+# longest side (at least min_size) and clipped to the image, None if no keypoint is detected
+def get_person_box(person, image_shape, pad_ratio=0.25, min_size=64):
+    xy = keypoints_xy(person)[is_detected(person)].astype(np.float64)
+    if len(xy) == 0:
+        return None
+
+    xs_min, ys_min = xy.min(axis=0)
+    xs_max, ys_max = xy.max(axis=0)
+    pad = max(xs_max - xs_min, ys_max - ys_min) * pad_ratio
+    center_x = (xs_min + xs_max) / 2
+    center_y = (ys_min + ys_max) / 2
+    half_width = max((xs_max - xs_min) / 2 + pad, min_size / 2)
+    half_height = max((ys_max - ys_min) / 2 + pad, min_size / 2)
+
+    x_min = max(int(center_x - half_width), 0)
+    y_min = max(int(center_y - half_height), 0)
+    x_max = min(int(math.ceil(center_x + half_width)), image_shape[1])
+    y_max = min(int(math.ceil(center_y + half_height)), image_shape[0])
+    return x_min, y_min, x_max, y_max
@@ -5,8 +5,7 @@ from torch.utils.data import Dataset
 from torchvision import transforms
 import torchvision
 import pandas as pd
-import csv
-from src.modules import data_creator, motion_analysis
+from src.modules import motion_analysis, label_index, sample_index, frame_store, pose_store, feature_store
 import cv2
 import random
 
@@ -24,12 +23,15 @@ torch.backends.cudnn.deterministic=True
 
 class CustomGunLSTMDataset_opt(Dataset):
     
-    def __init__(self, root_dir, window_size = 3, transform=None, video=None, showLog=False):
+    def __init__(self, root_dir, window_size = 3, transform=None, video=None, showLog=False, packed_poses=False):
         self.data_dir = root_dir
         self.window_size = window_size
-        self.data = []  # A list to store data entries
+        self.data = []  # A list to store data entries (person and end frame of the window)
+        self.persons = []  # hand feature tensors and motion keypoint sequence of every person with samples
         self.transform = transform
         self.video = video
+        # poses returned bit-packed (512, 64), expanded per batch by pose_store.collate_packed_poses
+        self.packed_poses = packed_poses
         
         video_names = []
         if self.video is None:
@@ -39,14 +41,23 @@ class CustomGunLSTMDataset_opt(Dataset):
         if showLog:
             print("video list detected by CustomGunDataset: ", video_names)
 
+        # existing data files and labels of the videos, saved in the data root for the next runs
+        video_indexes = sample_index.load_index(root_dir, video_names, showLog)
+
+        # feature tensor of a black hand image, used for the frames without a hand (loaded with the first person)
+        black_hand_tensor = None
+
         # Load data entries based on the directory structure
         for index, video_name in enumerate(video_names):
             video_dir = os.path.join(root_dir, str(video_name))
-            annotation_path = os.path.join(video_dir, 'video_labels.csv')
             
-            if os.path.exists(video_dir):
+            if str(video_name) in video_indexes:
+                video_index = video_indexes[str(video_name)]
                 # Get num of frames and persons from the video labels csv file
-                num_frames, num_person = data_creator.get_num_frames_person(self.data_dir, video_name)
+                num_frames, num_person = video_index.num_frames, video_index.num_persons
+                video_labels = video_index.labels
+                # hand features of the persons of the video (memory-mapped)
+                store_features, store_present = feature_store.load_store(video_dir)
 
                 for person_id in range(num_person):  # Iterate through subdirectories
                     person_name = 'person_' + str(person_id)
@@ -59,7 +70,8 @@ class CustomGunLSTMDataset_opt(Dataset):
                     motion_folder_path = os.path.join(person_folder_path, "motion_keypoints")
 
                     # Check if all required directories exist
-                    if not os.path.exists(hand_folder_path) or not os.path.exists(pose_folder_path) or not os.path.exists(motion_folder_path):
+                    person_row = video_index.person_row(person_id)
+                    if person_row is None:
                         if showLog:
                             print(f"Skipping subdir {person_name}: Required directories missing.")
                         continue  # Skip to the next subdir
@@ -71,95 +83,52 @@ class CustomGunLSTMDataset_opt(Dataset):
                         # data_names = []
                     
                         
-                        for frame_num in range(num_frames):
-                            if not showLog:
-                                print(f'Loading Dataset...[{index}/{len(video_names)}][{person_id}/{num_person}][{frame_num}/{num_frames}]      ', end='\r')
-                                
-                            hand_path = os.path.join(hand_folder_path, 'hands_' + str(frame_num) + '.pt')
-                            black_hand_path = 'data/darknet_black_feature_tensor.pt'
-                            pose_path = os.path.join(pose_folder_path, 'pose_' + str(frame_num) + '.png')
-                            motion_path = os.path.join(motion_folder_path, "keypoints_seq.txt")
-                            
-                            # GUN DATA
-                            hand_file_exist = os.path.isfile(hand_path)
-                            gun_data = None
-
-                            if hand_file_exist:
-                                hand_tensors = []
-
-                                for i in range(self.window_size):
-                                    hand_path = os.path.join(hand_folder_path, 'hands_' + str(frame_num - i) + '.pt')
-                                    if os.path.isfile(hand_path):
-                                        hand_tensor = torch.load(hand_path)
-                                    else:
-                                        hand_tensor = torch.load(black_hand_path)
-                                    hand_tensors.append(hand_tensor)   
-                                
-                                hand_tensors.reverse()
-
-                                gun_data = torch.cat(hand_tensors, dim=0)
-                            
-                            # POSE DATA
-                            pose_file_exist = os.path.isfile(pose_path)
-                            pose_data = None
-
-                            if pose_file_exist:
-                                preprocess = transforms.Compose([ transforms.ToTensor() ])
-                                image = cv2.imread(pose_path, cv2.IMREAD_GRAYSCALE)
-                                input_image = preprocess(image)
-                                # input_image = input_image.unsqueeze(0)
-                                pose_data = input_image
-
-                            # only used to remove samples the same way as the original customdataset
-                            old_modtion_data = motion_analysis.get_one_sequence(motion_path, frame_num, self.window_size)
-
-                            # LABEL
-                            # Read the CSV file
-                            data_label = None
-                            with open(annotation_path, 'r') as csvfile:
-                                csv_reader = csv.reader(csvfile)
-                                header = next(csv_reader) 
-                                
-                                if person_id < num_person:
-                                    column_index = person_id + 1
-                                    row_index = frame_num
-
-                                    # Iterate through the CSV rows
-                                    for i, row in enumerate(csv_reader):
-                                        if i == row_index:
-                                            if len(row) > column_index:
-                                                data_label = row[column_index]
-                                                # Check if the value is empty or missing, and set it to "null" if so
-                                                if not data_label:
-                                                    data_label = None
-                                elif showLog:
-                                    print(f"No match found in CSV file for {person_name}")
-
-                            
-                            sample_name = f"Vid{video_name}_{person_name}_Frame{frame_num}"
-                                
-                            
-                            gun_data_exist = gun_data is not None
-                            pose_data_exist = pose_data is not None
-                            old_modtion_data_exist = old_modtion_data is not None
-
-                                
-                            if gun_data_exist and pose_data_exist:
-                                data_entry = {
-                                    "data_name": sample_name,
-                                    "gun_data": gun_data,
-                                    "pose_data": pose_data,
-                                    "motion_data": old_modtion_data,
-                                    "label": data_label
-                                }
-                                self.data.append(data_entry)
-                            else:
-                                if showLog:
-                                    print(f"Skipping {sample_name}:")
-                                    print("\tGun data exist: ", gun_data_exist)
-                                    print("\tPose data exist: ", pose_data_exist)
-                                continue  # Continue to the next image
-                    
+                        # samples are the frames with a hand feature tensor and a binary pose
+                        sample_frames = np.nonzero(video_index.hand_pt[person_row] & video_index.pose_png[person_row])[0].tolist()
+                        if not sample_frames:
+                            continue
+
+                        if black_hand_tensor is None:
+                            black_hand_tensor = feature_store.load_black_feature(root_dir)
+
+                        # hand features of the person: the windows are slices of the feature store (memory-mapped), or
+                        # for data without a store, the hand feature tensors of every frame loaded once and shared by the windows
+                        hand_features = feature_store.PersonFeatures(hand_folder_path, video_index.hand_pt[person_row],
+                                                                     store_features, store_present, person_id, black_hand_tensor)
+                        if not hand_features.stored:
+                            hand_frames = np.nonzero(video_index.hand_pt[person_row])[0].tolist()
+                            hand_tensors = []
+                            for frame_num in hand_frames:
+                                if not showLog:
+                                    print(f'Loading Dataset...[{index}/{len(video_names)}][{person_id}/{num_person}][{frame_num}/{num_frames}]      ', end='\r')
+                                hand_tensors.append(hand_features.get(frame_num))
+                            hand_features = frame_store.PersonFrames(hand_tensors, hand_frames, black_hand_tensor, num_frames)
+
+                        person = len(self.persons)
+                        self.persons.append({
+                            "hand_frames": hand_features,
+                            # motion keypoint sequence of the person, loaded once (memory-mapped)
+                            "motion_sequence": motion_analysis.load_sequence(motion_analysis.sequence_path(motion_folder_path))
+                        })
+
+                        # bit-packed binary poses of the person
+                        person_poses = pose_store.PersonPoses(pose_folder_path)
+
+                        for frame_num in sample_frames:
+                            # POSE DATA (bit-packed)
+                            pose_data = person_poses.get(frame_num)
+
+                            data_entry = {
+                                "data_name": f"Vid{video_name}_{person_name}_Frame{frame_num}",
+                                "person": person,
+                                "frame_num": frame_num,
+                                "pose_data": pose_data,
+                                "label": label_index.get_label(video_labels, person_id, frame_num)
+                            }
+                            self.data.append(data_entry)
+        # motion windows of the persons for the window size
+        self.set_window_size(window_size)
+
         if not showLog:
             print(f'Loading Dataset...[{len(video_names)}/{len(video_names)}]                            ')
 
@@ -168,17 +137,30 @@ class CustomGunLSTMDataset_opt(Dataset):
 
     def __getitem__(self, index):
         data_entry = self.data[index]
-        data_name = self.data[index].get("data_name")
-        gun_data = self.data[index].get("gun_data")
-        pose_data = self.data[index].get("pose_data")
-        motion_data = self.data[index].get("motion_data")
-        label = self.data[index].get("label")
+        data_name = data_entry.get("data_name")
+        gun_data = self.get_gun_data(index)
+        pose_data = data_entry.get("pose_data")
+        if not self.packed_poses:
+            pose_data = pose_store.unpack_poses(pose_data)
+        motion_data = self.motion_windows[data_entry["person"]][data_entry["frame_num"]]
+        label = data_entry.get("label")
 
         label = int(label)
         label = torch.tensor(label, dtype=torch.long)
 
         return data_name, gun_data, pose_data, motion_data, label
 
+    # hand feature tensors of the window of a sample concatenated, black image feature before the first frame and for missing hands
+    def get_gun_data(self, index):
+        data_entry = self.data[index]
+        window = self.persons[data_entry["person"]]["hand_frames"].window(data_entry["frame_num"], self.window_size)
+        return window.flatten(0, 1)
+
+    # change the window size of the samples, the stored frames are kept
+    def set_window_size(self, window_size):
+        self.window_size = window_size
+        self.motion_windows = [motion_analysis.sequence_windows(person["motion_sequence"], window_size, pad=True) for person in self.persons]
+
 def _list_subfolders(main_folder_path):
     subfolders = []
 
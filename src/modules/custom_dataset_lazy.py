@@ -0,0 +1,108 @@
+import os
+import torch
+from torch.utils.data import Dataset
+import numpy as np
+from src.modules import motion_analysis, label_index, sample_index, tensor_cache, pose_store, feature_store
+from src.modules.custom_dataset_opt import _list_subfolders
+import random
+
+# Set a random seed for reproducibility
+torch.manual_seed(12)
+torch.cuda.manual_seed(12)
+np.random.seed(12)
+random.seed(12)
+os.environ['PYTHONHASHSEED'] = str(12)
+torch.cuda.manual_seed_all(12)
+torch.backends.cudnn.benchmark = False
+torch.backends.cudnn.enabled = False
+
+torch.backends.cudnn.deterministic=True
+
+# Lazy-loading CustomGunDataset_opt: the same samples, but __init__ only indexes them (sample_index) and
+# __getitem__ loads the hand feature and bit-packed binary pose of a sample through a size-bounded LRU cache
+# (cache_mb), so the dataset does not have to fit in memory.
+class CustomGunDataset_lazy(Dataset):
+
+    def __init__(self, root_dir, window_size = 3, transform=None, video=None, showLog=False, cache_mb=1024, packed_poses=False):
+        self.data_dir = root_dir
+        self.window_size = window_size
+        self.data = []  # A list to store data entries (files of the sample, loaded by __getitem__)
+        self.transform = transform
+        self.video = video
+        # poses returned bit-packed (512, 64), expanded per batch by pose_store.collate_packed_poses
+        self.packed_poses = packed_poses
+        self.cache = tensor_cache.TensorCache(cache_mb)
+
+        video_names = []
+        if self.video is None:
+            video_names = _list_subfolders(root_dir)
+        else:
+            video_names.append(str(video))
+        if showLog:
+            print("video list detected by CustomGunDataset_lazy: ", video_names)
+
+        # existing data files and labels of the videos, saved in the data root for the next runs
+        video_indexes = sample_index.load_index(root_dir, video_names, showLog)
+
+        for video_name in video_names:
+            if str(video_name) not in video_indexes:
+                continue
+            video_index = video_indexes[str(video_name)]
+            video_dir = os.path.join(root_dir, str(video_name))
+            # hand features of the persons of the video (memory-mapped)
+            store_features, store_present = feature_store.load_store(video_dir)
+
+            for person_id in range(video_index.num_persons):
+                person_name = 'person_' + str(person_id)
+                person_row = video_index.person_row(person_id)
+                if person_row is None:
+                    if showLog:
+                        print(f"Skipping subdir {person_name}: Required directories missing.")
+                    continue
+
+                person_folder_path = os.path.join(video_dir, person_name)
+                hand_folder_path = os.path.join(person_folder_path, "hand_image")
+                pose_folder_path = os.path.join(person_folder_path, "binary_pose")
+                motion_folder_path = os.path.join(person_folder_path, "motion_keypoints")
+
+                # motion keypoint windows of the person (one per frame), views of its sequence loaded once
+                motion_sequence = motion_analysis.load_sequence(motion_analysis.sequence_path(motion_folder_path))
+                motion_windows = motion_analysis.sequence_windows(motion_sequence, self.window_size, pad=True)
+                # bit-packed binary poses of the person
+                person_poses = pose_store.PersonPoses(pose_folder_path)
+                # hand features of the person, from the feature store or the hands_N.pt files
+                person_features = feature_store.PersonFeatures(hand_folder_path, video_index.hand_pt[person_row],
+                                                               store_features, store_present, person_id, None)
+
+                # samples are the frames with a hand feature tensor and a binary pose
+                for frame_num in np.nonzero(video_index.hand_pt[person_row] & video_index.pose_png[person_row])[0].tolist():
+                    data_entry = {
+                        "data_name": f"Vid{video_name}_{person_name}_Frame{frame_num}",
+                        "hand_path": os.path.join(hand_folder_path, 'hands_' + str(frame_num) + '.pt'),
+                        "person_features": person_features,
+                        "pose_path": os.path.join(pose_folder_path, 'pose_' + str(frame_num) + '.png'),
+                        "person_poses": person_poses,
+                        "frame_num": frame_num,
+                        "motion_data": motion_windows[frame_num],
+                        "label": label_index.get_label(video_index.labels, person_id, frame_num)
+                    }
+                    self.data.append(data_entry)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getitem__(self, index):
+        data_entry = self.data[index]
+        data_name = data_entry.get("data_name")
+        gun_data = self.cache.get(data_entry["hand_path"], lambda: data_entry["person_features"].get(data_entry["frame_num"]))
+        # cached bit-packed
+        pose_data = self.cache.get(data_entry["pose_path"], lambda: data_entry["person_poses"].get(data_entry["frame_num"]))
+        if not self.packed_poses:
+            pose_data = pose_store.unpack_poses(pose_data)
+        motion_data = data_entry.get("motion_data")
+        label = data_entry.get("label")
+
+        label = int(label)
+        label = torch.tensor(label, dtype=torch.long)
+
+        return data_name, gun_data, pose_data, motion_data, label
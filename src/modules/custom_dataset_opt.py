@@ -4,9 +4,8 @@ from torch.utils.data import Dataset
 from torchvision import transforms
 import torchvision
 import pandas as pd
-import csv
 import numpy as np
-from src.modules import data_creator, motion_analysis
+from src.modules import motion_analysis, label_index, sample_index, pose_store, feature_store
 import cv2
 import random
 
@@ -24,12 +23,14 @@ torch.backends.cudnn.deterministic=True
 
 class CustomGunDataset_opt(Dataset):
     
-    def __init__(self, root_dir, window_size = 3, transform=None, video=None, showLog=False):
+    def __init__(self, root_dir, window_size = 3, transform=None, video=None, showLog=False, packed_poses=False):
         self.data_dir = root_dir
         self.window_size = window_size
         self.data = []  # A list to store data entries
         self.transform = transform
         self.video = video
+        # poses returned bit-packed (512, 64), expanded per batch by pose_store.collate_packed_poses
+        self.packed_poses = packed_poses
         
         video_names = []
         if self.video is None:
@@ -39,14 +40,20 @@ class CustomGunDataset_opt(Dataset):
         if showLog:
             print("video list detected by CustomGunDataset: ", video_names)
 
+        # existing data files and labels of the videos, saved in the data root for the next runs
+        video_indexes = sample_index.load_index(root_dir, video_names, showLog)
+
         # Load data entries based on the directory structure
         for index, video_name in enumerate(video_names):
             video_dir = os.path.join(root_dir, str(video_name))
-            annotation_path = os.path.join(video_dir, 'video_labels.csv')
             
-            if os.path.exists(video_dir):
+            if str(video_name) in video_indexes:
+                video_index = video_indexes[str(video_name)]
                 # Get num of frames and persons from the video labels csv file
-                num_frames, num_person = data_creator.get_num_frames_person(self.data_dir, video_name)
+                num_frames, num_person = video_index.num_frames, video_index.num_persons
+                video_labels = video_index.labels
+                # hand features of the persons of the video (memory-mapped)
+                store_features, store_present = feature_store.load_store(video_dir)
 
                 for person_id in range(num_person):  # Iterate through subdirectories
                     person_name = 'person_' + str(person_id)
@@ -59,7 +66,8 @@ class CustomGunDataset_opt(Dataset):
                     motion_folder_path = os.path.join(person_folder_path, "motion_keypoints")
 
                     # Check if all required directories exist
-                    if not os.path.exists(hand_folder_path) or not os.path.exists(pose_folder_path) or not os.path.exists(motion_folder_path):
+                    person_row = video_index.person_row(person_id)
+                    if person_row is None:
                         if showLog:
                             print(f"Skipping subdir {person_name}: Required directories missing.")
                         continue  # Skip to the next subdir
@@ -71,61 +79,44 @@ class CustomGunDataset_opt(Dataset):
                         # data_names = []
                     
                         
+                        # motion keypoint windows of the person (one per frame), views of its sequence loaded once
+                        motion_sequence = motion_analysis.load_sequence(motion_analysis.sequence_path(motion_folder_path))
+                        motion_windows = motion_analysis.sequence_windows(motion_sequence, self.window_size, pad=True)
+                        # bit-packed binary poses of the person
+                        person_poses = pose_store.PersonPoses(pose_folder_path)
+                        # hand features of the person, from the feature store or the hands_N.pt files
+                        person_features = feature_store.PersonFeatures(hand_folder_path, video_index.hand_pt[person_row],
+                                                                       store_features, store_present, person_id, None)
+
                         for frame_num in range(num_frames):
                             if not showLog:
                                 print(f'Loading Dataset...[{index}/{len(video_names)}][{person_id}/{num_person}][{frame_num}/{num_frames}]      ', end='\r')
-                            hand_path = os.path.join(hand_folder_path, 'hands_' + str(frame_num) + '.pt')
-                            pose_path = os.path.join(pose_folder_path, 'pose_' + str(frame_num) + '.png')
-                            motion_path = os.path.join(motion_folder_path, "keypoints_seq.txt")
                             
                             # GUN DATA
-                            hand_file_exist = os.path.isfile(hand_path)
+                            hand_file_exist = video_index.hand_pt[person_row, frame_num]
                             gun_data = None
 
                             if hand_file_exist:
-                                hand_tensor = torch.load(hand_path)
+                                hand_tensor = person_features.get(frame_num)
 
                                 gun_data = hand_tensor
                             
                             # POSE DATA
-                            pose_file_exist = os.path.isfile(pose_path)
+                            pose_file_exist = video_index.pose_png[person_row, frame_num]
                             pose_data = None
 
                             if pose_file_exist:
-                                preprocess = transforms.Compose([ transforms.ToTensor() ])
-                                image = cv2.imread(pose_path, cv2.IMREAD_GRAYSCALE)
-                                input_image = preprocess(image)
-                                # input_image = input_image.unsqueeze(0)
-                                pose_data = input_image
+                                # bit-packed (512, 64), expanded by __getitem__ or the collate function
+                                pose_data = person_poses.get(frame_num)
 
 
                             # MOTION DATA
 
-                            motion_data = motion_analysis.get_one_sequence(motion_path, frame_num, self.window_size)
+                            motion_data = motion_windows[frame_num]
 
                             # LABEL
-                            # Read the CSV file
-                            data_label = None
-                            with open(annotation_path, 'r') as csvfile:
-                                csv_reader = csv.reader(csvfile)
-                                header = next(csv_reader) 
-                                
-                                if person_id < num_person:
-                                    column_index = person_id + 1
-                                    row_index = frame_num
-
-                                    # Iterate through the CSV rows
-                                    for i, row in enumerate(csv_reader):
-                                        if i == row_index:
-                                            if len(row) > column_index:
-                                                data_label = row[column_index]
-                                                # Check if the value is empty or missing, and set it to "null" if so
-                                                if not data_label:
-                                                    data_label = None
-                                elif showLog:
-                                    print(f"No match found in CSV file for {person_name}")
+                            data_label = label_index.get_label(video_labels, person_id, frame_num)
 
-                            
                             sample_name = f"Vid{video_name}_{person_name}_Frame{frame_num}"
                                 
                             
@@ -162,6 +153,8 @@ class CustomGunDataset_opt(Dataset):
         data_name = self.data[index].get("data_name")
         gun_data = self.data[index].get("gun_data")
         pose_data = self.data[index].get("pose_data")
+        if not self.packed_poses:
+            pose_data = pose_store.unpack_poses(pose_data)
         motion_data = self.data[index].get("motion_data")
         label = self.data[index].get("label")
 
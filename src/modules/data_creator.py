@@ -3,14 +3,15 @@ import cv2
 import os
 import json
 import copy
-import csv
 import re
+import time
+import itertools
 import matplotlib.pyplot as plt
 from matplotlib.animation import FuncAnimation
 from src.body import Body
 from src import util
-from src.modules import handregion, bodykeypoints, handimage, motion_preprocess
-from src.modules.binarypose import BinaryPose
+from src.modules import handregion, bodykeypoints, handimage, motion_preprocess, model_registry, pose_cache, pipeline, tracker, label_index, binarypose, pose_store, feature_extraction, feature_store
+from src.modules.binarypose import BinaryPose, PoseNormalizer
 
 import torch
 import numpy as np
@@ -34,17 +35,35 @@ total_num_person = 0
 # total number of frames in video
 num_frames = 0
 
-# prev persons keypoints
-prev_persons = None
-
 # create the following data for a video:
 #   -hand region images (gun), 
 #   -binary pose image (pose), 
 #   -preprocessed keypoints text file (motion)
-def create_data(dataset_folder, video_label, data_folder, display_animation = False):
-    # Reset prev_persons for each new video folder
-    global prev_persons
-    prev_persons = None
+# pose_batch_size: number of frames passed to the body estimation model in one forward
+# keyframe_interval: run the body estimation on the full frame every keyframe_interval frames only,
+#   the frames in between are estimated on crops around the persons tracked in the previous frame
+#   (persons entering the video are found at the next keyframe)
+# pose_cache_folder: folder of the on-disk pose cache, frames estimated in a previous run are not estimated again
+# fused_hand_features: compute the hand features (feature store of the video, see feature_store) while creating the data,
+#   from the gun feature model input warped directly from the frame (handimage.create_hand_input) in batches of
+#   hand_batch_size, instead of writing the hand images for create_hand_feature_tensor
+# save_hand_images: with fused_hand_features, also write the hand images (for inspection)
+def create_data(dataset_folder, video_label, data_folder, display_animation = False, pose_batch_size = 1, keyframe_interval = 1, pose_cache_folder = None,
+                fused_hand_features = False, hand_batch_size = 32, save_hand_images = False):
+    video_start = time.perf_counter()
+
+    # Reset the tracking state for each new video folder
+    global total_num_person
+    total_num_person = 0
+
+    # Person tracker of the video, keeps the person ids stable across frames
+    person_tracker = tracker.PersonTracker()
+
+    # Binary pose normalization state of every person of the video, indexed by person id
+    normalizers = {}
+
+    # keypoints of the persons of the previous frame, indexed by person id (see bodykeypoints)
+    prev_persons = np.zeros((0, 18, 3), dtype=np.float32)
     
     # Path of input video
     video_folder = dataset_folder + video_label
@@ -52,8 +71,16 @@ def create_data(dataset_folder, video_label, data_folder, display_animation = Fa
     # Path of output video folder
     output_folder = data_folder + video_label + "/"
 
-    # Initialize body estimation model
-    body_estimation = Body('model/body_pose_model.pth')
+    # Body estimation model, shared by all videos of the process
+    if pose_cache_folder is None:
+        body_estimation = model_registry.get_body('model/body_pose_model.pth')
+    else:
+        body_estimation = model_registry.get_body('model/body_pose_model.pth', cache_folder=pose_cache_folder)
+
+    # Hand features of the persons computed in batches, indexed by (person id, frame number)
+    if fused_hand_features:
+        gun_model = model_registry.get_gun_feature_model()
+        feature_batcher = feature_extraction.FeatureBatcher(gun_model, hand_batch_size)
 
     # Specify the folder containing the images/frames
     image_folder = video_folder
@@ -67,65 +94,105 @@ def create_data(dataset_folder, video_label, data_folder, display_animation = Fa
     image_files = sorted(image_files, key=natural_sort_key) # Sort the files to ensure the correct order
 
     # Initialize a list to store the keypoints data (sequence)
+    # per frame the (persons, 18, 3) keypoints and (persons, 18, 2) normalized keypoints arrays
     keypoints_data = []
     normalized_keypoints_data = []
+    normalized_present_data = []
 
     # Initialize list of hand_regions coordinates 
     # [frame 0 = [person 0 = [hand_regions = [hand_region = [x_min,..., y_max] , ], ], ] , ]
     orig_hand_regions_of_vid = []
 
-    # Function to load and process an image frame
-    def process_frame(frame_number):
-        print("")
-        print("Frame Num: ", frame_number)
+    target_size = (512,512)
+
+    # Function to load and resize an image frame
+    def load_frame(frame_number):
         image_file = image_files[frame_number]
-        print(f"Processing image: {image_file}")
 
         # Load the image
         test_image = os.path.join(image_folder, image_file)
         orig_image = cv2.imread(test_image)  # B,G,R order
 
-        orig_image_shape = orig_image.shape[:2]
-
         # Resize the image
-        target_size = (512,512)
         resized_image = cv2.resize(orig_image, target_size)
-        resized_image_shape = resized_image.shape[:2]
+        return frame_number, orig_image.shape[:2], resized_image
+
+    def is_keyframe(frame_number):
+        return frame_number % keyframe_interval == 0
+
+    # Split the loaded frames into groups of pose_batch_size keyframes
+    # (with the frames in between, which are estimated on crops while processing)
+    def frame_groups(loaded_frames):
+        group = []
+        num_keyframes = 0
+        for loaded in loaded_frames:
+            group.append(loaded)
+            num_keyframes += is_keyframe(loaded[0])
+            if num_keyframes == pose_batch_size:
+                yield group
+                group = []
+                num_keyframes = 0
+        if len(group) > 0:
+            yield group
+
+    # Body pose estimation of the keyframes of a group in one batch
+    # returns (frame_number, orig_image_shape, resized_image, candidate, subset) per frame, no poses for the frames in between
+    def estimate_frames(group):
+        keyframes = [loaded for loaded in group if is_keyframe(loaded[0])]
+        poses = {}
+        if len(keyframes) > 0:
+            # cache keys of the frames: image file content and resize target
+            keys = None
+            if body_estimation.cache is not None:
+                keys = [f"{pose_cache.file_hash(os.path.join(image_folder, image_files[n]))}_{target_size}" for n, _, _ in keyframes]
+            estimated = body_estimation.batch([resized_image for _, _, resized_image in keyframes], keys=keys)
+            poses = {n: pose for (n, _, _), pose in zip(keyframes, estimated)}
+        return [(n, orig_image_shape, resized_image) + poses.get(n, (None, None)) for n, orig_image_shape, resized_image in group]
+
+    # Frame pipeline: 
+    #   load (prefetching thread) -> pose estimation (batched, thread) -> process_frame (in frame order) -> writer (thread)
+    # only process_frame depends on the previous frame (tracking, normalization)
+    # its roi passes (keyframe_interval > 1) share body_estimation with the pose stage, Body runs one estimation at a time
+    load_stage = pipeline.Stage(load_frame, range(len(image_files)), maxsize=2 * pose_batch_size)
+    pose_stage = pipeline.Stage(estimate_frames, frame_groups(load_stage), maxsize=2)
+    estimated_frames = itertools.chain.from_iterable(pose_stage)
+    writer = pipeline.AsyncWriter()
+
+    # seconds spent in process_frame, and waiting there for the pose estimation
+    process_time = {'processing': 0, 'waiting': 0}
 
-        # Body pose estimation
-        candidate, subset = body_estimation(resized_image)
+    # Function to load and process an image frame
+    def process_frame(frame_number):
+        start = time.perf_counter()
+        _, orig_image_shape, resized_image, candidate, subset = next(estimated_frames)
+        process_time['waiting'] += time.perf_counter() - start
 
-        num_person = len(subset)
+        print("")
+        print("Frame Num: ", frame_number)
+        image_file = image_files[frame_number]
+        print(f"Processing image: {image_file}")
+
+        nonlocal prev_persons
+        if candidate is None:
+            # Body pose estimation around the persons of the previous frame
+            person_boxes = [bodykeypoints.get_person_box(person, resized_image.shape) for person in prev_persons[bodykeypoints.is_present(prev_persons)]]
+            candidate, subset = body_estimation.roi(resized_image, [box for box in person_boxes if box is not None])
+        resized_image_shape = resized_image.shape[:2]
 
         # Visualize body pose on the image
         canvas = copy.deepcopy(resized_image)
         canvas = util.draw_bodypose(canvas, candidate, subset)
 
-        # Extract keypoints data (coordinates and confidence scores)
-        keypoints_per_frame = {
-            'frame_number': frame_number,
-            'keypoints': []
-        }
-        normalized_keypoints_per_frame = []
-
         orig_hand_regions_per_frame = [] #[[person 0] , [person 1] ...]
 
         # Get all person keypoints in the frame (unarranged)
-        unarranged_persons = []
         confidence_min = 0.1
-        for person_id in range(num_person):
-            keypoints = bodykeypoints.extract_keypoints(person_id, candidate, subset, confidence_min)
-            unarranged_persons.append(keypoints)
+        unarranged_persons = bodykeypoints.extract_persons(candidate, subset, confidence_min)
 
-        
-        global prev_persons
-        if prev_persons is None:
-            # No rearranging in the first frame
-            arranged_persons = unarranged_persons
-        else:
-            arranged_persons = reorder_persons(prev_persons,unarranged_persons)
-
-        
+        # Arrange the persons by their person id
+        arranged_persons = person_tracker.update(unarranged_persons)
+        in_frame = np.zeros(len(arranged_persons), dtype=bool)
+        in_frame[person_tracker.track_ids] = True
 
         # update the previous persons for the next iteration
         prev_persons = arranged_persons
@@ -134,21 +201,19 @@ def create_data(dataset_folder, video_label, data_folder, display_animation = Fa
         global total_num_person
         total_num_person = len(arranged_persons)
 
+        # normalized keypoints of the persons, NaN if not in the frame or not normalized
+        normalized_keypoints_per_frame = np.full((len(arranged_persons), 18, 2), np.nan)
+        normalized_present_per_frame = np.zeros(len(arranged_persons), dtype=bool)
+
         for person_id in range(len(arranged_persons)):
             print("Person ID: ", person_id)
 
             person_folder = output_folder + "person_" + str(person_id) + "/"
 
-            # extract keypoints dictionary (person_id,keypoints)
-            # keypoints = bodykeypoints.extract_keypoints(person_id, candidate, subset, confidence_min)
+            # keypoints array of the person
             keypoints = arranged_persons[person_id]
 
-            # add keypoints to keypoints_per_frame list
-            keypoints_per_frame['keypoints'].append(keypoints)
-
-            if keypoints is None:
-                # add None to normalized_keypoints_per_frame list
-                normalized_keypoints_per_frame.append(None)
+            if not in_frame[person_id]:
                 # add None to orig_hand_regions_per_frame list
                 orig_hand_regions_per_frame.append([None])
             else:    
@@ -174,7 +239,20 @@ def create_data(dataset_folder, video_label, data_folder, display_animation = Fa
                 
                 # hand image filename : hands_{frame_number}.png
                 hand_folder = person_folder + "hand_image/"
-                handregion_image, hand_file_name = handimage.create_hand_image(resized_image, hand_regions, resized_image_shape, hand_image_width, frame_number, hand_folder)
+                if not fused_hand_features:
+                    handregion_image, hand_file_name = handimage.create_hand_image(resized_image, hand_regions, resized_image_shape, hand_image_width, frame_number, hand_folder, writer=writer)
+                else:
+                    # model input of the hand regions, the feature is computed with the next batch
+                    hand_input = handimage.create_hand_input(resized_image, hand_regions, resized_image_shape)
+                    if hand_input is not None:
+                        feature_batcher.add((person_id, frame_number), hand_input)
+                        # the datasets need the hand image folder of the persons with a hand
+                        if not os.path.exists(hand_folder):
+                            os.makedirs(hand_folder)
+                    if save_hand_images:
+                        handregion_image, hand_file_name = handimage.create_hand_image(resized_image, hand_regions, resized_image_shape, hand_image_width, frame_number, hand_folder, writer=writer)
+                    else:
+                        handregion_image = cv2.cvtColor(hand_input, cv2.COLOR_RGB2BGR) if hand_input is not None else None
                 
 
                 # display the hand region image
@@ -183,16 +261,20 @@ def create_data(dataset_folder, video_label, data_folder, display_animation = Fa
 
                 # create and save the binary pose image
                 binary_folder = person_folder + "binary_pose/"
-                normalized_keypoints, binary_file_name = BinaryPose.createBinaryPose(keypoints, frame_number, binary_folder)
+                normalized_keypoints, binary_file_name = BinaryPose.createBinaryPose(keypoints, normalizers.setdefault(person_id, PoseNormalizer()), frame_number, binary_folder, writer=writer)
 
-                # add normalized keypoints to normalized_keypoints_per_frame list
-                normalized_keypoints_per_frame.append(normalized_keypoints)
+                # add normalized keypoints to normalized_keypoints_per_frame array
+                if normalized_keypoints is not None:
+                    normalized_keypoints_per_frame[person_id] = normalized_keypoints
+                    normalized_present_per_frame[person_id] = True
 
-        keypoints_data.append(keypoints_per_frame)
+        keypoints_data.append(arranged_persons)
         normalized_keypoints_data.append(normalized_keypoints_per_frame)
+        normalized_present_data.append(normalized_present_per_frame)
 
         orig_hand_regions_of_vid.append(orig_hand_regions_per_frame)
 
+        process_time['processing'] += time.perf_counter() - start
         return canvas
 
     num_frames = len(image_files)
@@ -249,12 +331,49 @@ def create_data(dataset_folder, video_label, data_folder, display_animation = Fa
 
 
 
+    # wait for the pending image writes
+    writer.close()
+
+    if fused_hand_features:
+        # feature store of the video, written after the hand images so they are not extracted again (see feature_extraction)
+        feature_batcher.flush()
+        if not os.path.exists(output_folder):
+            os.makedirs(output_folder)
+        hand_features, hand_present = feature_store.create_store(output_folder, total_num_person, num_frames)
+        for (person_id, frame_number), feature in feature_batcher.features.items():
+            hand_features[person_id, frame_number] = feature
+            hand_present[person_id, frame_number] = True
+        hand_features.flush()
+        del hand_features
+        feature_store.save_present(output_folder, hand_present)
+        if not os.path.isfile(os.path.join(data_folder, feature_store.black_file)):
+            feature_extraction.save_black_feature(data_folder, gun_model)
+        print(f"hand features: {len(feature_batcher.features)} in {feature_batcher.busy_time:.2f}s")
+
     print("total num person: " , total_num_person)
+    print(f"stage times: load {load_stage.busy_time:.2f}s, pose estimation {pose_stage.busy_time:.2f}s, "
+          f"processing {process_time['processing'] - process_time['waiting']:.2f}s (+{process_time['waiting']:.2f}s waiting for poses), "
+          f"writing {writer.busy_time:.2f}s, video total {time.perf_counter() - video_start:.2f}s")
+    if body_estimation.cache is not None:
+        print(f"pose cache: {body_estimation.cache.hits} hits, {body_estimation.cache.misses} misses")
+
+    # (frames, persons, 18, 2) normalized keypoints and (frames, persons) presence of the video
+    normalized_keypoints_video = np.full((num_frames, total_num_person, 18, 2), np.nan)
+    normalized_present_video = np.zeros((num_frames, total_num_person), dtype=bool)
+    for frame, (normalized_keypoints_per_frame, normalized_present_per_frame) in enumerate(zip(normalized_keypoints_data, normalized_present_data)):
+        normalized_keypoints_video[frame, :len(normalized_keypoints_per_frame)] = normalized_keypoints_per_frame
+        normalized_present_video[frame, :len(normalized_present_per_frame)] = normalized_present_per_frame
 
     for person_id in range(total_num_person):
         # create motion preprocessed data txt file for each person in video
         motion_folder = output_folder + "person_" + str(person_id) + "/motion_keypoints/"
-        motion_preprocess.preprocess_data(normalized_keypoints_data, person_id, motion_folder)
+        motion_preprocess.preprocess_data(normalized_keypoints_video, normalized_present_video, person_id, motion_folder)
+
+        # bit-packed store of the binary pose images of the person (pose_store), drawn again in one batch
+        if normalized_present_video[:, person_id].any():
+            binary_folder = output_folder + "person_" + str(person_id) + "/binary_pose/"
+            packed_poses = binarypose.rasterize_poses(normalized_keypoints_video[:, person_id], packed=True)
+            pose_store.save_poses(binary_folder, packed_poses, normalized_present_video[:, person_id])
 
         # save hand_regions (original coordinates) sequence of person in a txt file
         handregion.save_hand_regions_txt(output_folder,orig_hand_regions_of_vid)
@@ -262,85 +381,9 @@ def create_data(dataset_folder, video_label, data_folder, display_animation = Fa
     return num_frames, total_num_person
 
 
+# number of frames and persons of the video labels csv file of a video
 def get_num_frames_person(data_folder, video_name):
-    csv_file = os.path.join(data_folder, video_name, "video_labels.csv")
-
-    with open(csv_file, 'r') as file:
-        csv_reader = csv.reader(file)
-        rows = sum(1 for row in csv_reader)
-        file.seek(0)  # Reset the file pointer to the beginning
-        header = next(csv_reader)
-        columns = len(header)
-
-    num_frames = rows - 1
-    num_persons = columns - 1
+    # the labels are parsed once and shared with the datasets (label_index)
+    num_frames, num_persons = label_index.load_video_labels(data_folder, video_name).shape
 
     return num_frames, num_persons
-
-# Calculate the average distance of two keypoints set
-def distance_of_persons(p1, p2):
-    kps1 = p1['keypoints']
-    kps2 = p2['keypoints']
-
-    sum_distance = 0
-    match_ctr = 0
-
-    for i in range(18):
-        kp1 = kps1[i]
-        kp2 = kps2[i]
-
-        x1 = kp1['x']
-        y1 = kp1['y']
-        x2 = kp2['x']
-        y2 = kp2['y']
-
-        if kp1['confidence'] > 0 and kp2['confidence'] > 0:
-            distance = math.sqrt((x2 - x1)**2 + (y2 - y1)**2)
-            sum_distance += distance
-            match_ctr += 1
-    if match_ctr == 0:
-        ave_distance = float('inf')
-    else:
-        ave_distance = sum_distance / match_ctr
-
-    return ave_distance
-
-
-# Arranged the current list of persons to match the previous list
-def reorder_persons(prev_persons, current_persons):
-    reordered_persons = [None] * len(prev_persons)
-    # initialize list to contain all possible pairs of a prev and current person
-    person_pairs = [] # (distance, prev_id, current_id)
-
-    # store all possible pairs
-    for prev_id in range(len(prev_persons)):
-        for current_id in range(len(current_persons)):
-            prev_person = prev_persons[prev_id]
-            current_person = current_persons[current_id]
-            if prev_person is not None and current_person is not None:
-                distance = distance_of_persons(prev_person, current_person)
-
-                pair = (distance, prev_id, current_id)
-                person_pairs.append(pair)
-        
-    # sort the pairs from shortest distance to longest
-    person_pairs = sorted(person_pairs, key=lambda x: x[0])
-
-    for pair in person_pairs:
-        prev_id = pair[1]
-        current_id = pair[2]
-
-        if prev_persons[prev_id] is not None and current_persons[current_id] is not None:
-            # Place the current person at the same position as its paired previous person
-            reordered_persons[prev_id] = current_persons[current_id]
-
-            # Removed the used persons
-            prev_persons[prev_id] = None
-            current_persons[current_id] = None
-    
-    # For all unmatched current persons, add them as a new person id
-    for person in current_persons:
-        if person is not None:
-            reordered_persons.append(person)
-
-    return reordered_persons
\ No newline at end of file
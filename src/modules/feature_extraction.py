@@ -0,0 +1,187 @@
+import os
+import time
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset, DataLoader
+from torchvision import transforms
+from src.modules import feature_store, model_registry
+
+device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+# Darknet53 hand features (gun feature model, see model_registry) of the hand images of a data root,
+# written into the feature store of every video (see feature_store):
+#   extract_hand_features('data', batch_size=32, num_workers=4)
+# The hand images are read and preprocessed by DataLoader workers and run through the model in batches.
+# An image is skipped while its feature is current: in the store and the image not modified since the store was written.
+
+# 224x224 RGB input of the gun feature model from a BGR hand image: scaled to a width of 416,
+# padded with black to 416x416 and resized to 224x224
+def hand_image_input(hand_image):
+    hand_image = cv2.cvtColor(hand_image, cv2.COLOR_BGR2RGB)
+
+    original_height, original_width = hand_image.shape[:2]
+
+    target_width = 416
+
+    # Calculate the scaling factor for the width to make it 416
+    scale_factor = target_width / original_width
+    scaled_image = cv2.resize(hand_image, (target_width, int(original_height * scale_factor)))
+
+    # Calculate the necessary padding for height
+    original_height, original_width = scaled_image.shape[:2]
+    target_height = 416
+
+    padding_height = max(target_height - original_height, 0)
+
+    # Calculate the top and bottom padding dimensions
+    top = padding_height // 2
+    bottom = padding_height - top
+
+    # Pad the image to achieve the final size of 416x416
+    padded_image = cv2.copyMakeBorder(scaled_image, top, bottom, 0, 0, cv2.BORDER_CONSTANT, value=(0, 0, 0))
+
+    # TEMPORARY: resize the image to 224
+    return cv2.resize(padded_image, (224, 224))
+
+# (batch, 1024) float32 features of a batch of (batch, 3, 224, 224) model inputs
+def batch_features(gun_model, images):
+    with torch.inference_mode():
+        return gun_model(images.to(device)).reshape(len(images), -1).float().cpu().numpy()
+
+# compute and store the feature of a black image (used for the frames without a hand) in the data folder
+def save_black_feature(data_folder, gun_model):
+    black_image = transforms.ToTensor()(np.zeros((224, 224, 3), dtype=np.uint8)).unsqueeze(0)
+    feature_store.save_black_feature(data_folder, batch_features(gun_model, black_image)[0])
+    print("Black Feature stored in : ", os.path.join(data_folder, feature_store.black_file))
+
+# features of model inputs added one by one, run through the model batch_size inputs at a time
+#   batcher = FeatureBatcher(gun_model, batch_size)
+#   batcher.add(key, hand_input) # 224x224 RGB image (handimage.create_hand_input)
+#   batcher.flush()              # remaining inputs
+#   batcher.features             # {key: (1024,) float16 feature}
+class FeatureBatcher(object):
+    def __init__(self, gun_model, batch_size=32):
+        self.gun_model = gun_model
+        self.batch_size = batch_size
+        self.keys = []
+        self.images = []
+        self.features = {}
+        # seconds spent in the model
+        self.busy_time = 0
+
+    def add(self, key, hand_input):
+        self.keys.append(key)
+        self.images.append(transforms.ToTensor()(hand_input))
+        if len(self.images) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if not self.images:
+            return
+        start = time.perf_counter()
+        features = batch_features(self.gun_model, torch.stack(self.images)).astype(np.float16)
+        self.features.update(zip(self.keys, features))
+        self.keys, self.images = [], []
+        self.busy_time += time.perf_counter() - start
+
+# (index, 3x224x224 input tensor) of hand image files, decoded and preprocessed by the DataLoader workers
+class HandImageDataset(Dataset):
+    def __init__(self, hand_paths):
+        self.hand_paths = hand_paths
+
+    def __len__(self):
+        return len(self.hand_paths)
+
+    def __getitem__(self, index):
+        return index, transforms.ToTensor()(hand_image_input(cv2.imread(self.hand_paths[index])))
+
+# {(person_id, frame_num): hands_N.png path} of the hand images of a video
+def _video_hand_images(video_folder):
+    hand_images = {}
+    for person_name in os.listdir(video_folder):
+        hand_folder = os.path.join(video_folder, person_name, 'hand_image')
+        if not person_name.startswith('person_') or not person_name[len('person_'):].isdigit() or not os.path.isdir(hand_folder):
+            continue
+        for file_name in os.listdir(hand_folder):
+            frame = file_name[len('hands_'):-len('.png')]
+            if file_name.startswith('hands_') and file_name.endswith('.png') and frame.isdigit():
+                hand_images[int(person_name[len('person_'):]), int(frame)] = os.path.join(hand_folder, file_name)
+    return hand_images
+
+# hand images of a video whose feature is not current, [((person_id, frame_num), path)]
+def _pending_images(video_folder, hand_images, force):
+    features, present = feature_store.load_store(video_folder)
+    if force or features is None:
+        return sorted(hand_images.items())
+    stored_time = os.stat(os.path.join(video_folder, feature_store.features_file)).st_mtime_ns
+    pending = []
+    for (person_id, frame_num), hand_path in sorted(hand_images.items()):
+        stored = person_id < present.shape[0] and frame_num < present.shape[1] and present[person_id, frame_num]
+        if not stored or os.stat(hand_path).st_mtime_ns > stored_time:
+            pending.append(((person_id, frame_num), hand_path))
+    return pending
+
+# extract and store the features of the hand images of the videos of a data folder (all videos if video_names is None)
+# and the black image feature, returns (number of images extracted, seconds of the extraction)
+# force: extract every image, also the current ones
+def extract_hand_features(data_folder, video_names=None, batch_size=32, num_workers=2, force=False):
+    start = time.perf_counter()
+    if video_names is None:
+        video_names = sorted(name for name in os.listdir(data_folder) if os.path.isdir(os.path.join(data_folder, name)))
+
+    # images to extract and their position in the store of their video
+    hand_paths, positions = [], []
+    for video_name in video_names:
+        video_folder = os.path.join(data_folder, str(video_name))
+        hand_images = _video_hand_images(video_folder)
+        pending = _pending_images(video_folder, hand_images, force)
+        print(f"Checking video folder : {video_folder}: {len(hand_images)} hand images, {len(pending)} to extract")
+        for (person_id, frame_num), hand_path in pending:
+            hand_paths.append(hand_path)
+            positions.append((str(video_name), person_id, frame_num))
+
+    black_path = os.path.join(data_folder, feature_store.black_file)
+    if not hand_paths and not force and os.path.isfile(black_path):
+        print("All hand features are current")
+        return 0, time.perf_counter() - start
+    gun_model = model_registry.get_gun_feature_model()
+
+    if force or not os.path.isfile(black_path):
+        save_black_feature(data_folder, gun_model)
+
+    # stores of the videos with images to extract, sized for all their hand images
+    stores = {}
+    for video_name in sorted(set(position[0] for position in positions)):
+        video_positions = np.array([position[1:] for position in positions if position[0] == video_name])
+        stores[video_name] = feature_store.open_store(os.path.join(data_folder, video_name), *(video_positions.max(axis=0) + 1))
+
+    loader = DataLoader(HandImageDataset(hand_paths), batch_size=batch_size, num_workers=num_workers,
+                        pin_memory=torch.cuda.is_available())
+    num_images = 0
+    extract_start = time.perf_counter()
+    for indexes, images in loader:
+        features = batch_features(gun_model, images).astype(np.float16)
+        batch_positions = [positions[index] for index in indexes.tolist()]
+        # one write per video of the batch
+        for video_name in sorted(set(position[0] for position in batch_positions)):
+            rows = [row for row, position in enumerate(batch_positions) if position[0] == video_name]
+            person_ids = [batch_positions[row][1] for row in rows]
+            frame_nums = [batch_positions[row][2] for row in rows]
+            store_features, store_present = stores[video_name]
+            store_features[person_ids, frame_nums] = features[rows]
+            store_present[person_ids, frame_nums] = True
+        num_images += len(indexes)
+        seconds = time.perf_counter() - extract_start
+        print(f'Extracting...[{num_images}/{len(hand_paths)}] {num_images / max(seconds, 1e-9):.2f} images/sec      ', end='\r')
+
+    # presence saved after the features, an interrupted run extracts the images again
+    for video_name, (store_features, store_present) in stores.items():
+        store_features.flush()
+        feature_store.save_present(os.path.join(data_folder, video_name), store_present)
+    stores.clear()
+
+    seconds = time.perf_counter() - extract_start
+    print(f"\nExtracted {num_images} hand images in {seconds:.1f}s, {num_images / max(seconds, 1e-9):.2f} images/sec "
+          f"(batch size {batch_size}, {num_workers} workers), total {time.perf_counter() - start:.1f}s")
+    return num_images, seconds
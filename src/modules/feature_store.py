@@ -0,0 +1,135 @@
+import os
+import numpy as np
+import torch
+
+# Hand feature store of a video (Darknet53 features of the hand images, see feature_extraction),
+# replacing the hands_N.pt file of every hand image:
+#   data/<video>/hand_features.npy:         (persons, frames, 1024) float16
+#   data/<video>/hand_features_present.npy: (persons, frames) bool, frames that have a hand image feature
+#   data/darknet_black_feature.npy:         (1024,) float16 feature of a black hand image, used for the frames without a hand
+# The arrays are memory-mapped, a window of features is a slice of the store (no unpickling, no per-frame file).
+
+features_file = 'hand_features.npy'
+present_file = 'hand_features_present.npy'
+black_file = 'darknet_black_feature.npy'
+legacy_black_path = 'data/darknet_black_feature_tensor.pt'
+feature_size = 1024
+
+# writable (persons, frames, 1024) float16 store of a video, filled by the caller, all zeros and not present
+# returns (features, present), save the presence with save_present once the features are written
+def create_store(video_folder, num_persons, num_frames):
+    features = np.lib.format.open_memmap(os.path.join(video_folder, features_file), mode='w+', dtype=np.float16,
+                                         shape=(num_persons, num_frames, feature_size))
+    present = np.zeros((num_persons, num_frames), dtype=bool)
+    return features, present
+
+# writable store of a video with at least num_persons x num_frames, the existing store (opened in place) or
+# a new one holding the features of the existing store if it is smaller
+# returns (features, present), save the presence with save_present once the features are written
+def open_store(video_folder, num_persons, num_frames):
+    features, present = load_store(video_folder)
+    if features is not None and features.shape[0] >= num_persons and features.shape[1] >= num_frames:
+        return np.load(os.path.join(video_folder, features_file), mmap_mode='r+'), np.array(present)
+    old_features = np.array(features) if features is not None else np.zeros((0, 0, feature_size), dtype=np.float16)
+    old_present = np.array(present) if present is not None else np.zeros((0, 0), dtype=bool)
+    del features, present
+    old_persons, old_frames = old_present.shape
+    features, present = create_store(video_folder, max(num_persons, old_persons), max(num_frames, old_frames))
+    features[:old_persons, :old_frames] = old_features
+    present[:old_persons, :old_frames] = old_present
+    return features, present
+
+def save_present(video_folder, present):
+    np.save(os.path.join(video_folder, present_file), np.asarray(present, dtype=bool))
+
+# (features, present) of the store of a video, memory-mapped read only, (None, None) without a store
+def load_store(video_folder):
+    features_path = os.path.join(video_folder, features_file)
+    present_path = os.path.join(video_folder, present_file)
+    if not os.path.isfile(features_path) or not os.path.isfile(present_path):
+        return None, None
+    return np.load(features_path, mmap_mode='r'), np.load(present_path, mmap_mode='r')
+
+def save_black_feature(data_folder, feature):
+    np.save(os.path.join(data_folder, black_file), np.asarray(feature, dtype=np.float16).reshape(feature_size))
+
+# (1, 1024) float tensor of the black image feature of a data folder, like a hands_N.pt file,
+# from the previous darknet_black_feature_tensor.pt if the data folder has no store of it
+def load_black_feature(data_folder):
+    black_path = os.path.join(data_folder, black_file)
+    if os.path.isfile(black_path):
+        return torch.from_numpy(np.load(black_path).astype(np.float32)).reshape(1, feature_size)
+    return torch.load(legacy_black_path).reshape(1, feature_size)
+
+# write the store of a video from the hands_N.pt files of its persons (and the black feature of the data folder
+# from darknet_black_feature_tensor.pt), returns (persons, frames) of the store
+def convert_feature_tensors(data_folder, video_name):
+    video_folder = os.path.join(data_folder, str(video_name))
+    person_frames = {}
+    for name in os.listdir(video_folder):
+        hand_folder = os.path.join(video_folder, name, 'hand_image')
+        if name.startswith('person_') and name[len('person_'):].isdigit() and os.path.isdir(hand_folder):
+            person_frames[int(name[len('person_'):])] = [int(file_name[len('hands_'):-len('.pt')]) for file_name in os.listdir(hand_folder)
+                                                          if file_name.startswith('hands_') and file_name.endswith('.pt')
+                                                          and file_name[len('hands_'):-len('.pt')].isdigit()]
+    num_persons = max(person_frames) + 1 if person_frames else 0
+    num_frames = max([max(frames) + 1 for frames in person_frames.values() if frames] + [0])
+
+    features, present = create_store(video_folder, num_persons, num_frames)
+    for person_id, frames in person_frames.items():
+        for frame_num in frames:
+            feature_path = os.path.join(video_folder, f'person_{person_id}', 'hand_image', f'hands_{frame_num}.pt')
+            features[person_id, frame_num] = torch.load(feature_path, map_location='cpu').detach().reshape(feature_size).numpy()
+            present[person_id, frame_num] = True
+    features.flush()
+    del features
+    save_present(video_folder, present)
+    if not os.path.isfile(os.path.join(data_folder, black_file)) and os.path.isfile(legacy_black_path):
+        save_black_feature(data_folder, torch.load(legacy_black_path, map_location='cpu').detach().numpy())
+    return num_persons, num_frames
+
+# hand features of one person, from the store of its video (memory-mapped) or, for the frames not in the store,
+# from its hands_N.pt files
+#   features = PersonFeatures(hand_folder, hand_mask, store_features, store_present, person_id, black_feature)
+#   features.get(frame_num)                 # (1, 1024) float tensor, like a hands_N.pt file
+#   features.window(end_frame, window_size) # (window_size, 1, 1024), oldest first
+# hand_mask: (frames,) bool, frames that have a hand feature (sample_index), the black feature for the others
+# and the frames before the first frame
+class PersonFeatures(object):
+    def __init__(self, hand_folder, hand_mask, store_features, store_present, person_id, black_feature):
+        self.hand_folder = hand_folder
+        self.hand_mask = np.asarray(hand_mask, dtype=bool)
+        self.black_feature = black_feature
+        if store_features is not None and person_id < len(store_features):
+            self.features, self.present = store_features[person_id], store_present[person_id]
+        else:
+            self.features, self.present = None, np.zeros(0, dtype=bool)
+
+    # True if every hand feature of the person is in the store
+    @property
+    def stored(self):
+        present = np.zeros(len(self.hand_mask), dtype=bool)
+        present[:len(self.present)] = self.present[:len(self.hand_mask)]
+        return not np.any(self.hand_mask & ~present)
+
+    def get(self, frame_num):
+        if frame_num < len(self.present) and self.present[frame_num]:
+            return torch.from_numpy(self.features[frame_num].astype(np.float32)).unsqueeze(0)
+        return torch.load(os.path.join(self.hand_folder, f'hands_{frame_num}.pt'))
+
+    def window(self, end_frame, window_size):
+        start = end_frame - window_size + 1
+        window = np.tile(self.black_feature.reshape(1, feature_size).numpy(), (window_size, 1))
+        # one slice of the store for the stored frames of the window
+        first, last = max(start, 0), min(end_frame + 1, len(self.present))
+        stored = np.zeros(window_size, dtype=bool)
+        if last > first:
+            stored[first - start:last - start] = self.present[first:last]
+            window[stored] = self.features[first:last][stored[first - start:last - start]]
+        hands = np.zeros(window_size, dtype=bool)
+        first, last = max(start, 0), min(end_frame + 1, len(self.hand_mask))
+        if last > first:
+            hands[first - start:last - start] = self.hand_mask[first:last]
+        for i in np.nonzero(hands & ~stored)[0]:
+            window[i] = self.get(start + i).reshape(feature_size).numpy()
+        return torch.from_numpy(window).unsqueeze(1)
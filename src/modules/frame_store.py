@@ -0,0 +1,31 @@
+import numpy as np
+import torch
+
+# Frames of one person (hand images or hand feature tensors) stacked once and shared by the overlapping
+# windows of the LSTM datasets, instead of a copy of the whole window per sample.
+#   store = PersonFrames(frames, frame_nums, black_frame, num_frames)
+#   window = store.window(end_frame, window_size) # frames end_frame - window_size + 1 .. end_frame
+# Frames before the first frame of the video or without a hand are the black frame.
+class PersonFrames(object):
+    # frames: tensors of the frames frame_nums (same shape), black_frame: tensor used for the missing frames
+    def __init__(self, frames, frame_nums, black_frame, num_frames):
+        self.frames = torch.stack(list(frames) + [black_frame])
+        self.black_row = len(frame_nums)
+        # row of every frame in self.frames
+        self.rows = np.full(num_frames, self.black_row, dtype=np.int64)
+        self.rows[np.asarray(frame_nums, dtype=np.int64)] = np.arange(len(frame_nums))
+
+    # rows of the frames of the window ending at end_frame, oldest first
+    def window_rows(self, end_frame, window_size):
+        rows = np.full(window_size, self.black_row, dtype=np.int64)
+        start = end_frame - window_size + 1
+        rows[max(-start, 0):] = self.rows[max(start, 0):end_frame + 1]
+        return rows
+
+    # (window_size, *frame shape) frames of the window ending at end_frame, a view of the store when the
+    # rows of the window are consecutive, else a copy
+    def window(self, end_frame, window_size):
+        rows = self.window_rows(end_frame, window_size)
+        if np.all(np.diff(rows) == 1):
+            return self.frames[rows[0]:rows[-1] + 1]
+        return self.frames[torch.from_numpy(rows)]
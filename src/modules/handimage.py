@@ -18,7 +18,8 @@ torch.backends.cudnn.deterministic=True
 
 # Return concatenated image of hand regions
 # size: 2 x 1 
-def create_hand_image(image, hand_regions, frame_image_shape, output_image_width, frame_number, folder_path, save=True):
+# writer: pipeline.AsyncWriter the image is saved by, saved immediately if None
+def create_hand_image(image, hand_regions, frame_image_shape, output_image_width, frame_number, folder_path, save=True, writer=None):
     output_image_size = (output_image_width * 2 , output_image_width)
     hand_image_size = (output_image_width , output_image_width)
     images_list = []
@@ -71,7 +72,10 @@ def create_hand_image(image, hand_regions, frame_image_shape, output_image_width
             os.makedirs(folder_path)
 
         # Save Image
-        cv2.imwrite(file_name, concatenated_cropped)
+        if writer is None:
+            cv2.imwrite(file_name, concatenated_cropped)
+        else:
+            writer.submit(cv2.imwrite, file_name, concatenated_cropped)
 
         # Print Log
         print(f'Hands Image Save in: {file_name}')
@@ -80,6 +84,47 @@ def create_hand_image(image, hand_regions, frame_image_shape, output_image_width
     else:
         return concatenated_cropped, ""
 
+# side of the gun feature model input, and of a hand slot in it: the 2 x 1 hand image letterboxed to a square
+# (feature_extraction.hand_image_input) leaves the hands in the middle half of the rows
+hand_input_width = 224
+hand_slot_width = hand_input_width // 2
+
+# 224x224 RGB gun feature model input of the hand regions of a frame, the same layout as create_hand_image followed by
+# feature_extraction.hand_image_input but warped directly from the frame: every hand region is cropped, squared and
+# scaled into its slot by one affine warp, without the hand image and its resizes in between
+# Returns None if the hand image would be blank
+def create_hand_input(image, hand_regions, frame_image_shape):
+    hand_input = np.zeros((hand_input_width, hand_input_width, 3), dtype=np.uint8)
+    top = (hand_input_width - hand_slot_width) // 2
+
+    # if not combined hand region, one slot per hand, else the combined region in the horizontal center
+    if len(hand_regions) > 1:
+        slots = [(slot * hand_slot_width, hand_region) for slot, hand_region in enumerate(hand_regions[:2])]
+    else:
+        slots = [((hand_input_width - hand_slot_width) // 2, hand_regions[0])]
+
+    image_is_blank = True
+    for left, hand_region in slots:
+        if hand_region is None:
+            continue
+        cropped_image = image[max(hand_region[1],0):min(hand_region[3],frame_image_shape[1]), max(hand_region[0],0):min(hand_region[2],frame_image_shape[0])]
+        if cropped_image.size == 0 or not cropped_image.any():
+            continue
+        image_is_blank = False
+
+        # centered in a black square (make_image_square) scaled to the slot, pixel centers mapped onto pixel centers
+        height, width = cropped_image.shape[:2]
+        square_size = max(height, width)
+        scale = hand_slot_width / square_size
+        matrix = np.float32([[scale, 0, ((square_size - width) // 2 + 0.5) * scale - 0.5],
+                             [0, scale, ((square_size - height) // 2 + 0.5) * scale - 0.5]])
+        hand_input[top:top + hand_slot_width, left:left + hand_slot_width] = cv2.warpAffine(
+            cropped_image, matrix, (hand_slot_width, hand_slot_width), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+
+    if image_is_blank:
+        return None
+    return cv2.cvtColor(hand_input, cv2.COLOR_BGR2RGB)
+
 def make_image_square(image, size):
     height, width, _ = image.shape
 
@@ -17,24 +17,35 @@ torch.backends.cudnn.enabled = False
 torch.backends.cudnn.deterministic=True
 
 # Main function
+# person: (18, 3) keypoints array of one person (see bodykeypoints)
 # return:
 # [combined_box] or [boxL, boxR]
 # each box is [x_min,y_min,x_max,y_max] or None
-def extract_hand_regions(keypoints, threshold = 0.9):
-    #Keypoints for hand region extraction
-    left_wrist = keypoints['keypoints'][4]
-    right_wrist = keypoints['keypoints'][7]
-    left_elbow = keypoints['keypoints'][3]
-    right_elbow = keypoints['keypoints'][6]
-    
-    
-    # get boxes before overlap checking
-    box_left = _extract_hand_region(left_wrist, left_elbow)
-    box_right = _extract_hand_region(right_wrist, right_elbow)
+def extract_hand_regions(person, threshold = 0.9):
+    return extract_hand_regions_frame(person[None], threshold)[0]
 
-    # check overlap
-    hand_regions = _hand_region_iou(box_left, box_right, threshold)
+# hand regions of all persons of a frame at once
+# persons: (persons, 18, 3) keypoints array
+# returns the hand regions of extract_hand_regions for every person
+def extract_hand_regions_frame(persons, threshold = 0.9):
+    #Keypoints for hand region extraction (left, right)
+    wrists = persons[:, [4, 7], 0:2]
+    elbows = persons[:, [3, 6], 0:2]
 
+    # get boxes before overlap checking, (persons, 2, 4)
+    boxes, found = _extract_hand_region(wrists, elbows)
+
+    # check overlap
+    combine = found.all(axis=1)
+    combine[combine] = _bb_modified_iou(boxes[combine, 0], boxes[combine, 1]) > threshold
+    combined_boxes = np.concatenate([np.minimum(boxes[:, 0, 0:2], boxes[:, 1, 0:2]), np.maximum(boxes[:, 0, 2:4], boxes[:, 1, 2:4])], axis=1)
+
+    hand_regions = []
+    for person_id in range(len(persons)):
+        if combine[person_id]:
+            hand_regions.append([[int(v) for v in combined_boxes[person_id]]])
+        else:
+            hand_regions.append([[int(v) for v in boxes[person_id, side]] if found[person_id, side] else None for side in range(2)])
     return hand_regions
 
 # takes the hand regions coordinates of a resized image
@@ -75,78 +86,47 @@ def _draw_hand_box(canvas, box):
     if box is not None:
         cv2.rectangle(canvas, (box[0], box[1]), (box[2], box[3]), (0, 0, 255), 2) 
 
-# Extract one hand region
+# Extract hand regions from wrist and elbow (..., 2) coordinates
+# returns the (..., 4) boxes [x_min,y_min,x_max,y_max] and whether both keypoints are detected
 def _extract_hand_region(wrist, elbow):
     # Add bounding box of hand area based on wrist and elbow
-    if elbow['confidence'] > 0 and wrist['confidence'] > 0:
-        # approximate the position of the gun (center) by moving the wrist position further
-        extend_ratio = 0.40 # ratio of elbow to wrist distance portion to extend the wrist position
-        # extend_ratio = 0.70
-        x_center = wrist['x'] + int((wrist['x'] - elbow['x']) * extend_ratio) 
-        y_center = wrist['y'] + int((wrist['y'] - elbow['y']) * extend_ratio)
-
-        # scale_ratio = 0.6
-        scale_ratio = 1
-        radius = max(abs(x_center - elbow['x']),
-                    abs(y_center - elbow['y']))
-        radius = int(radius * scale_ratio)
-
-        x_min = x_center - radius
-        y_min = y_center - radius
-        x_max = x_center + radius
-        y_max = y_center + radius
-        return [x_min,y_min,x_max,y_max]
-    else:
-        return None
-
-# check if 2 hand region boxes should be combined based on iou, return box/s
-def _hand_region_iou(boxL, boxR, threshold):
-    if boxL is None or boxR is None:
-        return [boxL, boxR]
-    iou = _bb_modified_iou(boxL,boxR)
-    if iou > threshold: #if above threshold, combine boxes
-        l_x_min = boxL[0]
-        l_y_min = boxL[1]
-        l_x_max = boxL[2]
-        l_y_max = boxL[3]
-
-        r_x_min = boxR[0]
-        r_y_min = boxR[1]
-        r_x_max = boxR[2]
-        r_y_max = boxR[3]
-
-        x_min = min(l_x_min, r_x_min)
-        y_min = min(l_y_min, r_y_min)
-        x_max = max(l_x_max, r_x_max)
-        y_max = max(l_y_max, r_y_max)
-
-        combined_box = [x_min,y_min,x_max,y_max]
-        return [combined_box]
-    else:
-        return [boxL, boxR]
+    found = ~np.isnan(wrist[..., 0]) & ~np.isnan(elbow[..., 0])
+    wrist = np.where(found[..., None], wrist, 0).astype(np.int64)
+    elbow = np.where(found[..., None], elbow, 0).astype(np.int64)
+
+    # approximate the position of the gun (center) by moving the wrist position further
+    extend_ratio = 0.40 # ratio of elbow to wrist distance portion to extend the wrist position
+    # extend_ratio = 0.70
+    center = wrist + np.trunc((wrist - elbow) * extend_ratio).astype(np.int64)
+
+    # scale_ratio = 0.6
+    scale_ratio = 1
+    radius = np.abs(center - elbow).max(axis=-1)
+    radius = np.trunc(radius * scale_ratio).astype(np.int64)
+
+    boxes = np.concatenate([center - radius[..., None], center + radius[..., None]], axis=-1)
+    return boxes, found
 
 # get intersection over min area of 2 boxes
 # modified iou to have higher score for boxes of different sizes
+# boxA, boxB: (..., 4) arrays
 def _bb_modified_iou(boxA, boxB):
-	# determine the (x, y)-coordinates of the intersection rectangle
-	xA = max(boxA[0], boxB[0])
-	yA = max(boxA[1], boxB[1])
-	xB = min(boxA[2], boxB[2])
-	yB = min(boxA[3], boxB[3])
-	# compute the area of intersection rectangle
-	interArea = max(0, xB - xA + 1) * max(0, yB - yA + 1)
-	# compute the area of both the prediction and ground-truth
-	# rectangles
-	boxAArea = (boxA[2] - boxA[0] + 1) * (boxA[3] - boxA[1] + 1)
-	boxBArea = (boxB[2] - boxB[0] + 1) * (boxB[3] - boxB[1] + 1)
-	# compute the intersection over union by taking the intersection
-	# area and dividing it by the sum of prediction + ground-truth
-	# areas - the interesection area
+    # determine the (x, y)-coordinates of the intersection rectangle
+    xA = np.maximum(boxA[..., 0], boxB[..., 0])
+    yA = np.maximum(boxA[..., 1], boxB[..., 1])
+    xB = np.minimum(boxA[..., 2], boxB[..., 2])
+    yB = np.minimum(boxA[..., 3], boxB[..., 3])
+    # compute the area of intersection rectangle
+    interArea = np.maximum(0, xB - xA + 1) * np.maximum(0, yB - yA + 1)
+    # compute the area of both the prediction and ground-truth
+    # rectangles
+    boxAArea = (boxA[..., 2] - boxA[..., 0] + 1) * (boxA[..., 3] - boxA[..., 1] + 1)
+    boxBArea = (boxB[..., 2] - boxB[..., 0] + 1) * (boxB[..., 3] - boxB[..., 1] + 1)
 
     # iou = interArea / float(boxAArea + boxBArea - interArea)
-	iou = interArea / min(boxAArea, boxBArea)
-	# return the intersection over union value
-	return iou
+    iou = interArea / np.minimum(boxAArea, boxBArea)
+    # return the intersection over union value
+    return iou
 
 # Save a text file of the hand_regions sequence
 def save_hand_regions_txt(output_folder, hand_regions_of_vid):
@@ -0,0 +1,45 @@
+import csv
+import os
+import numpy as np
+
+# Labels of a created video (video_labels.csv, see annotator.save_video_labels_csv) parsed once into a
+# (frames, persons) int8 array, so a label lookup is an index instead of a scan of the csv file.
+# Parsed files are kept per path and parsed again only when the file changes (modification time / size).
+
+no_label = -1 # person without a label in a frame (empty or missing csv cell)
+
+_labels_of_file = {}
+
+# (frames, persons) int8 labels of a video_labels.csv file, no_label where a person has no label
+def read_labels(csv_file):
+    with open(csv_file, 'r') as file:
+        rows = list(csv.reader(file))
+    header, rows = rows[0], rows[1:]
+    labels = np.full((len(rows), len(header) - 1), no_label, dtype=np.int8)
+    for frame_num, row in enumerate(rows):
+        for person_id, value in enumerate(row[1:len(header)]):
+            if value:
+                labels[frame_num, person_id] = int(value)
+    return labels
+
+# (frames, persons) labels of a video in the data folder, read only and shared by the callers
+def load_video_labels(data_folder, video_name):
+    csv_file = os.path.join(data_folder, str(video_name), "video_labels.csv")
+    stat = os.stat(csv_file)
+    version = (stat.st_mtime_ns, stat.st_size)
+    cached = _labels_of_file.get(csv_file)
+    if cached is None or cached[0] != version:
+        labels = read_labels(csv_file)
+        labels.flags.writeable = False
+        cached = (version, labels)
+        _labels_of_file[csv_file] = cached
+    return cached[1]
+
+# label of a person in a frame as written in the csv file ('0', '1', ...), None if the person has no label in the frame
+def get_label(labels, person_id, frame_num):
+    if frame_num >= labels.shape[0] or person_id >= labels.shape[1]:
+        return None
+    label = labels[frame_num, person_id]
+    if label == no_label:
+        return None
+    return str(label)
@@ -0,0 +1,178 @@
+import time
+import copy
+import threading
+import torch
+import numpy as np
+import random, os
+
+# Set a random seed for reproducibility
+torch.manual_seed(12)
+torch.cuda.manual_seed(12)
+np.random.seed(12)
+random.seed(12)
+os.environ['PYTHONHASHSEED'] = str(12)
+torch.cuda.manual_seed_all(12)
+torch.backends.cudnn.benchmark = False
+torch.backends.cudnn.enabled = False
+
+torch.backends.cudnn.deterministic=True
+
+# Process-wide registry of the models used by the pipeline.
+# Every model is loaded once per process on first use, put in eval mode and the same
+# instance is handed out afterwards, e.g.
+#   body_estimation = model_registry.get_body('model/body_pose_model.pth')
+#   trained_model, model_info = model_registry.get_trained_model('model/GPM2.pt')
+# quantized=True hands out the INT8 version of a model instead (see quantization.py, CPU only)
+
+device = 'cuda:0' if torch.cuda.is_available() else 'cpu'
+
+# key -> model
+_models = {}
+
+# key -> {'load_time': seconds spent loading, 'hits': number of times handed out after loading}
+_load_stats = {}
+
+# reentrant because loaders may ask the registry for other models (backbone of a trained model)
+_lock = threading.RLock()
+
+def _get(key, loader):
+    with _lock:
+        if key in _models:
+            _load_stats[key]['hits'] += 1
+        else:
+            start = time.perf_counter()
+            _models[key] = loader()
+            _load_stats[key] = {'load_time': time.perf_counter() - start, 'hits': 0}
+        return _models[key]
+
+def _check_quantized_device(quantized):
+    if quantized and device != 'cpu':
+        raise RuntimeError("Quantized models run on the CPU only")
+
+# OpenPose body estimation model (src.body.Body)
+def get_body(model_path='model/body_pose_model.pth', quantized=False, **kwargs):
+    _check_quantized_device(quantized)
+    def loader():
+        from src.body import Body
+        body = Body(model_path, **kwargs)
+        if quantized:
+            from src.modules import quantization
+            quantization.quantize_body(body, quantization.calibration_frames())
+        return body
+    return _get(('body', model_path, 'int8' if quantized else None, tuple(sorted(kwargs.items()))), loader)
+
+# OpenPose hand estimation model (src.hand.Hand)
+def get_hand(model_path='model/hand_pose_model.pth', quantized=False):
+    _check_quantized_device(quantized)
+    def loader():
+        from src.hand import Hand
+        hand = Hand(model_path)
+        if quantized:
+            from src.modules import quantization
+            quantization.quantize_hand(hand, quantization.calibration_frames())
+        return hand
+    return _get(('hand', model_path, 'int8' if quantized else None), loader)
+
+# pretrained holocron darknet53
+# the shared instance must not be modified, use copy=True to get a private copy (e.g. to load other weights into)
+def get_darknet53(copy=False):
+    def loader():
+        from holocron.models import darknet53
+        return darknet53(pretrained=True).eval()
+    darknet_model = _get(('darknet53',), loader)
+    return _copy_model(darknet_model) if copy else darknet_model
+
+# darknet53 backbone without its classifier, used to compute the 1024 hand features
+# built on a private copy of darknet53, the wrapper freezes its parameters and moves it to the device
+def get_gun_feature_model(quantized=False):
+    _check_quantized_device(quantized)
+    def loader():
+        from src.modules.gun_yolo import CustomDarknet53_NoDense
+        gun_model = CustomDarknet53_NoDense(get_darknet53(copy=True))
+        if quantized:
+            from src.modules import quantization
+            return quantization.quantize_static(gun_model, quantization.calibration_hand_images(quantization.calibration_frames()))
+        gun_model.to(device)
+        return gun_model.eval()
+    return _get(('gun_feature_model', 'int8' if quantized else None), loader)
+
+# trained combined model (GPM, GPM2, GP, GPM-opt, GPM2-opt, GP-opt) from a training checkpoint
+# model_type overrides the type stored in the checkpoint
+# returns the model and the checkpoint's model_info
+def get_trained_model(checkpoint_path, model_type=None, quantized=False):
+    _check_quantized_device(quantized)
+    def loader():
+        from src.modules import motion_analysis
+        from src.modules.posecnn import poseCNN
+        from src.modules.gun_yolo import CustomDarknet53, GunLSTM, GunLSTM_Optimized, Gun_Optimized
+        from src.modules.combined_model import GPM1, GPM2, GP
+
+        checkpoint = torch.load(checkpoint_path, map_location=device)
+        model_info = checkpoint['model_info']
+        hidden_size = model_info['hidden_size']
+        lstm_layers = model_info['lstm_layers']
+        trained_type = model_type if model_type is not None else model_info['model_type']
+
+        pose_model = poseCNN()
+        if trained_type == 'GPM':
+            gun_model = CustomDarknet53(get_darknet53(copy=True))
+            motion_model = motion_analysis.MotionLSTM(hidden_size, lstm_layers)
+            combined_feature_size = 20 + 20 + hidden_size #total num of features of 3 model outputs
+            trained_model = GPM1(gun_model, pose_model, motion_model, combined_feature_size)
+        elif trained_type == 'GPM2':
+            gun_model = GunLSTM(get_darknet53(copy=True), hidden_size=hidden_size)
+            combined_feature_size = 20 + hidden_size #total num of features of 3 model outputs
+            trained_model = GPM2(gun_model, pose_model, combined_feature_size)
+        elif trained_type == 'GP':
+            gun_model = CustomDarknet53(get_darknet53(copy=True))
+            combined_feature_size = 20 + 20 #total num of features of 3 model outputs
+            trained_model = GP(gun_model, pose_model, combined_feature_size)
+        elif trained_type == 'GPM-opt':
+            gun_model = Gun_Optimized()
+            motion_model = motion_analysis.MotionLSTM(hidden_size, lstm_layers)
+            combined_feature_size = 20 + 20 + hidden_size #total num of features of 3 model outputs
+            trained_model = GPM1(gun_model, pose_model, motion_model, combined_feature_size)
+        elif trained_type == 'GPM2-opt':
+            gun_model = GunLSTM_Optimized(hidden_size, lstm_layers)
+            combined_feature_size = 20 + hidden_size #total num of features of 3 model outputs
+            trained_model = GPM2(gun_model, pose_model, combined_feature_size)
+        else:
+            gun_model = Gun_Optimized()
+            combined_feature_size = 20 + 20 #total num of features of 3 model outputs
+            trained_model = GPM2(gun_model, pose_model, combined_feature_size)
+
+        trained_model.load_state_dict(checkpoint['model_state_dict'])
+        trained_model.to(device)
+        trained_model.eval()
+        if quantized:
+            from src.modules import quantization
+            trained_model = quantization.quantize_trained_model(trained_model, quantization.calibration_pose_images())
+        return trained_model, model_info
+    return _get(('trained_model', checkpoint_path, model_type, 'int8' if quantized else None), loader)
+
+# drop a trained model from the registry (e.g. after evaluating one cross validation fold)
+def release_trained_model(checkpoint_path, model_type=None, quantized=False):
+    with _lock:
+        _models.pop(('trained_model', checkpoint_path, model_type, 'int8' if quantized else None), None)
+
+def _copy_model(model):
+    start = time.perf_counter()
+    model_copy = copy.deepcopy(model)
+    with _lock:
+        _load_stats[('darknet53',)]['copy_time'] = _load_stats[('darknet53',)].get('copy_time', 0) + time.perf_counter() - start
+    return model_copy
+
+# copy of the load metrics, {key: {'load_time': ..., 'hits': ...}}
+def load_stats():
+    with _lock:
+        return {key: dict(stats) for key, stats in _load_stats.items()}
+
+def print_load_stats():
+    stats = load_stats()
+    print("Model registry:")
+    for key, values in stats.items():
+        name = ' '.join(str(part) for part in key if part not in (None, ()))
+        line = f"\t{name}: loaded in {values['load_time']:.2f}s, reused {values['hits']} times"
+        if 'copy_time' in values:
+            line += f", {values['copy_time']:.2f}s spent copying"
+        print(line)
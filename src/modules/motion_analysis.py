@@ -16,45 +16,72 @@ torch.backends.cudnn.enabled = False
 torch.backends.cudnn.deterministic=True
 
 # load the and shift data into a numpy array based on window_size, returns list of sequence of data
+# (num_windows, window_size, 36) tensor, the windows are views of one copy of the sequence
 def load_data(file_path, window_size):
-    data = []
-    with open(file_path, 'r') as file:
-        lines = file.readlines()
-        if window_size > len(lines):
-            raise Exception("Timestep should not be greater than num of samples")
-        for i in range(window_size, len(lines) + 1):
-            sequence = []
-            for j in range(i - window_size, i):
-                line = lines[j].strip().split(',')
-                sequence.append([float(val) for val in line])
-            data.append(sequence)
-    data = np.array(data)
-    # transform into tensor
-    data = torch.tensor(data, dtype=torch.float32)
+    data = sequence_windows(load_sequence(file_path), window_size)
     return data
 
-# get one sequence of motion keypoint sets based on window size
-def get_one_sequence(file_path, frame_num, window_size):
-    data = []
+# (num_windows, window_size, 36) sliding windows of a (frames, 36) keypoint sequence as a strided view (unfold)
+# of a single float32 tensor copy of the sequence, window i ends at frame i + window_size - 1
+# pad: zero frames are prepended so there is one window per frame, window i ends at frame i (like get_window)
+def sequence_windows(sequence, window_size, pad=False):
+    sequence = np.asarray(sequence)
+    if pad:
+        data = np.zeros((len(sequence) + window_size - 1, sequence.shape[1]), dtype=np.float32)
+        data[window_size - 1:] = sequence
+    else:
+        if window_size > len(sequence):
+            raise Exception("Timestep should not be greater than num of samples")
+        data = np.array(sequence, dtype=np.float32)
+    # unfold gives (num_windows, 36, window_size)
+    return torch.from_numpy(data).unfold(0, window_size, 1).transpose(1, 2)
+
+# file names of the motion keypoint sequence of a person in its motion_keypoints folder
+# keypoints_seq.npy: (frames, 36) float32 array (x0, y0, x1, y1 .... x17, y17 per frame), written by motion_preprocess
+# keypoints_seq.txt: previous text format, one comma-separated frame per line, see convert_text_sequence
+sequence_file = 'keypoints_seq.npy'
+text_sequence_file = 'keypoints_seq.txt'
+
+# path of the keypoint sequence in a motion_keypoints folder, the text file if the folder has no .npy sequence
+def sequence_path(motion_folder_path):
+    file_path = os.path.join(motion_folder_path, sequence_file)
+    if not os.path.isfile(file_path) and os.path.isfile(os.path.join(motion_folder_path, text_sequence_file)):
+        return os.path.join(motion_folder_path, text_sequence_file)
+    return file_path
+
+# (frames, 36) float32 keypoint sequence, memory-mapped read only for .npy files, parsed for text files
+def load_sequence(file_path):
+    if file_path.endswith('.npy'):
+        return np.load(file_path, mmap_mode='r')
+    return _read_text_sequence(file_path)
+
+# parse a sequence of the text format, Null values are 0
+def _read_text_sequence(file_path):
     with open(file_path, 'r') as file:
-        lines = file.readlines()
+        lines = [line.strip().replace('Null', '0').split(',') for line in file if line.strip()]
+    return np.array(lines, dtype=np.float64).astype(np.float32).reshape(-1, 36)
+
+# write the .npy sequence of a keypoints_seq.txt file next to it, returns the path of the .npy file
+def convert_text_sequence(text_path):
+    file_path = os.path.join(os.path.dirname(text_path), sequence_file)
+    np.save(file_path, _read_text_sequence(text_path))
+    return file_path
 
-        if len(lines) <= frame_num:
-            raise ("frame num is not in the text file!")
+# (window_size, 36) window of a sequence ending at frame_num
+# a view of the sequence (no copy) unless the window starts before the first frame, which is padded with zeros
+def get_window(sequence, frame_num, window_size):
+    if len(sequence) <= frame_num:
+        raise Exception("frame num is not in the sequence!")
+    start = frame_num - (window_size - 1)
+    if start >= 0:
+        return sequence[start:frame_num + 1]
+    window = np.zeros((window_size, sequence.shape[1]), dtype=np.float32)
+    window[-start:] = sequence[:frame_num + 1]
+    return window
 
-        # if window_size > len(lines):
-        #     return None
-        sequence = []
-        for i in range(frame_num - (window_size - 1), frame_num + 1):
-            null_value = '0'
-            if i < 0:
-                line = [null_value] * 36
-            else:
-                line = lines[i].strip().replace('Null', null_value).split(',')
-            sequence.append([float(val) for val in line])
-        # data.append(sequence)
-        data=sequence
-    data = np.array(data)
+# get one sequence of motion keypoint sets based on window size
+def get_one_sequence(file_path, frame_num, window_size):
+    data = get_window(load_sequence(file_path), frame_num, window_size)
     # transform into tensor
     data = torch.tensor(data, dtype=torch.float32)
     return data
@@ -79,3 +106,12 @@ class MotionLSTM(nn.Module):
         out = out[:, -1, :]
         # out = self.fc(out)
         return out
+
+    # output of every frame of a (frames, 36) keypoint sequence, each from the window ending at the frame
+    # (zero padded before the first frame like the datasets), batch_size windows per forward
+    def sequence_features(self, sequence, window_size, batch_size=256):
+        windows = sequence_windows(sequence, window_size, pad=True)
+        device = next(self.parameters()).device
+        with torch.no_grad():
+            outputs = [self(windows[i:i + batch_size].to(device)) for i in range(0, len(windows), batch_size)]
+        return torch.cat(outputs)
@@ -19,58 +19,43 @@ torch.backends.cudnn.deterministic=True
 class PersonIDNotFoundError(Exception):
     pass
 
-# Create file keypoints_seq_[person_id].txt which stores keypoints of frame per line with format
-# x0, y0, x1, y1 .... x17, y17
-def preprocess_data(keypoints, person_id, folder_path):  
+# Create file keypoints_seq.npy which stores a (frames, 36) float32 array of the keypoints of every frame with format
+# x0, y0, x1, y1 .... x17, y17 (read with motion_analysis.load_sequence)
+# normalized_keypoints: (frames, persons, 18, 2) normalized keypoints of the video, NaN if not detected
+# present: (frames, persons) whether the person has normalized keypoints in the frame
+def preprocess_data(normalized_keypoints, present, person_id, folder_path):  
     null_value = 999
-    keypoints_sequence = _get_normalized(keypoints, person_id, null_value)
+    keypoints_sequence = _get_normalized(normalized_keypoints, present, person_id, null_value)
 
     file_path = _save_keypoints(keypoints_sequence, person_id, folder_path)
     return file_path
 
-# gets the normalized keypoints and return a list (per frame) of a list of body keypoints (x0, y0, x1, y1 .... x17, y17) 
-def _get_normalized(normalized_keypoints, person_id, null_value_kps = 999, null_value_person = 0):
-    keypoint_sequences = []
-
-    for frame_data in normalized_keypoints: 
-        # print(frame_data)
-        if len(frame_data) < person_id+1:
-            keypoint_set = [null_value_person] * 36
-        else:
-            person_keypoints = frame_data[person_id]
-            if person_keypoints is None:
-                keypoint_set = [null_value_person] * 36
-            else:
-                keypoint_set = []
-                for keypoint in person_keypoints:
-                    x = keypoint.get("x")
-                    y = keypoint.get("y")
-                    if x is None:
-                        x = null_value_kps
-
-                    if y is None:
-                        y = null_value_kps
-
-                    keypoint_set.extend([x, y])
-        keypoint_sequences.append(keypoint_set)
+# gets the normalized keypoints and return a (frames, 36) float32 array of the body keypoints (x0, y0, x1, y1 .... x17, y17) per frame
+# missing keypoints are null_value_kps, frames without the person are null_value_person
+def _get_normalized(normalized_keypoints, present, person_id, null_value_kps = 999, null_value_person = 0):
+    num_frames = len(normalized_keypoints)
+    if person_id < normalized_keypoints.shape[1]:
+        keypoints = normalized_keypoints[:, person_id].reshape(num_frames, 36)
+        person_present = present[:, person_id]
+    else:
+        keypoints = np.full((num_frames, 36), np.nan)
+        person_present = np.zeros(num_frames, dtype=bool)
+
+    keypoint_sequences = keypoints.astype(np.float32)
+    keypoint_sequences[np.isnan(keypoints)] = null_value_kps
+    keypoint_sequences[~person_present] = null_value_person
     return keypoint_sequences
 
-# takes a keypoints_sequence and save it into a text file
+# takes a keypoints_sequence and save it into a .npy file in one write
 def _save_keypoints(keypoints_sequence, person_id, folder_path):
     # File Path
-    file_path = f'{folder_path}keypoints_seq.txt'
+    file_path = f'{folder_path}keypoints_seq.npy'
 
     # Check Directory
     if not os.path.exists(folder_path):
         os.makedirs(folder_path)
 
-    with open(file_path, "w") as text_file:
-        for i in range(len(keypoints_sequence)):
-            for j in range(36):
-                text_file.write('{}'.format(keypoints_sequence[i][j]))
-                if j < 35:
-                    text_file.write(',')
-            text_file.write('\n')
+    np.save(file_path, np.ascontiguousarray(keypoints_sequence, dtype=np.float32))
 
     # Print Log
     print(f'Keypoints sequence stored in: {file_path}')
@@ -0,0 +1,81 @@
+import queue
+import threading
+import time
+
+# Building blocks of the staged frame pipeline of data_creator:
+#   decode stage -> pose stage -> tracking (caller thread, in frame order) -> writer
+# Stages run in background threads and are connected by bounded queues, so a slow stage
+# blocks the ones before it instead of buffering the whole video in memory.
+
+_DONE = object()
+
+class _Error(object):
+    def __init__(self, exception):
+        self.exception = exception
+
+# runs function on every item of items in a background thread
+# iterate over the stage to get the results in order, at most maxsize results are buffered
+# busy_time: seconds spent in function (not waiting for items or for free queue space)
+class Stage(threading.Thread):
+    def __init__(self, function, items, maxsize):
+        super(Stage, self).__init__(daemon=True)
+        self.function = function
+        self.items = items
+        self.results = queue.Queue(maxsize)
+        self.busy_time = 0
+        self.start()
+
+    def run(self):
+        try:
+            for item in self.items:
+                start = time.perf_counter()
+                result = self.function(item)
+                self.busy_time += time.perf_counter() - start
+                self.results.put(result)
+            self.results.put(_DONE)
+        except BaseException as e:
+            self.results.put(_Error(e))
+
+    def __iter__(self):
+        while True:
+            result = self.results.get()
+            if result is _DONE:
+                return
+            if isinstance(result, _Error):
+                raise result.exception
+            yield result
+
+# runs submitted file writes in a background thread, submit blocks when maxsize writes are pending
+# close() waits for the pending writes and raises the first error of a write
+class AsyncWriter(object):
+    def __init__(self, maxsize=64):
+        self.writes = queue.Queue(maxsize)
+        self.busy_time = 0
+        self.error = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def _run(self):
+        while True:
+            write = self.writes.get()
+            if write is _DONE:
+                return
+            function, args = write
+            start = time.perf_counter()
+            try:
+                function(*args)
+            except BaseException as e:
+                if self.error is None:
+                    self.error = e
+            self.busy_time += time.perf_counter() - start
+
+    def submit(self, function, *args):
+        if self.error is not None:
+            raise self.error
+        self.writes.put((function, args))
+
+    def close(self):
+        self.writes.put(_DONE)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
@@ -0,0 +1,58 @@
+import hashlib
+import json
+import os
+import numpy as np
+
+# On-disk cache of the body estimation results (candidate, subset) of frames.
+# A result is stored as pose_cache/<first 2 key chars>/<key>.npz where the key hashes
+#   -the content of the frame (hash of the image file + resize target, or of the pixels),
+#   -the body model weights,
+#   -the Body settings (scales, thresholds, number of stages, quantization, ...)
+# so changing any of them misses the cache instead of returning stale poses.
+
+# sha1 of a file
+def file_hash(path):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+# sha1 of the pixels and shape of an image
+def array_hash(array):
+    sha1 = hashlib.sha1(np.ascontiguousarray(array).data)
+    sha1.update(str(array.shape).encode())
+    return sha1.hexdigest()
+
+class PoseCache(object):
+    def __init__(self, cache_folder, model_path):
+        self.cache_folder = cache_folder
+        self.model_hash = file_hash(model_path)
+        self.hits = 0
+        self.misses = 0
+
+    # cache key of a frame content key under the given settings
+    def key(self, content_key, settings):
+        return hashlib.sha1(json.dumps([content_key, self.model_hash, settings], sort_keys=True).encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_folder, key[:2], key + '.npz')
+
+    # (candidate, subset) or None if the key is not cached
+    def get(self, key):
+        path = self._path(key)
+        if not os.path.isfile(path):
+            self.misses += 1
+            return None
+        with np.load(path) as cached:
+            self.hits += 1
+            return cached['candidate'], cached['subset']
+
+    def put(self, key, candidate, subset):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # write to a temporary file first so an interrupted run never leaves a truncated entry
+        temp_path = path + '.' + str(os.getpid()) + '.tmp'
+        with open(temp_path, 'wb') as f:
+            np.savez(f, candidate=candidate, subset=subset)
+        os.replace(temp_path, path)
@@ -0,0 +1,74 @@
+import os
+import cv2
+import numpy as np
+import torch
+from torch.utils.data.dataloader import default_collate
+from src.modules import binarypose
+
+# Bit-packed binary pose store of a person, in its binary_pose folder next to the pose_N.png images:
+#   poses_packed.npy:  (frames, 512, 64) uint8, the 0/1 pixels of every pose image packed along x (np.packbits)
+#   poses_present.npy: (frames,) bool, frames that have a pose image
+# A frame is 32 KB instead of 1 MB as a float tensor. The datasets keep the packed frames and expand them
+# to float either per sample or, with packed_poses=True, per batch in collate_packed_poses.
+
+packed_file = 'poses_packed.npy'
+present_file = 'poses_present.npy'
+
+def save_poses(pose_folder, packed, present):
+    if not os.path.exists(pose_folder):
+        os.makedirs(pose_folder)
+    np.save(os.path.join(pose_folder, packed_file), np.ascontiguousarray(packed, dtype=np.uint8))
+    np.save(os.path.join(pose_folder, present_file), np.asarray(present, dtype=bool))
+
+# (packed, present) arrays of the store of a pose folder, memory-mapped read only, (None, None) without a store
+def load_poses(pose_folder):
+    packed_path = os.path.join(pose_folder, packed_file)
+    present_path = os.path.join(pose_folder, present_file)
+    if not os.path.isfile(packed_path) or not os.path.isfile(present_path):
+        return None, None
+    return np.load(packed_path, mmap_mode='r'), np.load(present_path, mmap_mode='r')
+
+# (512, 64) packed pixels of a pose image file
+def pack_pose_image(pose_path):
+    image = cv2.imread(pose_path, cv2.IMREAD_GRAYSCALE)
+    return np.packbits(image > 0, axis=-1)
+
+# write the store of a pose folder from its pose_N.png images, returns the number of frames
+def convert_pose_images(pose_folder):
+    frame_nums = [int(name[len('pose_'):-len('.png')]) for name in os.listdir(pose_folder)
+                  if name.startswith('pose_') and name.endswith('.png') and name[len('pose_'):-len('.png')].isdigit()]
+    num_frames = max(frame_nums) + 1 if frame_nums else 0
+    packed = np.zeros((num_frames, binarypose.image_width, binarypose.image_width // 8), dtype=np.uint8)
+    present = np.zeros(num_frames, dtype=bool)
+    for frame_num in frame_nums:
+        packed[frame_num] = pack_pose_image(os.path.join(pose_folder, f'pose_{frame_num}.png'))
+        present[frame_num] = True
+    save_poses(pose_folder, packed, present)
+    return num_frames
+
+# float tensor (..., 1, 512, 512) of 0 / 1 pixels of packed poses (..., 512, 64)
+def unpack_poses(packed):
+    if not torch.is_tensor(packed):
+        packed = torch.from_numpy(np.array(packed, dtype=np.uint8))
+    bits = torch.tensor([128, 64, 32, 16, 8, 4, 2, 1], dtype=torch.uint8)
+    pixels = (packed.unsqueeze(-1) & bits) != 0
+    return pixels.reshape(*packed.shape[:-2], 1, packed.shape[-2], packed.shape[-1] * 8).float()
+
+# collate_fn of the DataLoaders of datasets created with packed_poses=True: the poses (third item of the
+# samples) are batched packed and expanded to the (batch, 1, 512, 512) float tensor of the models
+def collate_packed_poses(batch):
+    data_name, gun_data, pose_data, motion_data, label = default_collate(batch)
+    return data_name, gun_data, unpack_poses(pose_data), motion_data, label
+
+# packed pose frames of one person, from its store (memory-mapped) or, for data created before the store,
+# from its pose_N.png images
+class PersonPoses(object):
+    def __init__(self, pose_folder):
+        self.pose_folder = pose_folder
+        self.packed, self.present = load_poses(pose_folder)
+
+    # (512, 64) uint8 tensor of the packed pose of a frame
+    def get(self, frame_num):
+        if self.packed is not None and frame_num < len(self.packed) and self.present[frame_num]:
+            return torch.from_numpy(np.array(self.packed[frame_num]))
+        return torch.from_numpy(pack_pose_image(os.path.join(self.pose_folder, f'pose_{frame_num}.png')))
@@ -0,0 +1,135 @@
+import copy
+import glob
+import os
+import re
+import cv2
+import torch
+import torch.nn as nn
+from torchvision import transforms
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+import numpy as np
+import random
+
+# Set a random seed for reproducibility
+torch.manual_seed(12)
+torch.cuda.manual_seed(12)
+np.random.seed(12)
+random.seed(12)
+os.environ['PYTHONHASHSEED'] = str(12)
+torch.cuda.manual_seed_all(12)
+torch.backends.cudnn.benchmark = False
+torch.backends.cudnn.enabled = False
+
+torch.backends.cudnn.deterministic=True
+
+# INT8 versions of the models for CPU inference.
+# The convolutional models (Body, Hand, darknet53 feature model, poseCNN) are statically quantized
+# with observers calibrated on frames of raw_dataset, the LSTMs and linear layers of the trained
+# GPM1 / GPM2 models are dynamically quantized (weights INT8, activations quantized on the fly).
+# Quantized models run on the CPU only. Use them through the registry, e.g.
+#   body_estimation = model_registry.get_body('model/body_pose_model.pth', quantized=True)
+
+backend = 'x86' if 'x86' in torch.backends.quantized.supported_engines else 'qnnpack'
+torch.backends.quantized.engine = backend
+
+def natural_sort_key(s):
+    return [int(text) if text.isdigit() else text.lower() for text in re.split('([0-9]+)', s)]
+
+# num_frames frames spread over all videos of the dataset, resized to 512x512 like in data_creator
+def calibration_frames(dataset_folder='raw_dataset/dataset/', num_frames=32):
+    image_paths = []
+    for video in sorted(os.listdir(dataset_folder), key=natural_sort_key):
+        video_folder = os.path.join(dataset_folder, video)
+        image_files = sorted([f for f in os.listdir(video_folder) if f.endswith('.jpg')], key=natural_sort_key)
+        image_paths += [os.path.join(video_folder, f) for f in image_files]
+    if len(image_paths) == 0:
+        raise FileNotFoundError(f"No calibration frames found in {dataset_folder}")
+
+    step = max(len(image_paths) // num_frames, 1)
+    return [cv2.resize(cv2.imread(path), (512, 512)) for path in image_paths[::step][:num_frames]]
+
+# 224x224 RGB tensors of the darknet53 feature model input, cut from the frame quadrants
+def calibration_hand_images(frames):
+    preprocess = transforms.Compose([ transforms.ToTensor() ])
+    images = []
+    for frame in frames:
+        frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+        height, width = frame.shape[:2]
+        for y in (0, height // 2):
+            for x in (0, width // 2):
+                quadrant = frame[y:y + height // 2, x:x + width // 2]
+                images.append(preprocess(cv2.resize(quadrant, (224, 224))).unsqueeze(0))
+    return images
+
+# binary pose tensors of the poseCNN input, generated from the raw_dataset frames by data_creator
+def calibration_pose_images(data_folder='data/', num_images=64):
+    pose_paths = sorted(glob.glob(os.path.join(data_folder, '*', 'person_*', 'binary_pose', '*.png')))
+    step = max(len(pose_paths) // num_images, 1)
+    preprocess = transforms.Compose([ transforms.ToTensor() ])
+    return [preprocess(cv2.imread(path, cv2.IMREAD_GRAYSCALE)).unsqueeze(0) for path in pose_paths[::step][:num_images]]
+
+def _prepare(model, example_input):
+    return prepare_fx(copy.deepcopy(model).cpu().eval(), get_default_qconfig_mapping(backend), (example_input,))
+
+# static INT8 copy of a convolutional model, observers are calibrated on calibration_inputs
+def quantize_static(model, calibration_inputs):
+    prepared = _prepare(model, calibration_inputs[0])
+    with torch.no_grad():
+        for calibration_input in calibration_inputs:
+            prepared(calibration_input)
+    return convert_fx(prepared)
+
+# bodypose_model with a fixed number of stages (FX can not trace the num_stages argument)
+class _FixedStages(nn.Module):
+    def __init__(self, model, num_stages):
+        super(_FixedStages, self).__init__()
+        self.model = model
+        self.num_stages = num_stages
+
+    def forward(self, x):
+        return self.model(x, self.num_stages)
+
+# quantized bodypose_model, called by Body like the float model
+class QuantizedBodyposeModel(nn.Module):
+    def __init__(self, model, num_stages):
+        super(QuantizedBodyposeModel, self).__init__()
+        self.model = model
+        self.num_stages = num_stages
+
+    def forward(self, x, num_stages=6):
+        if num_stages != self.num_stages:
+            raise ValueError(f"Model was quantized for {self.num_stages} stages, got {num_stages}")
+        return self.model(x)
+
+# replace the model of a Body by a static INT8 version calibrated on frames
+# the Body itself runs the calibration so the observers see its real preprocessing
+def quantize_body(body, frames):
+    prepared = _prepare(_FixedStages(body.model, body.num_stages), torch.zeros(1, 3, 368, 368))
+    body.model = QuantizedBodyposeModel(prepared, body.num_stages)
+    # calibrate without the pose cache, cached frames would skip the model
+    cache, body.cache = body.cache, None
+    for frame in frames:
+        body(frame)
+    body.cache = cache
+    body.model = QuantizedBodyposeModel(convert_fx(prepared), body.num_stages)
+    body.quantized = True
+    return body
+
+# replace the model of a Hand by a static INT8 version calibrated on frames
+def quantize_hand(hand, frames):
+    prepared = _prepare(hand.model, torch.zeros(1, 3, 368, 368))
+    hand.model = prepared
+    for frame in frames:
+        hand(frame)
+    hand.model = convert_fx(prepared)
+    return hand
+
+# INT8 copy of a trained GPM1 / GPM2 / GP model
+# LSTMs and linear layers are dynamically quantized, the poseCNN convolutions are statically
+# quantized when calibration binary poses are given and stay float otherwise
+def quantize_trained_model(trained_model, pose_images=None):
+    trained_model = copy.deepcopy(trained_model).cpu().eval()
+    if pose_images:
+        trained_model.pose_model = quantize_static(trained_model.pose_model, pose_images)
+    return quantize_dynamic(trained_model, {nn.LSTM, nn.Linear}, dtype=torch.qint8)
@@ -0,0 +1,147 @@
+import json
+import os
+import numpy as np
+from src.modules import label_index, feature_store
+
+# Index of the samples of a data root (data/<video>/person_N/...) shared by the datasets:
+# for every video the (frames, persons) labels and, for every person with all data folders,
+# which frames have a hand image (hands_N.png), a hand feature (hands_N.pt or the feature store of the video,
+# see feature_store) and a binary pose (pose_N.png).
+# The index is saved in <data root>/sample_index.npz and reused while a video is unchanged: every video
+# keeps a signature of the modification times of its folders, labels file and feature store (files created or deleted
+# in a folder change its modification time), a changed signature or index_version rebuilds the video.
+
+index_version = 2
+index_file = 'sample_index.npz'
+
+person_folders = ["hand_image", "binary_pose", "motion_keypoints"]
+
+class VideoIndex(object):
+    def __init__(self, signature, labels, person_ids, hand_png, hand_pt, pose_png):
+        self.signature = signature
+        self.labels = labels # (frames, persons) int8, see label_index
+        # (persons with all data folders, frames) bool masks, row i is person person_ids[i]
+        self.person_ids = person_ids
+        self.hand_png = hand_png
+        self.hand_pt = hand_pt # hands_N.pt file or feature in the feature store
+        self.pose_png = pose_png
+
+    @property
+    def num_frames(self):
+        return self.labels.shape[0]
+
+    @property
+    def num_persons(self):
+        return self.labels.shape[1]
+
+    # row of a person in the masks, None if the person misses a data folder
+    def person_row(self, person_id):
+        rows = np.nonzero(self.person_ids == person_id)[0]
+        return int(rows[0]) if len(rows) > 0 else None
+
+# (frames, window_size) mask of the frames of the window ending at every frame, oldest frame first,
+# False for the frames before the first frame
+def window_mask(mask, window_size):
+    padded = np.concatenate([np.zeros(window_size - 1, dtype=bool), mask])
+    return np.lib.stride_tricks.sliding_window_view(padded, window_size)
+
+# modification times of the folders, labels file and feature store presence of a video
+def video_signature(video_dir):
+    csv_file = os.path.join(video_dir, "video_labels.csv")
+    csv_stat = os.stat(csv_file)
+    signature = {'': os.stat(video_dir).st_mtime_ns, 'video_labels.csv': [csv_stat.st_mtime_ns, csv_stat.st_size]}
+    present_file = os.path.join(video_dir, feature_store.present_file)
+    if os.path.isfile(present_file):
+        signature[feature_store.present_file] = os.stat(present_file).st_mtime_ns
+    for name in os.listdir(video_dir):
+        if name.startswith('person_') and os.path.isdir(os.path.join(video_dir, name)):
+            signature[name] = os.stat(os.path.join(video_dir, name)).st_mtime_ns
+            for folder in person_folders:
+                folder_path = os.path.join(video_dir, name, folder)
+                if os.path.isdir(folder_path):
+                    signature[name + '/' + folder] = os.stat(folder_path).st_mtime_ns
+    return json.dumps(signature, sort_keys=True)
+
+# frames of a folder that have the file prefix + frame_num + extension
+def _frames_mask(folder_path, prefix, extension, num_frames):
+    mask = np.zeros(num_frames, dtype=bool)
+    for name in os.listdir(folder_path):
+        if name.startswith(prefix) and name.endswith(extension):
+            frame = name[len(prefix):-len(extension)]
+            if frame.isdigit() and int(frame) < num_frames:
+                mask[int(frame)] = True
+    return mask
+
+def build_video_index(data_folder, video_name, signature):
+    video_dir = os.path.join(data_folder, str(video_name))
+    labels = label_index.load_video_labels(data_folder, video_name)
+    num_frames, num_persons = labels.shape
+    store_features, store_present = feature_store.load_store(video_dir)
+    person_ids, hand_png, hand_pt, pose_png = [], [], [], []
+    for person_id in range(num_persons):
+        person_folder_path = os.path.join(video_dir, 'person_' + str(person_id))
+        hand_folder_path, pose_folder_path, motion_folder_path = [os.path.join(person_folder_path, folder) for folder in person_folders]
+        if not os.path.exists(hand_folder_path) or not os.path.exists(pose_folder_path) or not os.path.exists(motion_folder_path):
+            continue
+        person_ids.append(person_id)
+        hand_png.append(_frames_mask(hand_folder_path, 'hands_', '.png', num_frames))
+        # hand feature tensor file or feature in the store
+        hand_feature = _frames_mask(hand_folder_path, 'hands_', '.pt', num_frames)
+        if store_present is not None and person_id < len(store_present):
+            stored_frames = min(num_frames, store_present.shape[1])
+            hand_feature[:stored_frames] |= store_present[person_id, :stored_frames]
+        hand_pt.append(hand_feature)
+        pose_png.append(_frames_mask(pose_folder_path, 'pose_', '.png', num_frames))
+    masks = [np.array(mask, dtype=bool).reshape(len(person_ids), num_frames) for mask in (hand_png, hand_pt, pose_png)]
+    return VideoIndex(signature, np.array(labels), np.array(person_ids, dtype=np.int64), *masks)
+
+def _read_index_file(file_path):
+    videos = {}
+    try:
+        with np.load(file_path, allow_pickle=False) as data:
+            if int(data['version']) != index_version:
+                return videos
+            for i, (video_name, signature) in enumerate(zip(data['videos'].tolist(), data['signatures'].tolist())):
+                arrays = [data[f'{key}_{i}'] for key in ('labels', 'person_ids', 'hand_png', 'hand_pt', 'pose_png')]
+                videos[video_name] = VideoIndex(signature, *arrays)
+    except (OSError, KeyError, ValueError):
+        # missing or unreadable index, rebuilt
+        return {}
+    return videos
+
+def _write_index_file(file_path, videos):
+    arrays = {'version': np.array(index_version),
+              'videos': np.array(list(videos.keys()), dtype=str),
+              'signatures': np.array([video.signature for video in videos.values()], dtype=str)}
+    for i, video in enumerate(videos.values()):
+        arrays.update({f'labels_{i}': video.labels, f'person_ids_{i}': video.person_ids,
+                       f'hand_png_{i}': video.hand_png, f'hand_pt_{i}': video.hand_pt, f'pose_png_{i}': video.pose_png})
+    # written next to the index and renamed, so a reader never sees a partial file
+    temp_path = f'{file_path}.{os.getpid()}.tmp.npz'
+    np.savez(temp_path, **arrays)
+    os.replace(temp_path, file_path)
+
+# {video name: VideoIndex} of the videos of the data folder that exist,
+# from the saved index for the unchanged videos, the index is saved again if a video was (re)built
+def load_index(data_folder, video_names, showLog=False):
+    file_path = os.path.join(data_folder, index_file)
+    saved = _read_index_file(file_path)
+    index = {}
+    rebuilt = False
+    for video_name in video_names:
+        video_name = str(video_name)
+        video_dir = os.path.join(data_folder, video_name)
+        if not os.path.exists(video_dir):
+            continue
+        signature = video_signature(video_dir)
+        if video_name in saved and saved[video_name].signature == signature:
+            index[video_name] = saved[video_name]
+        else:
+            if showLog:
+                print(f"Indexing samples of video {video_name}")
+            index[video_name] = build_video_index(data_folder, video_name, signature)
+            saved[video_name] = index[video_name]
+            rebuilt = True
+    if rebuilt:
+        _write_index_file(file_path, saved)
+    return index
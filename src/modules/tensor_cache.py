@@ -0,0 +1,55 @@
+import collections
+import threading
+from torch.utils.data import Subset
+
+# Size-bounded LRU cache of the tensors loaded by the lazy datasets (custom_dataset_lazy, custom_dataset_gunLSTM_lazy).
+# The least recently used tensors are dropped when the cached tensors exceed max_mb.
+# hits / misses count the lookups since the last reset_stats (reported per epoch by train_model).
+# With DataLoader workers every worker process has its own copy of the cache (and statistics).
+class TensorCache(object):
+    def __init__(self, max_mb=1024):
+        self.max_bytes = int(max_mb * 2**20)
+        self.tensors = collections.OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    # tensor of key, loaded with load() if it is not cached
+    def get(self, key, load):
+        with self.lock:
+            tensor = self.tensors.get(key)
+            if tensor is not None:
+                self.tensors.move_to_end(key)
+                self.hits += 1
+                return tensor
+            self.misses += 1
+
+        tensor = load()
+        size = tensor.nelement() * tensor.element_size()
+        with self.lock:
+            if size <= self.max_bytes and key not in self.tensors:
+                self.tensors[key] = tensor
+                self.nbytes += size
+                while self.nbytes > self.max_bytes:
+                    _, dropped = self.tensors.popitem(last=False)
+                    self.nbytes -= dropped.nelement() * dropped.element_size()
+        return tensor
+
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups > 0 else 0.0
+
+    def stats(self):
+        return "Cache Hit Rate: {:.2%} ({} hits, {} misses), Cached: {} tensors, {:.1f}/{:.0f} MB".format(
+            self.hit_rate(), self.hits, self.misses, len(self.tensors), self.nbytes / 2**20, self.max_bytes / 2**20)
+
+    def reset_stats(self):
+        self.hits = 0
+        self.misses = 0
+
+# tensor cache of a dataset (or of the dataset of a Subset), None if the dataset has none
+def dataset_cache(dataset):
+    while isinstance(dataset, Subset):
+        dataset = dataset.dataset
+    return getattr(dataset, 'cache', None)
@@ -0,0 +1,96 @@
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+import torch
+import random, os
+
+# Set a random seed for reproducibility
+torch.manual_seed(12)
+torch.cuda.manual_seed(12)
+np.random.seed(12)
+random.seed(12)
+os.environ['PYTHONHASHSEED'] = str(12)
+torch.cuda.manual_seed_all(12)
+torch.backends.cudnn.benchmark = False
+torch.backends.cudnn.enabled = False
+
+torch.backends.cudnn.deterministic=True
+
+# average distance of the common keypoints of every (a, b) pair, inf if a pair has no common keypoint
+# a: (n, 18, 2), b: (m, 18, 2), returns (n, m)
+def distance_matrix(a, b):
+    distance = np.linalg.norm(a[:, None] - b[None, :], axis=3)
+    common = ~np.isnan(distance)
+    num_common = common.sum(axis=2)
+    sum_distance = np.where(common, distance, 0).sum(axis=2)
+    return np.where(num_common > 0, sum_distance / np.maximum(num_common, 1), np.inf)
+
+# Multi-person tracker keeping the person ids of a video stable across frames.
+# Every frame the detected persons are assigned to the tracks with the smallest total keypoint
+# distance (Hungarian assignment). Tracks are matched at their constant-velocity predicted position,
+# a track that is not matched keeps its id for max_age frames and is retired afterwards.
+#   tracker = PersonTracker()
+#   arranged_persons = tracker.update(persons) # (num_tracks, 18, 3) keypoints indexed by track id, NaN if not seen
+class PersonTracker(object):
+    # max_distance: pixels, detections further away from every track start a new track
+    # max_age: frames a track is kept without being matched
+    def __init__(self, max_distance=80, max_age=15):
+        self.max_distance = max_distance
+        self.max_age = max_age
+        # state of every track ever created, indexed by track id
+        self.positions = np.zeros((0, 18, 2)) # last matched keypoints
+        self.velocities = np.zeros((0, 2)) # pixels per frame of the matched keypoints
+        self.ages = np.zeros(0, dtype=int) # frames since the track was last matched
+        self.retired = np.zeros(0, dtype=bool)
+        self.track_ids = np.zeros(0, dtype=int)
+
+    @property
+    def num_tracks(self):
+        return len(self.positions)
+
+    # keypoints of the active tracks predicted for the next frame
+    def predict(self):
+        return self.positions + (self.velocities * (self.ages + 1)[:, None])[:, None, :]
+
+    # assign the persons ((N, 18, 3) keypoints array, see bodykeypoints) of a frame to tracks
+    # returns the (num_tracks, 18, 3) keypoints indexed by track id, NaN for the tracks without a person in this frame
+    # track_ids: track id of every person of the last update
+    def update(self, persons):
+        detections = persons[:, :, 0:2].astype(np.float64)
+        active = np.nonzero(~self.retired)[0]
+        track_of_detection = np.full(len(persons), -1)
+
+        if len(active) > 0 and len(persons) > 0:
+            distance = distance_matrix(self.predict()[active], detections)
+            gated = np.where(distance <= self.max_distance, distance, np.inf)
+            # the assignment needs finite costs, impossible pairs get a cost above any possible assignment
+            cost = np.where(np.isfinite(gated), gated, self.max_distance * (len(active) + len(persons) + 1))
+            rows, cols = linear_sum_assignment(cost)
+            matched = np.isfinite(gated[rows, cols])
+            track_of_detection[cols[matched]] = active[rows[matched]]
+
+        matched_tracks = track_of_detection[track_of_detection >= 0]
+        for detection_id in np.nonzero(track_of_detection >= 0)[0]:
+            track_id = track_of_detection[detection_id]
+            # velocity from the keypoints seen in both, spread over the frames since the last match
+            displacement = detections[detection_id] - self.positions[track_id]
+            if np.any(~np.isnan(displacement[:, 0])):
+                self.velocities[track_id] = np.nanmean(displacement, axis=0) / (self.ages[track_id] + 1)
+            # keep the last known position of keypoints missing in this detection
+            self.positions[track_id] = np.where(np.isnan(detections[detection_id]), self.positions[track_id], detections[detection_id])
+
+        self.ages[~self.retired] += 1
+        self.ages[matched_tracks] = 0
+        self.retired |= self.ages > self.max_age
+
+        # new tracks for the unmatched detections
+        new_detections = np.nonzero(track_of_detection < 0)[0]
+        track_of_detection[new_detections] = np.arange(self.num_tracks, self.num_tracks + len(new_detections))
+        self.positions = np.concatenate([self.positions, detections[new_detections]])
+        self.velocities = np.concatenate([self.velocities, np.zeros((len(new_detections), 2))])
+        self.ages = np.concatenate([self.ages, np.zeros(len(new_detections), dtype=int)])
+        self.retired = np.concatenate([self.retired, np.zeros(len(new_detections), dtype=bool)])
+
+        self.track_ids = track_of_detection
+        arranged_persons = np.full((self.num_tracks, 18, 3), np.nan, dtype=np.float32)
+        arranged_persons[track_of_detection] = persons
+        return arranged_persons
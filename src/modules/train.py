@@ -11,6 +11,7 @@ import numpy as np
 import random
 import matplotlib.pyplot as plt
 import itertools
+from src.modules import tensor_cache
 
 # Set a random seed for reproducibility
 torch.manual_seed(12)
@@ -204,6 +205,11 @@ def train_model(user_input,
         output =  "Epoch [{}/{}], Training Accuracy: {:.2f}%, Training Loss: {:.4f}, Validation Accuracy: {:.2f}%, Validation Loss: {:.4f}, Time: {:.2f} seconds\n".format(epoch + 1, num_epochs, train_accuracy, average_train_loss, val_accuracy, average_val_loss, epoch_time)
         output += "Training Precision: {:.4f}, Training Recall: {:.4f}, Training F1 Score: {:.4f}\n".format(train_precision, train_recall, train_f1_score)
         output += "Validation Precision: {:.4f}, Validation Recall: {:.4f}, Validation F1 Score: {:.4f}\n".format(val_precision, val_recall, val_f1_score)
+        # lazy datasets: hit rate of the tensor cache in this epoch
+        cache = tensor_cache.dataset_cache(train_loader.dataset)
+        if cache is not None:
+            output += cache.stats() + "\n"
+            cache.reset_stats()
         print(output + '\n', end='\r')
 
         outputs.append(output) # collect outputs
@@ -16,13 +16,13 @@ data_folder = f'./data/'
 
 # File names of data:
 #   -gun: hands_[frame_num].png
-#   -pose: pose_[frame_num].png
-#   -motion: keypoints_seq.txt
+#   -pose: pose_[frame_num].png, poses_packed.npy + poses_present.npy (bit-packed store)
+#   -motion: keypoints_seq.npy
 
 # create:
 #   -hand region images (gun), 
 #   -binary pose image (pose), 
-#   -preprocessed keypoints text file (motion)
+#   -preprocessed keypoints sequence file (motion)
 display_animation = True
 # Path of output video folder
 output_folder = data_folder + video_name + "/"
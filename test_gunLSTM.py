@@ -29,7 +29,7 @@ print("Dataset number of samples: ", len(custom_dataset))
 for idx, data_entry in enumerate(custom_dataset.data):
     print(f"Data Entry {idx + 1}:")
     print("Data Name:", data_entry["data_name"])
-    print("Gun Data Shape:", data_entry["gun_data"].shape)
+    print("Gun Data Shape:", custom_dataset.get_gun_data(idx).shape)
     print("Pose Data Shape:", data_entry["pose_data"].shape)
     print("Label:", data_entry["label"])
 
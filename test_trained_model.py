@@ -3,6 +3,7 @@ from src.modules import motion_analysis
 from src.modules.posecnn import poseCNN
 from src.modules.gun_yolo import CustomDarknet53, GunLSTM, GunLSTM_Optimized, Gun_Optimized
 from src.modules.combined_model import GPM1, GPM2
+from src.modules import model_registry
 from src.modules.custom_dataset import CustomGunDataset
 from src.modules.custom_dataset_gunLSTM import CustomGunLSTMDataset
 from src.modules.custom_dataset_gunLSTM_opt import CustomGunLSTMDataset_opt
@@ -10,7 +11,6 @@ from src.modules.custom_dataset_opt import CustomGunDataset_opt
 from sklearn.metrics import accuracy_score, precision_score, recall_score, f1_score, confusion_matrix
 from torch.utils.data import DataLoader, Subset
 from sklearn.model_selection import KFold
-from holocron.models import darknet53
 from time import sleep
 import matplotlib.pyplot as plt
 import numpy as np
@@ -79,45 +79,9 @@ folds = 5
 kf = KFold(n_splits=folds, random_state=42, shuffle=True)
 for fold_num, (_, val_indices) in enumerate(kf.split(custom_dataset)):
 
-    # Reload model per fold
+    # Load model of the fold, the darknet53 backbone is loaded once and copied
     checkpoint_path = f'{root_folder}/fold{fold_num+1}/model/model_epoch_59.pt' # do not change
-    checkpoint = torch.load(checkpoint_path)
-
-    # Load Model and Data Based on Model Type
-    darknet_model = darknet53(pretrained=True)
-    pose_model = poseCNN()
-
-    # LOAD MODEL
-    if model_type == 'GPM':
-        gun_model = CustomDarknet53(darknet_model)
-        motion_model = motion_analysis.MotionLSTM(hidden_size, lstm_layers)
-        combined_feature_size = 20 + 20 + hidden_size #total num of features of 3 model outputs
-        trained_model = GPM1(gun_model, pose_model, motion_model, combined_feature_size)
-    elif model_type == 'GPM2':
-        gun_model = GunLSTM(darknet_model, hidden_size=hidden_size)
-        combined_feature_size = 20 + hidden_size #total num of features of 3 model outputs
-        trained_model = GPM2(gun_model, pose_model, combined_feature_size)
-    elif model_type == 'GP':
-        gun_model = CustomDarknet53(darknet_model)
-        combined_feature_size = 20 + 20 #total num of features of 3 model outputs
-        trained_model = GP(gun_model, pose_model, combined_feature_size)
-    elif model_type == 'GPM-opt':
-        gun_model = Gun_Optimized()
-        motion_model = motion_analysis.MotionLSTM(hidden_size, lstm_layers)
-        combined_feature_size = 20 + 20 + hidden_size #total num of features of 3 model outputs
-        trained_model = GPM1(gun_model, pose_model, motion_model, combined_feature_size)
-    elif model_type == 'GPM2-opt':
-        gun_model = GunLSTM_Optimized(hidden_size, lstm_layers)
-        combined_feature_size = 20 + hidden_size #total num of features of 3 model outputs
-        trained_model = GPM2(gun_model, pose_model, combined_feature_size)
-    else:
-        gun_model = Gun_Optimized()
-        combined_feature_size = 20 + 20 #total num of features of 3 model outputs
-        trained_model = GPM2(gun_model, pose_model, combined_feature_size)
-
-    # LOAD WEIGHTS
-    trained_model.load_state_dict(checkpoint['model_state_dict'])
-    trained_model.to(device)
+    trained_model, _ = model_registry.get_trained_model(checkpoint_path, model_type)
 
     # LOAD VALIDATION DATASET
     val_dataset = Subset(dataset=custom_dataset, indices=val_indices)
@@ -168,4 +132,9 @@ for fold_num, (_, val_indices) in enumerate(kf.split(custom_dataset)):
             file.write(item['data_name'] + ':\n')
             file.write(f'  Predicted Label: {item["predicted_label"]}\n')
             file.write(f'  Correct Label: {item["target_label"]}\n\n')
-        print(f'Incorrect Predictions saved to: {incorrect_predictions_path}')
\ No newline at end of file
+        print(f'Incorrect Predictions saved to: {incorrect_predictions_path}')
+
+    # the next fold uses other weights
+    model_registry.release_trained_model(checkpoint_path, model_type)
+
+model_registry.print_load_stats()
\ No newline at end of file
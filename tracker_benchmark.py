@@ -0,0 +1,146 @@
+import time
+import math
+import numpy as np
+from src.modules.tracker import PersonTracker
+
+# Benchmark of the person tracker on crowded synthetic sequences.
+# Persons walk across a 512x512 frame with constant velocity plus jitter (so paths cross),
+# detections are shuffled, dropped for some frames and lose some keypoints.
+# Compares the previous greedy reorder_persons of data_creator with PersonTracker:
+#   ID switches - times a person is given a different id than at its previous detection
+#   ids         - number of person ids created (one per person is ideal)
+#   ms/frame    - tracking time per frame
+
+image_size = 512
+num_frames = 300
+crowd_sizes = [4, 8, 16, 32]
+drop_rate = 0.1 # probability a person is not detected in a frame
+missing_rate = 0.2 # probability a keypoint of a detected person is missing
+noise = 2 # pixels
+
+# joint offsets of a standing person (x, y) relative to the neck, in pixels
+skeleton = np.array([[0, -25], [0, 0], [-20, 0], [-28, 30], [-32, 58], [20, 0], [28, 30], [32, 58],
+                     [-12, 60], [-14, 100], [-15, 140], [12, 60], [14, 100], [15, 140],
+                     [-5, -30], [5, -30], [-10, -27], [10, -27]])
+
+# original distance of data_creator
+def distance_of_persons(p1, p2):
+    kps1 = p1['keypoints']
+    kps2 = p2['keypoints']
+
+    sum_distance = 0
+    match_ctr = 0
+
+    for i in range(18):
+        kp1 = kps1[i]
+        kp2 = kps2[i]
+
+        if kp1['confidence'] > 0 and kp2['confidence'] > 0:
+            distance = math.sqrt((kp2['x'] - kp1['x'])**2 + (kp2['y'] - kp1['y'])**2)
+            sum_distance += distance
+            match_ctr += 1
+    if match_ctr == 0:
+        return float('inf')
+    return sum_distance / match_ctr
+
+# original greedy assignment of data_creator
+def reorder_persons(prev_persons, current_persons):
+    reordered_persons = [None] * len(prev_persons)
+    person_pairs = []
+    for prev_id in range(len(prev_persons)):
+        for current_id in range(len(current_persons)):
+            prev_person = prev_persons[prev_id]
+            current_person = current_persons[current_id]
+            if prev_person is not None and current_person is not None:
+                person_pairs.append((distance_of_persons(prev_person, current_person), prev_id, current_id))
+    person_pairs = sorted(person_pairs, key=lambda x: x[0])
+    for distance, prev_id, current_id in person_pairs:
+        if prev_persons[prev_id] is not None and current_persons[current_id] is not None:
+            reordered_persons[prev_id] = current_persons[current_id]
+            prev_persons[prev_id] = None
+            current_persons[current_id] = None
+    for person in current_persons:
+        if person is not None:
+            reordered_persons.append(person)
+    return reordered_persons
+
+# keypoints dictionary of the original data_creator of one person of a keypoints array
+def keypoints_dictionary(person_id, person):
+    keypoints = {'person_id': person_id, 'keypoints': []}
+    for x, y, confidence in person:
+        if np.isnan(x):
+            keypoints['keypoints'].append({'x': None, 'y': None, 'confidence': -1})
+        else:
+            keypoints['keypoints'].append({'x': int(x), 'y': int(y), 'confidence': float(confidence)})
+    return keypoints
+
+# greedy tracking on keypoints dictionaries, with the track_ids of PersonTracker
+class GreedyTracker(object):
+    def __init__(self):
+        self.prev_persons = None
+        self.track_ids = None
+
+    def update(self, persons):
+        persons = [keypoints_dictionary(person_id, person) for person_id, person in enumerate(persons)]
+        if self.prev_persons is None:
+            arranged_persons = persons
+        else:
+            arranged_persons = reorder_persons(self.prev_persons, list(persons))
+        self.prev_persons = list(arranged_persons)
+        track_of_person = {id(person): track_id for track_id, person in enumerate(arranged_persons) if person is not None}
+        self.track_ids = np.array([track_of_person[id(person)] for person in persons], dtype=int)
+        return arranged_persons
+
+# frames of detected persons, each (true person ids, (persons, 18, 3) keypoints array) in random order
+def create_sequence(rng, num_persons):
+    positions = rng.uniform([40, 40], [image_size - 40, image_size - 180], (num_persons, 2))
+    velocities = rng.uniform(-3, 3, (num_persons, 2))
+    frames = []
+    for frame in range(num_frames):
+        velocities += rng.normal(0, 0.2, velocities.shape)
+        positions += velocities
+        # bounce at the borders
+        outside = (positions < [40, 40]) | (positions > [image_size - 40, image_size - 180])
+        velocities[outside] *= -1
+        positions = np.clip(positions, [40, 40], [image_size - 40, image_size - 180])
+
+        true_ids = []
+        persons = []
+        for person_id in rng.permutation(num_persons):
+            if rng.random() < drop_rate:
+                continue
+            joints = positions[person_id] + skeleton + rng.normal(0, noise, skeleton.shape)
+            person = np.full((18, 3), np.nan, dtype=np.float32)
+            for kp_id, (x, y) in enumerate(joints):
+                if rng.random() >= missing_rate:
+                    person[kp_id] = (int(x), int(y), 0.8)
+            true_ids.append(int(person_id))
+            persons.append(person)
+        frames.append((true_ids, np.array(persons, dtype=np.float32).reshape(-1, 18, 3)))
+    return frames
+
+# (ID switches, number of ids, ms per frame) of a tracker on a sequence
+def evaluate(tracker, frames):
+    last_id = {}
+    id_switches = 0
+    num_ids = 0
+    elapsed = 0
+    for true_ids, persons in frames:
+        start = time.perf_counter()
+        arranged_persons = tracker.update(persons)
+        elapsed += time.perf_counter() - start
+        num_ids = max(num_ids, len(arranged_persons))
+        for true_id, track_id in zip(true_ids, tracker.track_ids):
+            if true_id in last_id and last_id[true_id] != track_id:
+                id_switches += 1
+            last_id[true_id] = track_id
+    return id_switches, num_ids, elapsed * 1000 / len(frames)
+
+rng = np.random.default_rng(12)
+print(f"{num_frames} frames, {drop_rate:.0%} dropped detections, {missing_rate:.0%} missing keypoints")
+print(f"{'persons':>7} {'tracker':>10} {'ID switches':>11} {'ids':>5} {'ms/frame':>9}")
+for num_persons in crowd_sizes:
+    frames = create_sequence(rng, num_persons)
+    for name, tracker in [("greedy", GreedyTracker()), ("hungarian", PersonTracker())]:
+        id_switches, num_ids, ms = evaluate(tracker, frames)
+        print(f"{num_persons:>7} {name:>10} {id_switches:>11} {num_ids:>5} {ms:>9.2f}")